@@ -3,10 +3,13 @@ AIM message handler for the AIM chatbot.
 Handles AIM connection and message processing.
 """
 import asyncio
-import os
-import struct
+import random
+import time
+from collections import deque
 from typing import Dict, Any, Callable, Coroutine, Optional
 from aimpyfly import aim_client
+from aimpyfly.metrics import TimingStats
+from aimpyfly.icbm import TYPING_BEGUN, TYPING_FINISHED
 
 from aimbot.utils.logger import get_logger
 
@@ -16,26 +19,48 @@ class AIMHandler:
     """
     Handler for AIM connection and message processing.
     
+    The AIM client is created once and reused across reconnects, so its
+    message callback, SNAC handlers and rate limiter survive a dropped
+    connection. :meth:`process_incoming_packets` supervises the connection:
+    whenever it is lost it reconnects with capped, jittered exponential
+    backoff, and messages sent in the meantime wait in a bounded buffer.
+    
     Attributes:
         client (aim_client.AIMClient): AIM client
         message_callback (Callable): Callback function for message handling
+        typing_callback (Optional[Callable]): Callback function for typing notifications
+        outbound (deque): Messages waiting for the connection to come back
+        delivery_timeout (float): Longest wait for a server acknowledgement when a caller waits for delivery
+        recovery_times (TimingStats): Seconds from losing the connection to being signed on again
     """
     
-    def __init__(self, credentials: Dict[str, Any], message_callback: Callable[[str, str], Coroutine[Any, Any, None]]):
+    def __init__(self, credentials: Dict[str, Any], message_callback: Callable[[str, str], Coroutine[Any, Any, None]],
+                 outbound_buffer_size: int = 100,
+                 typing_callback: Optional[Callable[[str, int], Coroutine[Any, Any, None]]] = None):
         """
         Initialize the AIM handler.
         
         Args:
             credentials (Dict[str, Any]): AIM credentials (username, password, server, port)
             message_callback (Callable): Callback function for message handling
+            outbound_buffer_size (int): Messages held while reconnecting; the oldest are dropped beyond this
+            typing_callback (Optional[Callable]): Called with (sender, state) for each typing notification
         """
         self.credentials = credentials
         self.message_callback = message_callback
+        self.typing_callback = typing_callback
         self.client = None
         self.connected = False
+        self.stopping = False
         self.reconnect_attempts = 0
-        self.max_reconnect_attempts = 5
-        self.reconnect_delay = 5  # seconds
+        self.max_reconnect_attempts = None  # keep trying until disconnect() is called
+        self.reconnect_delay = 0.5  # seconds, before the first retry
+        self.max_reconnect_delay = 60.0  # seconds
+        self.outbound = deque(maxlen=outbound_buffer_size)
+        self.outbound_dropped = 0
+        self.delivery_timeout = 10.0  # seconds
+        self.disconnects = 0
+        self.recovery_times = TimingStats()
         
         logger.debug(f"Initialized AIM handler for user {credentials['username']}")
     
@@ -50,6 +75,40 @@ class AIMHandler:
         logger.info(f"Received message from {sender}: {message}")
         await self.message_callback(sender, message)
     
+    async def _on_typing(self, sender: str, state: int):
+        """
+        Callback for handling incoming typing notifications.
+        
+        Args:
+            sender (str): Sender's username
+            state (int): Typing state (``aimpyfly.icbm.TYPING_*``)
+        """
+        if self.typing_callback:
+            await self.typing_callback(sender, state)
+    
+    def _create_client(self) -> aim_client.AIMClient:
+        """
+        Create the AIM client and wire up the message callback.
+        
+        Returns:
+            aim_client.AIMClient: The new client
+        """
+        client = aim_client.AIMClient(
+            server=self.credentials['server'],
+            port=self.credentials['port'],
+            username=self.credentials['username'],
+            password=self.credentials['password'],
+            loglevel=logger.level
+        )
+        client.set_message_callback(self._on_message_received)
+        client.set_typing_callback(self._on_typing)
+        return client
+    
+    @property
+    def online(self) -> bool:
+        """True while signed on and the connection is up."""
+        return self.connected and self.client is not None and self.client.state == "online"
+    
     async def connect(self) -> bool:
         """
         Connect to the AIM server.
@@ -57,18 +116,19 @@ class AIMHandler:
         Returns:
             bool: True if connection was successful, False otherwise
         """
+        self.stopping = False
+        return await self._sign_on()
+    
+    async def _sign_on(self) -> bool:
+        """
+        Sign on with the existing client, creating it on first use.
+        
+        Returns:
+            bool: True if sign-on succeeded, False otherwise
+        """
         try:
-            # Initialize the AIM client
-            self.client = aim_client.AIMClient(
-                server=self.credentials['server'],
-                port=self.credentials['port'],
-                username=self.credentials['username'],
-                password=self.credentials['password'],
-                loglevel=logger.level
-            )
-            
-            # Set the message callback
-            self.client.set_message_callback(self._on_message_received)
+            if self.client is None:
+                self.client = self._create_client()
             
             # Connect to the AIM server
             logger.info(f"Connecting to AIM server {self.credentials['server']}:{self.credentials['port']} as {self.credentials['username']}")
@@ -84,15 +144,33 @@ class AIMHandler:
             return False
     
     async def disconnect(self):
-        """Disconnect from the AIM server."""
+        """Disconnect from the AIM server and stop reconnecting."""
+        self.stopping = True
+        self.connected = False
         if self.client:
             try:
-                # AIMPyfly doesn't have a disconnect method, so we'll just set the flag
-                self.connected = False
+                await self.client.close()
                 logger.info("Disconnected from AIM server")
             except Exception as e:
                 logger.error(f"Error disconnecting from AIM server: {str(e)}")
     
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Delay before a reconnect attempt: exponential, capped, with jitter.
+        
+        The jitter spreads the delay over the upper half of the backoff
+        window so that many bots dropped by the same server blip don't all
+        come back at the same instant.
+        
+        Args:
+            attempt (int): Number of attempts already made since the connection was lost
+            
+        Returns:
+            float: Seconds to wait
+        """
+        delay = min(self.max_reconnect_delay, self.reconnect_delay * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+    
     async def send_typing_notification(self, recipient: str, typing_status: bool = True) -> bool:
         """
         Send a typing notification to an AIM user.
@@ -104,36 +182,12 @@ class AIMHandler:
         Returns:
             bool: True if notification was sent successfully, False otherwise
         """
-        if not self.client or not self.connected:
-            logger.error("Cannot send typing notification: Not connected to AIM server")
+        if not self.online:
+            logger.debug("Skipping typing notification: Not connected to AIM server")
             return False
         
         try:
-            # ICBM Cookie (8 random bytes)
-            cookie = os.urandom(8)
-            
-            # Create SNAC data for typing notification
-            # Family 0x0004 (ICBM), Subtype 0x0014 (Typing Notification)
-            typing_value = 0x0002 if typing_status else 0x0000  # 0x0002 = typing, 0x0000 = stopped typing
-            
-            # Create SNAC data
-            snac_data = (
-                cookie +  # ICBM Cookie
-                struct.pack('!H', 0x0001) +  # Channel
-                struct.pack('!B', len(recipient)) +  # Recipient length
-                recipient.encode('utf-8') +  # Recipient
-                struct.pack('!H', typing_value)  # Typing status
-            )
-            
-            # Create SNAC packet
-            snac_packet = self.client.oscar.create_snac(0x0004, 0x0014, 0x0000, self.client.seq_num, snac_data)
-            
-            # Create FLAP packet
-            flap_packet = self.client.oscar.create_flap(0x02, self.client.seq_num, snac_packet)
-            
-            # Send the packet
-            self.client.writer.write(flap_packet)
-            await self.client.writer.drain()
+            await self.client.send_typing(recipient, TYPING_BEGUN if typing_status else TYPING_FINISHED)
             
             logger.debug(f"Sent typing notification to {recipient}: {'typing' if typing_status else 'stopped typing'}")
             return True
@@ -142,59 +196,169 @@ class AIMHandler:
             logger.error(f"Failed to send typing notification to {recipient}: {str(e)}")
             return False
     
-    async def send_message(self, recipient: str, message: str) -> bool:
+    async def send_message(self, recipient: str, message: str, wait_for_delivery: bool = False) -> bool:
         """
         Send a message to an AIM user.
         
+        The message is plain text: it is HTML-escaped on the way out. Sends
+        are paced by the client's send queue against the server's live rate
+        class for IMs.
+        
+        When waiting for delivery, the wait lasts at most ``delivery_timeout``;
+        a message still unacknowledged then counts as sent. A message lost
+        because the connection dropped before its acknowledgement is held
+        for the reconnect, like any message sent while offline.
+        
         Args:
             recipient (str): Recipient's username
             message (str): Message content
+            wait_for_delivery (bool): Wait until the server acknowledges the message (or gives up retrying)
             
         Returns:
-            bool: True if message was sent successfully, False otherwise
+            bool: True if message was sent (or held until reconnected), False otherwise
         """
-        if not self.client or not self.connected:
-            logger.error("Cannot send message: Not connected to AIM server")
-            return False
+        if not self.online:
+            if self.client is None or self.stopping:
+                logger.error("Cannot send message: Not connected to AIM server")
+                return False
+            return self._hold(recipient, message)
         
         try:
             logger.info(f"Sending message to {recipient}")
-            await self.client.send_message(recipient, message)
+            delivery = await self.client.send_message(recipient, message, escape=True)
+            if wait_for_delivery and not await self._wait_for_delivery(recipient, delivery):
+                if not self.online and not self.stopping:
+                    return self._hold(recipient, message)
+                logger.warning(f"Message to {recipient} was not delivered")
+                return False
             logger.debug(f"Message sent to {recipient}: {message}")
             return True
+        except ConnectionError as e:
+            # The connection went down under us; the reconnect will flush it
+            if self.stopping:
+                logger.error(f"Failed to send message to {recipient}: {str(e)}")
+                return False
+            return self._hold(recipient, message)
         except Exception as e:
             logger.error(f"Failed to send message to {recipient}: {str(e)}")
             return False
     
-    async def handle_disconnect(self):
-        """Handle disconnection from the AIM server."""
-        self.connected = False
+    async def _wait_for_delivery(self, recipient: str, delivery: Optional[asyncio.Future]) -> bool:
+        """
+        Wait a bounded time for a sent message's acknowledgement.
         
-        if self.reconnect_attempts < self.max_reconnect_attempts:
-            self.reconnect_attempts += 1
-            reconnect_delay = self.reconnect_delay * self.reconnect_attempts
+        Args:
+            recipient (str): Recipient's username
+            delivery (Optional[asyncio.Future]): The client's delivery future, None if the send failed
             
-            logger.warning(f"Disconnected from AIM server. Attempting to reconnect in {reconnect_delay} seconds (attempt {self.reconnect_attempts}/{self.max_reconnect_attempts})")
+        Returns:
+            bool: False if the message failed, True if delivered or still unacknowledged after ``delivery_timeout``
+        """
+        if delivery is None:
+            return False
+        try:
+            # Shielded: the client still settles the IM after we stop waiting
+            return await asyncio.wait_for(asyncio.shield(delivery), self.delivery_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"No acknowledgement for message to {recipient} after {self.delivery_timeout:.0f} s, carrying on")
+            return True
+    
+    def _hold(self, recipient: str, message: str) -> bool:
+        """
+        Keep a message for delivery once the connection is back.
+        
+        Args:
+            recipient (str): Recipient's username
+            message (str): Message content
             
-            await asyncio.sleep(reconnect_delay)
-            success = await self.connect()
+        Returns:
+            bool: Always True; the oldest held message is dropped when the buffer is full
+        """
+        if len(self.outbound) == self.outbound.maxlen:
+            dropped_recipient, _ = self.outbound[0]
+            self.outbound_dropped += 1
+            logger.warning(f"Outbound buffer full, dropping oldest held message to {dropped_recipient}")
+        self.outbound.append((recipient, message))
+        logger.info(f"Holding message to {recipient} until reconnected ({len(self.outbound)} held)")
+        return True
+    
+    async def _flush_outbound(self):
+        """Send the messages held while the connection was down, oldest first."""
+        if self.outbound:
+            logger.info(f"Sending {len(self.outbound)} messages held while disconnected")
+        while self.outbound and self.online:
+            recipient, message = self.outbound.popleft()
+            await self.send_message(recipient, message)
+    
+    async def handle_disconnect(self) -> bool:
+        """
+        Reconnect after the connection was lost.
+        
+        Retries with capped, jittered exponential backoff until signed on
+        again, ``max_reconnect_attempts`` is reached, or :meth:`disconnect`
+        is called.
+        
+        Returns:
+            bool: True once reconnected, False if reconnecting was abandoned
+        """
+        self.connected = False
+        self.disconnects += 1
+        lost_at = time.monotonic()
+        
+        while not self.stopping:
+            if self.max_reconnect_attempts is not None and self.reconnect_attempts >= self.max_reconnect_attempts:
+                logger.error(f"Failed to reconnect to AIM server after {self.reconnect_attempts} attempts")
+                return False
             
-            if success:
-                logger.info("Successfully reconnected to AIM server")
-            else:
-                await self.handle_disconnect()
-        else:
-            logger.error(f"Failed to reconnect to AIM server after {self.max_reconnect_attempts} attempts")
+            delay = self.backoff_delay(self.reconnect_attempts)
+            self.reconnect_attempts += 1
+            logger.warning(f"Disconnected from AIM server. Attempting to reconnect in {delay:.1f} seconds (attempt {self.reconnect_attempts})")
+            await asyncio.sleep(delay)
+            if self.stopping:
+                break
+            
+            if await self._sign_on():
+                recovered = time.monotonic() - lost_at
+                self.recovery_times.add(recovered)
+                logger.info(f"Successfully reconnected to AIM server after {recovered:.1f} seconds")
+                await self._flush_outbound()
+                return True
+        return False
     
     async def process_incoming_packets(self):
-        """Process incoming AIM packets."""
+        """
+        Process incoming AIM packets, reconnecting whenever the connection drops.
+        
+        Returns once :meth:`disconnect` is called or reconnecting is abandoned.
+        """
         if not self.client or not self.connected:
             logger.error("Cannot process packets: Not connected to AIM server")
             return
         
-        try:
-            logger.info("Starting to process incoming AIM packets")
-            await self.client.process_incoming_packets()
-        except Exception as e:
-            logger.error(f"Error processing incoming packets: {str(e)}")
-            await self.handle_disconnect()
+        logger.info("Starting to process incoming AIM packets")
+        while not self.stopping:
+            try:
+                await self.client.process_incoming_packets()
+            except Exception as e:
+                logger.error(f"Error processing incoming packets: {str(e)}")
+            if self.stopping:
+                break
+            logger.warning(f"Lost connection to AIM server: {self.client.disconnect_reason or 'unknown reason'}")
+            if not await self.handle_disconnect():
+                break
+    
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Connection health metrics.
+        
+        Returns:
+            Dict[str, Any]: Disconnect count, time-to-recover statistics and outbound buffer state
+        """
+        return {
+            "online": self.online,
+            "disconnects": self.disconnects,
+            "reconnect_attempts": self.reconnect_attempts,
+            "time_to_recover": self.recovery_times.snapshot(),
+            "outbound_held": len(self.outbound),
+            "outbound_dropped": self.outbound_dropped,
+        }
@@ -4,11 +4,16 @@ Integrates AIM and Dify API functionality.
 """
 import asyncio
 import uuid
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from aimbot.api.dify_client import DifyClient
 from aimbot.bot.aim_handler import AIMHandler
+from aimbot.bot.mailbox import MailboxPool
+from aimbot.bot.reply_pacing import ReplyPacing
+from aimbot.bot.timers import TimerWheel
 from aimbot.utils.logger import get_logger
+from aimpyfly.icbm import MAX_MESSAGE_BYTES, split_message
+from aimpyfly.metrics import TimingStats
 
 logger = get_logger(__name__)
 
@@ -20,21 +25,36 @@ class AIMBot:
         aim_handler (AIMHandler): Handler for AIM connection and messages
         dify_client (DifyClient): Client for Dify API
         user_sessions (Dict[str, str]): Map of AIM usernames to session IDs
+        mailboxes (MailboxPool): Per-user mailboxes that serialise and merge each user's turns
+        timers (TimerWheel): Every per-user deadline: debounce, idle and typing refresh timers
+        reply_pacing (ReplyPacing): When typing shows and how soon replies may be sent
+        reply_times (Dict[str, TimingStats]): Seconds from turn start to reply, with pacing "on" and "off"
+        max_message_bytes (int): Largest IM to send, as encoded (HTML wrapper and escaping included)
     """
     
-    def __init__(self, aim_credentials: Dict[str, Any], dify_client: DifyClient):
+    def __init__(self, aim_credentials: Dict[str, Any], dify_client: DifyClient, max_concurrent_turns: int = 8,
+                 reply_pacing: Optional[ReplyPacing] = None):
         """
         Initialize the AIM bot.
         
         Args:
             aim_credentials (Dict[str, Any]): AIM credentials
             dify_client (DifyClient): Dify API client
+            max_concurrent_turns (int): Dify requests allowed in flight at once across all users
+            reply_pacing (Optional[ReplyPacing]): Reply pacing policy; the defaults if not given
         """
         self.dify_client = dify_client
-        self.aim_handler = AIMHandler(aim_credentials, self.handle_message)
+        self.aim_handler = AIMHandler(aim_credentials, self.handle_message, typing_callback=self.handle_typing)
         self.user_sessions: Dict[str, str] = {}  # Map AIM usernames to session IDs
-        self.message_buffers: Dict[str, Dict[str, Any]] = {}  # Message buffers for each user
-        self.processing_users: Dict[str, bool] = {}  # Track users with ongoing API requests
+        self.timers = TimerWheel()
+        self.mailboxes = MailboxPool(self._process_message, self._handle_clear_command,
+                                     max_concurrent_turns=max_concurrent_turns, timers=self.timers)
+        self.typing_refresh_interval = 5.0  # seconds between typing notifications while waiting on Dify
+        self.reply_pacing = reply_pacing if reply_pacing is not None else ReplyPacing()
+        self.reply_times = {"on": TimingStats(), "off": TimingStats()}
+        self.backend_times = TimingStats()
+        self.pacing_holds = TimingStats()  # seconds a ready reply was held back by the pacing policy
+        self.max_message_bytes = MAX_MESSAGE_BYTES
         self.running = False
         
         logger.debug("Initialized AIM bot")
@@ -60,6 +80,10 @@ class AIMBot:
         logger.info("Stopping AIM bot")
         self.running = False
         
+        # Stop the per-user workers and their timers
+        await self.mailboxes.close()
+        await self.timers.close()
+        
         # Disconnect from AIM
         await self.aim_handler.disconnect()
         
@@ -81,10 +105,7 @@ class AIMBot:
             
             # Check if this is a "clear" command
             if message.strip().lower() == "clear":
-                # Reset processing state
-                self.processing_users[sender] = False
-                
-                await self._handle_clear_command(sender)
+                self.mailboxes.request_clear(sender)
                 return
             
             # Get or create a session ID for this user
@@ -94,154 +115,102 @@ class AIMBot:
                 self.user_sessions[sender] = session_id
                 logger.debug(f"Created new session for {sender}: {session_id}")
             
-            # Check if we're already processing a message for this user
-            if self.processing_users.get(sender, False):
-                logger.info(f"User {sender} has a message being processed, buffering new message")
-                await self._buffer_message(sender, message)
-                return
-            
-            # Check if the message is very short (likely part of a multi-message input)
-            if len(message.strip()) < 10:
-                await self._buffer_message(sender, message)
-                return
+            # The user's mailbox worker merges this with anything else pending
+            self.mailboxes.post(sender, message)
             
-            # Process the message normally
-            await self._process_message(sender, message)
+            # If the message will be held for more input, show that we're listening
+            if self.mailboxes.pacing.hold(sender, message) > 0:
+                await self.aim_handler.send_typing_notification(sender, True)
             
         except Exception as e:
             logger.error(f"Error handling message from {sender}: {str(e)}")
             await self.handle_error(sender, str(e))
     
-    async def _buffer_message(self, sender: str, message: str):
-        """
-        Buffer short messages to combine them before sending to the API.
-        
-        Args:
-            sender (str): Sender's username
-            message (str): Message content
+    async def handle_typing(self, sender: str, state: int):
         """
-        # Initialize buffer for this user if it doesn't exist
-        if sender not in self.message_buffers:
-            self.message_buffers[sender] = {
-                'messages': [],
-                'last_update': asyncio.get_event_loop().time(),
-                'task': None
-            }
-        
-        buffer = self.message_buffers[sender]
-        
-        # Add message to buffer
-        buffer['messages'].append(message)
-        buffer['last_update'] = asyncio.get_event_loop().time()
+        Handle a typing notification from AIM.
         
-        # Cancel existing task if there is one
-        if buffer['task'] and not buffer['task'].done():
-            buffer['task'].cancel()
-        
-        # Create a new task to process the buffer after a delay
-        buffer['task'] = asyncio.create_task(self._process_buffer_after_delay(sender, 1.5))  # 1.5 second delay
-        
-        # Send typing notification to indicate we're listening
-        await self.aim_handler.send_typing_notification(sender, True)
-    
-    async def _process_buffer_after_delay(self, sender: str, delay: float):
-        """
-        Process the message buffer after a delay.
+        Lets the sender's mailbox hold their input while they are still typing
+        and release it as soon as they stop.
         
         Args:
             sender (str): Sender's username
-            delay (float): Delay in seconds
+            state (int): Typing state (``aimpyfly.icbm.TYPING_*``)
         """
-        try:
-            await asyncio.sleep(delay)
-            
-            if sender in self.message_buffers and self.message_buffers[sender]['messages']:
-                # Combine messages in the buffer
-                combined_message = " ".join(self.message_buffers[sender]['messages'])
-                
-                # Clear the buffer
-                self.message_buffers[sender]['messages'] = []
-                
-                # Process the combined message
-                await self._process_message(sender, combined_message)
-        
-        except asyncio.CancelledError:
-            # Task was cancelled, likely because a new message arrived
-            pass
+        self.mailboxes.typing(sender, state)
     
     async def _process_message(self, sender: str, message: str):
         """
-        Process a message and send it to the Dify API.
+        Process one turn: send the (merged) message to the Dify API and reply.
+        
+        Called by the sender's mailbox worker, one turn at a time per user.
         
         Args:
             sender (str): Sender's username
             message (str): Message content
         """
-        # Mark this user as being processed
-        self.processing_users[sender] = True
-        
-        # Add a natural delay before showing typing indicator (1-3 seconds)
-        delay = 1 + (uuid.uuid4().int % 2)  # Random delay between 1-3 seconds
-        await asyncio.sleep(delay)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        pacing = self.reply_pacing
+        paced = pacing.enabled
         
-        # Send typing notification
-        await self.aim_handler.send_typing_notification(sender, True)
-        
-        # Create a task for sending periodic typing notifications
-        typing_task = asyncio.create_task(self._send_periodic_typing(sender))
+        # Start the Dify request right away; the natural delays below run alongside it.
+        # The AIM username is the user identifier.
+        request = asyncio.create_task(self.dify_client.send_message(sender, message))
         
         try:
-            # Send the message to Dify API using the AIM username as the user identifier
-            response_text, metadata = await self.dify_client.send_message(sender, message)
+            # Wait a moment before showing the typing indicator, unless the reply is ready first
+            await asyncio.wait({request}, timeout=pacing.typing_after())
+            typing = not request.done()
+            if typing:
+                await self.aim_handler.send_typing_notification(sender, True)
+                # Keep the typing indicator alive until the reply is ready
+                self._start_periodic_typing(sender)
+            
+            response_text, metadata = await request
+            answered = loop.time()
+            self.backend_times.add(answered - started)
             
-            # Cancel the typing notification task
-            typing_task.cancel()
+            # Don't reply sooner than a person could have
+            hold = started + pacing.reply_after(response_text) - answered
+            if hold > 0:
+                self.pacing_holds.add(hold)
+                if not typing:
+                    await self.aim_handler.send_typing_notification(sender, True)
+                await asyncio.sleep(hold)
+            
+            # Stop the typing refreshes
+            self.timers.cancel(('typing', sender))
             
             # Send "stopped typing" notification
             await self.aim_handler.send_typing_notification(sender, False)
             
             # Send the response back to the AIM user
             await self.send_response(sender, response_text)
-            
-            # Process any buffered messages that came in while we were processing
-            await self._process_buffered_messages(sender)
+            self.reply_times["on" if paced else "off"].add(loop.time() - started)
             
         except asyncio.CancelledError:
             logger.warning(f"Message processing for {sender} was cancelled")
             await self.aim_handler.send_typing_notification(sender, False)
+            raise
         except Exception as e:
             logger.error(f"Error processing message from {sender}: {str(e)}")
             await self.handle_error(sender, str(e))
         finally:
-            # Ensure typing task is cancelled
-            if typing_task and not typing_task.done():
-                typing_task.cancel()
-            
-            # Mark this user as no longer being processed
-            self.processing_users[sender] = False
-    
-    async def _process_buffered_messages(self, sender: str):
-        """
-        Process any messages that were buffered while waiting for an API response.
-        
-        Args:
-            sender (str): Sender's username
-        """
-        if sender in self.message_buffers and self.message_buffers[sender]['messages']:
-            # Combine messages in the buffer
-            combined_message = " ".join(self.message_buffers[sender]['messages'])
-            logger.info(f"Processing buffered messages for {sender}: {combined_message}")
-            
-            # Clear the buffer
-            self.message_buffers[sender]['messages'] = []
-            
-            # Process the combined message
-            await self._process_message(sender, combined_message)
+            # Ensure the typing refreshes and the request are stopped
+            self.timers.cancel(('typing', sender))
+            if not request.done():
+                request.cancel()
+            elif not request.cancelled():
+                request.exception()  # retrieved, even if the turn ended before awaiting it
     
     async def _handle_clear_command(self, sender: str):
         """
         Handle the "clear" command from a user.
         
+        Runs on the user's mailbox worker, after any turn in progress and with
+        their pending messages already discarded.
+        
         Args:
             sender (str): Sender's username
         """
@@ -257,20 +226,6 @@ class AIMBot:
                 del self.user_sessions[sender]
                 logger.debug(f"Removed session mapping for user {sender}")
             
-            # Cancel and clear any pending message buffer tasks
-            if sender in self.message_buffers:
-                if 'task' in self.message_buffers[sender] and not self.message_buffers[sender]['task'].done():
-                    self.message_buffers[sender]['task'].cancel()
-                self.message_buffers[sender] = {
-                    'messages': [],
-                    'last_update': asyncio.get_event_loop().time(),
-                    'task': None
-                }
-                logger.debug(f"Reset message buffer for user {sender}")
-            
-            # Reset processing state
-            self.processing_users[sender] = False
-            
             # Send confirmation message
             confirmation = "Memory cleared. Your next message will be treated as the start of a new conversation."
             await self.aim_handler.send_message(sender, confirmation)
@@ -281,22 +236,19 @@ class AIMBot:
             error_message = "Sorry, I encountered an error clearing the conversation. Please try again in a moment."
             await self.aim_handler.send_message(sender, error_message)
     
-    async def _send_periodic_typing(self, recipient: str, interval: float = 5.0):
+    def _start_periodic_typing(self, recipient: str):
         """
         Send periodic typing notifications to keep the typing indicator active.
         
+        The refreshes are a repeating timer on the bot's timer wheel, keyed by
+        recipient; cancel ``('typing', recipient)`` to stop them.
+        
         Args:
             recipient (str): Recipient's username
-            interval (float): Interval between typing notifications in seconds
         """
-        try:
-            while True:
-                await asyncio.sleep(interval)
-                await self.aim_handler.send_typing_notification(recipient, True)
-                logger.debug(f"Sent periodic typing notification to {recipient}")
-        except asyncio.CancelledError:
-            logger.debug(f"Periodic typing notifications to {recipient} cancelled")
-            raise
+        interval = self.typing_refresh_interval
+        self.timers.schedule(('typing', recipient), interval,
+                             lambda: self.aim_handler.send_typing_notification(recipient, True), interval=interval)
     
     async def send_response(self, recipient: str, response: str):
         """
@@ -306,24 +258,65 @@ class AIMBot:
             recipient (str): Recipient's username
             response (str): Response content
         """
-        # Check if the response is too long for AIM
-        # AIM has a message size limit, so we might need to split long messages
-        max_message_length = 2000  # AIM message size limit
+        # AIM limits the encoded size of an IM, so long responses go out in parts
+        parts = self.split_response(response)
+        if not parts:
+            logger.warning(f"Empty response for {recipient}, nothing to send")
+            return
         
-        if len(response) <= max_message_length:
-            # Send the response as a single message
-            await self.aim_handler.send_message(recipient, response)
-        else:
-            # Split the response into multiple messages
-            chunks = [response[i:i+max_message_length] for i in range(0, len(response), max_message_length)]
+        if len(parts) == 1:
+            await self.aim_handler.send_message(recipient, parts[0])
+            return
+        
+        # The send queue paces each part to the live IM rate class; waiting (a
+        # bounded time) for each one's ack keeps them in order when one has to
+        # be retried. If the connection drops mid-reply, the handler holds the
+        # lost part and the rest for the reconnect.
+        for part in parts:
+            if not await self.aim_handler.send_message(recipient, part, wait_for_delivery=True):
+                logger.warning(f"Stopped sending a {len(parts)}-part response to {recipient}: a part was not delivered")
+                return
+    
+    def split_response(self, response: str) -> List[str]:
+        """
+        Split a response into IMs that fit ``max_message_bytes``.
+        
+        Parts break at sentence or word boundaries. When there is more than one,
+        each starts with an "[i/n] " marker, which is counted in the size.
+        
+        Args:
+            response (str): Response content
             
-            for i, chunk in enumerate(chunks):
-                # Add a prefix to indicate that this is a multi-part message
-                prefix = f"[{i+1}/{len(chunks)}] "
-                await self.aim_handler.send_message(recipient, prefix + chunk)
-                
-                # Add a small delay between messages to avoid flooding
-                await asyncio.sleep(0.5)
+        Returns:
+            List[str]: The messages to send, in order
+        """
+        parts = split_message(response, self.max_message_bytes)
+        count = len(parts)
+        if count <= 1:
+            return parts
+        # Make room for the markers; if that adds parts, the markers may need more digits
+        while True:
+            parts = split_message(response, self.max_message_bytes, reserve=len(f"[{count}/{count}] "))
+            if len(parts) <= count:
+                break
+            count = len(parts)
+        return [f"[{i}/{len(parts)}] {part}" for i, part in enumerate(parts, 1)]
+    
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Get bot statistics.
+        
+        Returns:
+            Dict[str, Any]: Time to reply with reply pacing on and off, backend time, pacing holds,
+                mailbox and timer statistics
+        """
+        return {
+            "time_to_reply": {state: stats.snapshot() for state, stats in self.reply_times.items()},
+            "backend": self.backend_times.snapshot(),
+            "pacing_hold": self.pacing_holds.snapshot(),
+            "mailboxes": self.mailboxes.metrics(),
+            "timers": self.timers.metrics(),
+        }
     
     async def handle_error(self, recipient: str, error: str):
         """
@@ -0,0 +1,421 @@
+"""
+Per-user mailboxes for the AIM chatbot.
+Serialises each user's turns and merges input that arrives while a turn is running.
+"""
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from aimbot.bot.timers import TimerWheel
+from aimbot.utils.logger import get_logger
+from aimpyfly.icbm import TYPING_BEGUN, TYPING_FINISHED
+from aimpyfly.metrics import TimingStats
+
+logger = get_logger(__name__)
+
+
+class Pace:
+    """
+    How one user sends multi-part input, as moving averages.
+
+    Attributes:
+        gap (float): Typical seconds from a message to the user's next message or start of typing
+        follow (float): Share of messages that were followed up within ``Pacing.max_gap``
+        samples (int): Observations so far
+    """
+
+    __slots__ = ("gap", "follow", "samples")
+
+    def __init__(self):
+        self.gap = 0.0
+        self.follow = 0.0
+        self.samples = 0
+
+
+class Pacing:
+    """
+    Decides how long to hold a user's input before it becomes a turn.
+
+    Until a user has been observed, short messages are held for ``debounce``
+    seconds and longer ones not at all. After that the hold follows the
+    user's own habits: none for users who rarely follow up a message,
+    otherwise ``gap_factor`` times their usual gap, up to ``max_debounce``.
+    A gap is measured from a message to whatever comes next from the user, a
+    message or the start of typing, so for clients that send typing
+    notifications the hold shrinks to their reaction time.
+
+    Attributes:
+        paces (OrderedDict): Pace per screen name, least recently seen first
+    """
+
+    def __init__(self, debounce: float = 1.5, short_message_length: int = 10, gap_factor: float = 1.5,
+                 max_debounce: float = 4.0, max_gap: float = 10.0, follow_threshold: float = 0.3,
+                 min_samples: int = 2, smoothing: float = 0.3, typing_timeout: float = 6.0,
+                 max_hold: float = 15.0, finish_grace: float = 0.3, max_users: int = 10000):
+        """
+        Initialize the pacing policy.
+
+        Args:
+            debounce (float): Hold for short messages from users not observed yet
+            short_message_length (int): Messages shorter than this count as short
+            gap_factor (float): Multiple of a user's usual gap to hold for
+            max_debounce (float): Longest hold while the user is not typing
+            max_gap (float): Longer gaps mean the message was not followed up
+            follow_threshold (float): Users who follow up less often than this are not held
+            min_samples (int): Observations needed before a user's own pace is used
+            smoothing (float): Weight of each new observation in the moving averages
+            typing_timeout (float): Seconds a "typing" notification holds input without a newer one
+            max_hold (float): Longest hold after a message, whatever the user's typing state
+            finish_grace (float): Hold after the user stops typing, for the message to arrive
+            max_users (int): Users whose pace is remembered; the least recently seen are forgotten
+        """
+        self.debounce = debounce
+        self.short_message_length = short_message_length
+        self.gap_factor = gap_factor
+        self.max_debounce = max_debounce
+        self.max_gap = max_gap
+        self.follow_threshold = follow_threshold
+        self.min_samples = min_samples
+        self.smoothing = smoothing
+        self.typing_timeout = typing_timeout
+        self.max_hold = max_hold
+        self.finish_grace = finish_grace
+        self.max_users = max_users
+        self.paces: "OrderedDict[str, Pace]" = OrderedDict()
+
+    def observe(self, sender: str, gap: Optional[float]):
+        """
+        Record what followed one of the sender's messages.
+
+        Args:
+            sender (str): Sender's username
+            gap (Optional[float]): Seconds until their next message or typing, None if nothing followed
+        """
+        pace = self.paces.get(sender)
+        if pace is None:
+            pace = self.paces[sender] = Pace()
+            if len(self.paces) > self.max_users:
+                self.paces.popitem(last=False)
+        else:
+            self.paces.move_to_end(sender)
+        followed = gap is not None and gap <= self.max_gap
+        weight = 1.0 if pace.samples == 0 else self.smoothing
+        pace.follow += weight * ((1.0 if followed else 0.0) - pace.follow)
+        if followed:
+            pace.gap = gap if pace.samples == 0 or pace.gap == 0.0 else pace.gap + self.smoothing * (gap - pace.gap)
+        pace.samples += 1
+
+    def hold(self, sender: str, message: str) -> float:
+        """
+        Get the seconds to wait for more input after a message, while the user is not typing.
+
+        Args:
+            sender (str): Sender's username
+            message (str): Their latest message
+
+        Returns:
+            float: Seconds to hold
+        """
+        pace = self.paces.get(sender)
+        if pace is None or pace.samples < self.min_samples:
+            return self.debounce if len(message.strip()) < self.short_message_length else 0.0
+        if pace.follow < self.follow_threshold:
+            return 0.0
+        return min(self.max_debounce, self.gap_factor * pace.gap)
+
+
+class Mailbox:
+    """
+    Pending input and worker task for one screen name.
+
+    Attributes:
+        messages (Deque[Tuple[float, str]]): Messages not yet handled, with their arrival time
+        clear_requested (bool): Whether a "clear" is waiting to run before the next turn
+        wakeup (asyncio.Event): Set whenever input is posted
+        task (Optional[asyncio.Task]): The worker, while the mailbox is active
+        dropped (int): Messages discarded because the mailbox was full
+        typing_state (Optional[int]): Latest typing notification state, None if none was received
+        typing_at (float): When it was received
+        composing (bool): Whether the user started typing again since their last message
+        stopped_at (Optional[float]): When they stopped typing after starting again
+        last_input (Optional[float]): When their last message arrived, until a follow-up is observed
+    """
+
+    def __init__(self, max_pending: int):
+        """
+        Initialize the mailbox.
+
+        Args:
+            max_pending (int): Messages held before the oldest are dropped
+        """
+        self.messages: Deque[Tuple[float, str]] = deque(maxlen=max_pending)
+        self.clear_requested = False
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.typing_state: Optional[int] = None
+        self.typing_at = 0.0
+        self.composing = False
+        self.stopped_at: Optional[float] = None
+        self.last_input: Optional[float] = None
+
+
+class MailboxPool:
+    """
+    One mailbox and worker per active screen name, with a global cap on concurrent turns.
+
+    A worker takes everything its user sent while it was busy and hands it to
+    ``turn_handler`` as a single message, so each user has at most one turn
+    running and the call stack stays flat however much they type.
+
+    Input is held while more may follow. A user who is typing (per their
+    typing notifications) is waited for until they send or stop typing; a
+    user who is not is held for as long as ``pacing`` expects from their
+    past gaps. Workers exit once their user has been quiet for
+    ``idle_timeout`` seconds, and a new one starts with the next message.
+    Both deadlines are timers on a shared TimerWheel, so a new message just
+    moves its user's timer instead of starting a timeout of its own.
+
+    Attributes:
+        mailboxes (Dict[str, Mailbox]): Active mailboxes by screen name
+        timers (TimerWheel): Debounce and idle deadlines
+        pacing (Pacing): Per-user hold policy
+        hold_times (TimingStats): Seconds from a turn's last message to the turn starting
+        turns (int): Turns handed to the turn handler
+        merged (int): Messages that were merged into another one's turn
+    """
+
+    def __init__(self, turn_handler: Callable[[str, str], Awaitable[Any]],
+                 clear_handler: Callable[[str], Awaitable[Any]], max_concurrent_turns: int = 8,
+                 idle_timeout: float = 60.0, max_pending: int = 20, timers: Optional[TimerWheel] = None,
+                 pacing: Optional[Pacing] = None):
+        """
+        Initialize the mailbox pool.
+
+        Args:
+            turn_handler (Callable): Coroutine function called with (sender, merged message) for each turn
+            clear_handler (Callable): Coroutine function called with the sender for a "clear" command
+            max_concurrent_turns (int): Turns allowed to run at once across all users
+            idle_timeout (float): Seconds without input before a user's worker exits
+            max_pending (int): Messages held per user; the oldest are dropped beyond this
+            timers (Optional[TimerWheel]): Timer wheel to share, e.g. with the bot's typing refreshes
+            pacing (Optional[Pacing]): Hold policy; the defaults if not given
+        """
+        self.turn_handler = turn_handler
+        self.clear_handler = clear_handler
+        self.max_concurrent_turns = max_concurrent_turns
+        self.idle_timeout = idle_timeout
+        self.max_pending = max_pending
+        self.mailboxes: Dict[str, Mailbox] = {}
+        self.owns_timers = timers is None
+        self.timers = timers if timers is not None else TimerWheel()
+        self.pacing = pacing if pacing is not None else Pacing()
+        self.hold_times = TimingStats()
+        self.slots = asyncio.Semaphore(max_concurrent_turns)
+        self.active_turns = 0
+        self.max_active_turns = 0
+        self.turns = 0
+        self.merged = 0
+        self.dropped = 0
+        self.closed = False
+
+    def _mailbox(self, sender: str) -> Mailbox:
+        mailbox = self.mailboxes.get(sender)
+        if mailbox is None:
+            mailbox = self.mailboxes[sender] = Mailbox(self.max_pending)
+        if mailbox.task is None or mailbox.task.done():
+            mailbox.task = asyncio.create_task(self._run(sender, mailbox))
+        return mailbox
+
+    def post(self, sender: str, message: str):
+        """
+        Queue a message for the sender's next turn.
+
+        Args:
+            sender (str): Sender's username
+            message (str): Message content
+        """
+        if self.closed:
+            return
+        mailbox = self._mailbox(sender)
+        if len(mailbox.messages) == mailbox.messages.maxlen:
+            mailbox.dropped += 1
+            self.dropped += 1
+            logger.warning(f"Mailbox for {sender} is full, dropping their oldest message")
+        now = asyncio.get_running_loop().time()
+        self._followed_up(sender, mailbox, now)
+        mailbox.messages.append((now, message))
+        mailbox.last_input = now
+        mailbox.composing = False
+        mailbox.stopped_at = None
+        mailbox.wakeup.set()
+
+    def typing(self, sender: str, state: int):
+        """
+        Note a typing notification from the sender (``aimpyfly.icbm.TYPING_*``).
+
+        Args:
+            sender (str): Sender's username
+            state (int): Typing state
+        """
+        mailbox = self.mailboxes.get(sender)
+        if mailbox is None or self.closed:
+            return  # nothing pending and nothing to measure
+        now = asyncio.get_running_loop().time()
+        if state != TYPING_FINISHED:
+            self._followed_up(sender, mailbox, now)
+            mailbox.composing = True
+        elif mailbox.composing:
+            mailbox.composing = False
+            mailbox.stopped_at = now
+        mailbox.typing_state = state
+        mailbox.typing_at = now
+        mailbox.wakeup.set()
+
+    def _followed_up(self, sender: str, mailbox: Mailbox, now: float):
+        if mailbox.last_input is not None:
+            self.pacing.observe(sender, now - mailbox.last_input)
+            mailbox.last_input = None
+
+    def request_clear(self, sender: str):
+        """
+        Discard the sender's pending input and run the clear handler before their next turn.
+
+        A turn already in progress is allowed to finish first, so the clear
+        never races with it.
+
+        Args:
+            sender (str): Sender's username
+        """
+        if self.closed:
+            return
+        mailbox = self._mailbox(sender)
+        mailbox.messages.clear()
+        mailbox.clear_requested = True
+        mailbox.wakeup.set()
+
+    def pending(self, sender: str) -> int:
+        """
+        Get the number of messages waiting for the sender's next turn.
+
+        Args:
+            sender (str): Sender's username
+
+        Returns:
+            int: Pending messages
+        """
+        mailbox = self.mailboxes.get(sender)
+        return len(mailbox.messages) if mailbox else 0
+
+    async def _wait(self, mailbox: Mailbox, timeout: float):
+        """Wait for input, or until ``timeout`` seconds have passed."""
+        mailbox.wakeup.clear()
+        self.timers.schedule(mailbox, timeout, mailbox.wakeup.set)
+        try:
+            await mailbox.wakeup.wait()
+        finally:
+            self.timers.cancel(mailbox)
+
+    def _hold_until(self, sender: str, mailbox: Mailbox) -> float:
+        """When to stop waiting for more input after the newest message."""
+        arrived, message = mailbox.messages[-1]
+        pacing = self.pacing
+        if mailbox.composing:
+            if mailbox.typing_state == TYPING_BEGUN:
+                until = mailbox.typing_at + pacing.typing_timeout
+            else:  # paused with text entered
+                until = mailbox.typing_at + max(pacing.hold(sender, message), pacing.finish_grace)
+            return min(until, arrived + pacing.max_hold)
+        if mailbox.stopped_at is not None:
+            # Typed and stopped: the message is on its way, or was erased
+            return mailbox.stopped_at + pacing.finish_grace
+        return arrived + pacing.hold(sender, message)
+
+    async def _debounce(self, sender: str, mailbox: Mailbox):
+        """Wait while more input may still follow."""
+        loop = asyncio.get_running_loop()
+        while mailbox.messages and not mailbox.clear_requested:
+            remaining = self._hold_until(sender, mailbox) - loop.time()
+            if remaining <= 0:
+                return
+            await self._wait(mailbox, remaining)
+
+    async def _run(self, sender: str, mailbox: Mailbox):
+        """Worker loop for one user; returns once the user has gone idle."""
+        while True:
+            if not mailbox.messages and not mailbox.clear_requested:
+                idle_until = asyncio.get_running_loop().time() + self.idle_timeout
+                while (not mailbox.messages and not mailbox.clear_requested
+                       and asyncio.get_running_loop().time() < idle_until):
+                    await self._wait(mailbox, idle_until - asyncio.get_running_loop().time())
+                if not mailbox.messages and not mailbox.clear_requested:
+                    # No await between this check and leaving, so post() cannot slip in
+                    if self.mailboxes.get(sender) is mailbox:
+                        del self.mailboxes[sender]
+                    if mailbox.last_input is not None:
+                        self.pacing.observe(sender, None)
+                    logger.debug(f"Mailbox for {sender} closed after {self.idle_timeout}s idle")
+                    return
+
+            if mailbox.clear_requested:
+                mailbox.clear_requested = False
+                await self._call(sender, self.clear_handler, sender)
+                continue
+
+            await self._debounce(sender, mailbox)
+            if mailbox.clear_requested or not mailbox.messages:
+                continue
+
+            async with self.slots:
+                if mailbox.clear_requested or not mailbox.messages:
+                    continue
+                # Everything that arrived up to now becomes one turn
+                messages = [message for _, message in mailbox.messages]
+                self.hold_times.add(asyncio.get_running_loop().time() - mailbox.messages[-1][0])
+                mailbox.messages.clear()
+                self.turns += 1
+                self.merged += len(messages) - 1
+                self.active_turns += 1
+                self.max_active_turns = max(self.max_active_turns, self.active_turns)
+                try:
+                    await self._call(sender, self.turn_handler, sender, " ".join(messages))
+                finally:
+                    self.active_turns -= 1
+
+    async def _call(self, sender: str, handler: Callable[..., Awaitable[Any]], *args):
+        try:
+            await handler(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in mailbox worker for {sender}: {str(e)}")
+
+    async def close(self):
+        """Stop every worker and discard pending input."""
+        self.closed = True
+        tasks = [mailbox.task for mailbox in self.mailboxes.values() if mailbox.task and not mailbox.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.mailboxes.clear()
+        if self.owns_timers:
+            await self.timers.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Get mailbox statistics.
+
+        Returns:
+            Dict[str, Any]: Active mailboxes, pending messages, turns, merge/drop counts and hold times
+        """
+        return {
+            "mailboxes": len(self.mailboxes),
+            "pending": sum(len(mailbox.messages) for mailbox in self.mailboxes.values()),
+            "active_turns": self.active_turns,
+            "max_active_turns": self.max_active_turns,
+            "turns": self.turns,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "hold_p50": self.hold_times.percentile(50),
+            "hold_p99": self.hold_times.percentile(99),
+        }
@@ -0,0 +1,69 @@
+"""
+Reply pacing for the AIM chatbot.
+Decides when the bot starts "typing" and how soon a reply may go out, so answers don't look instantaneous.
+"""
+import random
+from typing import Optional, Tuple
+
+
+class ReplyPacing:
+    """
+    Cosmetic delays for a reply, measured from the start of the turn.
+
+    The delays run alongside the backend request rather than before it, so a
+    reply goes out after whichever takes longer: the backend, or the time a
+    person would need to read the message and type the answer.
+
+    Attributes:
+        enabled (bool): When False, typing shows at once and replies are sent as soon as they are ready
+        typing_delay (Tuple[float, float]): Range of seconds before the typing indicator appears
+        min_reply_delay (float): Seconds before any reply may be sent
+        seconds_per_char (float): Seconds per character of the reply, as if typed; used when above min_reply_delay
+        max_reply_delay (float): Cap on the reply delay, however long the reply
+    """
+
+    def __init__(self, enabled: bool = True, typing_delay: Tuple[float, float] = (0.5, 1.5),
+                 min_reply_delay: float = 1.5, seconds_per_char: float = 0.0, max_reply_delay: float = 6.0,
+                 rng: Optional[random.Random] = None):
+        """
+        Initialize the reply pacing policy.
+
+        Args:
+            enabled (bool): Whether to pace replies at all
+            typing_delay (Tuple[float, float]): Range of seconds before the typing indicator appears
+            min_reply_delay (float): Seconds before any reply may be sent
+            seconds_per_char (float): Seconds per character of the reply
+            max_reply_delay (float): Cap on the reply delay
+            rng (Optional[random.Random]): Random source for the typing delay
+        """
+        self.enabled = enabled
+        self.typing_delay = typing_delay
+        self.min_reply_delay = min_reply_delay
+        self.seconds_per_char = seconds_per_char
+        self.max_reply_delay = max_reply_delay
+        self.rng = rng or random.Random()
+
+    def typing_after(self) -> float:
+        """
+        Get the seconds from the start of a turn until the typing indicator shows.
+
+        Returns:
+            float: Seconds to wait
+        """
+        if not self.enabled:
+            return 0.0
+        return self.rng.uniform(*self.typing_delay)
+
+    def reply_after(self, reply: str) -> float:
+        """
+        Get the earliest time, in seconds from the start of a turn, to send a reply.
+
+        Args:
+            reply (str): The reply text
+
+        Returns:
+            float: Seconds from the start of the turn
+        """
+        if not self.enabled:
+            return 0.0
+        return min(self.max_reply_delay, max(self.min_reply_delay, self.seconds_per_char * len(reply)))
@@ -0,0 +1,211 @@
+"""
+Hashed timer wheel for the AIM chatbot.
+One scheduler task owns every per-user deadline: debounce windows, idle timeouts and typing refreshes.
+"""
+import asyncio
+import inspect
+import math
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from aimbot.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class _Timer:
+    __slots__ = ("key", "tick", "callback", "interval")
+
+    def __init__(self, key: Hashable, tick: int, callback: Callable[[], Any], interval: Optional[float]):
+        self.key = key
+        self.tick = tick
+        self.callback = callback
+        self.interval = interval
+
+
+class TimerWheel:
+    """
+    Keyed timers on a hashed wheel, driven by a single asyncio task.
+
+    Time is cut into ``tick``-second ticks and a timer lives in slot
+    ``tick % slots`` of the wheel, so scheduling, rescheduling and cancelling
+    a key are O(1) dict operations whatever the number of timers. A timer
+    fires on the first tick at or after its deadline: never early, and at
+    most one tick late. The driver task runs only while timers are pending.
+
+    Callbacks are plain callables run on the driver. One returning an
+    awaitable (such as a coroutine) has it awaited in a follow-up task, one
+    task per tick for all of them, so the wheel itself never blocks on I/O.
+
+    Attributes:
+        tick (float): Seconds per tick, the timers' resolution
+        fired (int): Timers fired so far
+    """
+
+    def __init__(self, tick: float = 0.05, slots: int = 512, clock: Optional[Callable[[], float]] = None):
+        """
+        Initialize the timer wheel.
+
+        Args:
+            tick (float): Seconds per tick
+            slots (int): Number of wheel slots; deadlines further than ``tick * slots`` away wrap around
+            clock (Optional[Callable[[], float]]): Time source; the running loop's clock by default
+        """
+        self.tick = tick
+        self.slots: List[Dict[Hashable, _Timer]] = [{} for _ in range(slots)]
+        self.clock = clock
+        self.origin: Optional[float] = None
+        self.current = 0  # last tick processed
+        self.timers: Dict[Hashable, _Timer] = {}
+        self.fired = 0
+        self.callback_errors = 0
+        self._task: Optional[asyncio.Task] = None
+        self._pending: List[Any] = []
+        self._callback_tasks = set()
+
+    def _now(self) -> float:
+        return self.clock() if self.clock is not None else asyncio.get_running_loop().time()
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.timers
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable[[], Any], interval: Optional[float] = None):
+        """
+        Run ``callback`` ``delay`` seconds from now, replacing any timer already set for ``key``.
+
+        Args:
+            key (Hashable): Identifies the timer for rescheduling and cancelling
+            delay (float): Seconds until the timer fires
+            callback (Callable): Called with no arguments when it fires
+            interval (Optional[float]): Fire again every ``interval`` seconds until cancelled
+        """
+        now = self._now()
+        if self.origin is None:
+            self.origin = now
+            self.current = 0
+        tick = max(self.current + 1, math.ceil((now + max(delay, 0.0) - self.origin) / self.tick))
+        timer = self.timers.get(key)
+        if timer is not None:
+            del self.slots[timer.tick % len(self.slots)][key]
+            timer.tick, timer.callback, timer.interval = tick, callback, interval
+        else:
+            timer = self.timers[key] = _Timer(key, tick, callback, interval)
+        self.slots[tick % len(self.slots)][key] = timer
+        self._start()
+
+    def cancel(self, key: Hashable) -> bool:
+        """
+        Cancel the timer for ``key``.
+
+        Args:
+            key (Hashable): The timer's key
+
+        Returns:
+            bool: True if a timer was pending
+        """
+        timer = self.timers.pop(key, None)
+        if timer is None:
+            return False
+        del self.slots[timer.tick % len(self.slots)][key]
+        return True
+
+    def advance(self, now: float) -> int:
+        """
+        Fire every timer whose deadline is at or before ``now``.
+
+        Called by the driver task; usable directly with a manual clock.
+
+        Args:
+            now (float): Current time on the wheel's clock
+
+        Returns:
+            int: Timers fired
+        """
+        if self.origin is None:
+            return 0
+        target = math.floor((now - self.origin) / self.tick)
+        if target <= self.current:
+            return 0
+        # Past a full turn every slot is visited once anyway
+        first = max(self.current + 1, target - len(self.slots) + 1)
+        # Timers scheduled by callbacks land after this tick
+        self.current = target
+        fired = 0
+        for tick in range(first, target + 1):
+            slot = self.slots[tick % len(self.slots)]
+            if not slot:
+                continue
+            due = [timer for timer in slot.values() if timer.tick <= target]
+            for timer in due:
+                if self.timers.get(timer.key) is not timer or timer.tick > target:
+                    continue  # cancelled or rescheduled by an earlier callback
+                del slot[timer.key]
+                del self.timers[timer.key]
+                if timer.interval is not None:
+                    self.schedule(timer.key, timer.interval, timer.callback, timer.interval)
+                fired += 1
+                self._fire(timer)
+        self.fired += fired
+        return fired
+
+    def _fire(self, timer: _Timer):
+        try:
+            result = timer.callback()
+        except Exception as e:
+            self.callback_errors += 1
+            logger.error(f"Error in timer callback for {timer.key!r}: {str(e)}")
+            return
+        if inspect.isawaitable(result):
+            self._pending.append(result)
+
+    async def _await_pending(self, awaitables: List[Any]):
+        for awaitable in awaitables:
+            try:
+                await awaitable
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.callback_errors += 1
+                logger.error(f"Error in timer callback: {str(e)}")
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self.timers:
+            await asyncio.sleep(self.tick)
+            self.advance(self._now())
+            if self._pending:
+                pending, self._pending = self._pending, []
+                task = asyncio.get_running_loop().create_task(self._await_pending(pending))
+                self._callback_tasks.add(task)
+                task.add_done_callback(self._callback_tasks.discard)
+
+    async def close(self):
+        """Cancel every timer and stop the driver task."""
+        self.timers.clear()
+        for slot in self.slots:
+            slot.clear()
+        for awaitable in self._pending:
+            if inspect.iscoroutine(awaitable):
+                awaitable.close()
+        self._pending = []
+        tasks = list(self._callback_tasks)
+        if self._task is not None and not self._task.done():
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        Get timer statistics.
+
+        Returns:
+            Dict[str, int]: Pending timers, timers fired and callback errors
+        """
+        return {"timers": len(self.timers), "fired": self.fired, "callback_errors": self.callback_errors}
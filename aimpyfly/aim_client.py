@@ -1,38 +1,121 @@
 import struct
 import asyncio
 import time
-import re
 import os
 import errno
 import logging
+from collections import deque
 from .oscar_protocol import OSCARProtocol
 from .log_utils import get_custom_logger
+from .capture import INBOUND, OUTBOUND, CaptureWriter
+from .dispatch import BLOCK, EventDispatcher, FlapEvent, SnacEvent
+from .dedup import RecentCookies, normalize_screen_name
+from .delivery import DeliveryTracker
+from .framer import FlapFramer
+from .icbm import ICBM_HEADER, TYPING_BEGUN, TypingFrameCache, decode_incoming_im, decode_typing, message_html
+from .keepalive import KeepAlive, apply_socket_options
+from .metrics import TimingStats
+from .oscar_protocol import SNAC_ERRORS, U16, patch_seq
+from .send_queue import CONTROL, IM, TYPING, SendQueue
+from .rate_limit import RATE_CHANGE_CODES, RateLimiter
+from .snac_registry import SNAC_HANDLERS
+from . import handlers  # registers the built-in family handlers
+
+
+class SignOnError(ConnectionError):
+    """A sign-on step failed or the server did not answer it in time."""
+
+    def __init__(self, phase, reason):
+        super().__init__(f"Sign-on failed at {phase}: {reason}")
+        self.phase = phase
+
+
+class SnacError(Exception):
+    """The server answered a request with an error SNAC (subtype 0x0001)."""
+
+    def __init__(self, family, subtype, code, tlvs=None):
+        super().__init__(f"SNAC 0x{family:04x}/0x{subtype:04x} failed: {SNAC_ERRORS.get(code, 'Unknown error')} (0x{code:04x})")
+        self.family = family
+        self.subtype = subtype
+        self.code = code
+        self.tlvs = tlvs
+
+
 class AIMClient:
     
+    # SNACs carrying conversation traffic; these may be dropped or shed under
+    # backpressure, everything else is protocol control and always delivered.
+    DROPPABLE_SNACS = frozenset({
+        (0x0004, 0x0007),  # Incoming IM
+        (0x0004, 0x0014),  # Typing notification
+    })
+
+    # Seconds to wait for each sign-on step; see ``connect``.
+    SIGNON_TIMEOUT = 10.0
 
-    def __init__(self, server, port, username, password, loglevel=logging.WARNING, logger=None):
+    def __init__(self, server, port, username, password, loglevel=logging.WARNING, logger=None,
+                 event_queue_size=1024, backpressure=BLOCK, max_handler_tasks=64, signon_timeouts=None,
+                 keepalive_interval=30.0, keepalive_max_missed=3, socket_options=None, capture=None):
         self.host = server
         self.port = int(port)
         self.username = username
         self.password = password
         self.sock = None
         self.seq_num = 0
+        self.request_id = 0
+        self.send_queue = None
         self.oscar = OSCARProtocol()
+        self.framer = FlapFramer()
+        self.read_size = 65536
+        self.reader = None
+        self.writer = None
+        self._pending_frames = deque()
+        self._reader_task = None
+        self._snac_waiters = {}
+        self._requests = {}
+        self.state = "offline"
+        self.disconnect_reason = None
+        self._drop_reason = None
+        self.last_received = 0.0
+        self.socket_options = socket_options
+        self.signon_timeouts = dict(signon_timeouts or {})
+        self.signon_timings = {}
         self.bos_server = ""
         self.auth_cookie = None
         self.on_message_received = None
         self.message_history = []
         self.message_callback = None
+        self.typing_callback = None
         
         if logger is None:
             self.logger = get_custom_logger(level=loglevel)
         else:
             self.logger = logger
 
+        self.rate_limiter = RateLimiter()
+        self.snac_handlers = SNAC_HANDLERS.copy()
+        self.snac_stats = {}
+        self.dispatcher = EventDispatcher(self.handle_event, maxsize=event_queue_size, policy=backpressure,
+                                          max_tasks=max_handler_tasks, logger=self.logger)
+        self.keepalive_interval = keepalive_interval
+        self.keepalive = KeepAlive(self, keepalive_interval, keepalive_max_missed, logger=self.logger)
+        self.delivery = DeliveryTracker(self.send_im, logger=self.logger)
+        self.recent_ims = RecentCookies()
+        self.typing_frames = TypingFrameCache()
+        # Optional wire capture: a CaptureWriter, or a path to open one at
+        if isinstance(capture, (str, os.PathLike)):
+            capture = CaptureWriter(os.fspath(capture), logger=self.logger)
+        self.capture = capture
+
     def set_message_callback(self, callback):
         self.message_callback = callback
         self.logger.info(f"Message callback set: {callback}")
 
+    def set_typing_callback(self, callback):
+        """Call ``callback(sender, state)`` for each typing notification (see ``icbm.TYPING_*``)."""
+        self.typing_callback = callback
+        self.logger.info(f"Typing callback set: {callback}")
+
     def roast_password(self, password):
         
         """Roast the password using the XOR roasting method."""
@@ -43,52 +126,91 @@ class AIMClient:
         return bytes(roasted_pass)
     
     async def process_incoming_packets(self):
+        """Run until the BOS connection closes.
+
+        ``connect`` already started the reader so it could see the sign-on
+        responses; this just waits on it.
+        """
+        if self._reader_task is None:
+            self.start_reader()
+        await self._reader_task
+    
+    def start_reader(self):
+        self._reader_task = asyncio.create_task(self.read_loop())
+    
+    async def read_loop(self):
         self.logger.info("Started processing incoming packets")
-        while True:
-            try:
-                flap_packet = await self.read_complete_flap()
-                if not flap_packet:
-                    self.logger.debug("No FLAP received, continuing")
-                    continue
-        
-                flap_header = flap_packet[:6]
-                flap_data = flap_packet[6:]
-        
-                flap_id, channel, seq_num, data_length = struct.unpack('>BBHH', flap_header)
-        
-                if flap_id != 0x2a:
-                    self.logger.error(f"Invalid FLAP ID: 0x{flap_id:02x}")
-                    continue
-        
-                self.logger.info(f"FLAP: Channel {channel}, Sequence {seq_num}, Length {data_length}")
-        
-                if channel == 0x01:
-                    await self.handle_channel_1(flap_data)
-                elif channel == 0x02:
-                    self.logger.info("Received SNAC packet, handling")
-                    await self.handle_channel_2(flap_data)
-                elif channel == 0x04:
-                    self.logger.info("Received disconnect notification")
-                    break
-                elif channel == 0x05:
-                    self.logger.debug("Received keep-alive packet")
-                else:
-                    self.logger.warning(f"Received unknown FLAP channel: {channel}")
-        
-            except ConnectionError as e:
-                if e.errno == errno.EPIPE:
-                    self.logger.error("Broken pipe error occurred while processing packets")
+        self.dispatcher.start()
+        self.disconnect_reason = None
+        self._drop_reason = None
+        connected = True
+        try:
+            while connected:
+                try:
+                    frames = await self.read_frames()
+                    if frames is None:
+                        self.logger.info("Connection closed by server")
+                        self.disconnect_reason = "connection closed by server"
+                        break
+                    for channel, seq_num, flap_data in frames:
+                        if not await self.dispatch_frame(channel, seq_num, flap_data):
+                            self.disconnect_reason = "disconnect notification"
+                            connected = False
+                            break
+            
+                except ConnectionError as e:
+                    if e.errno == errno.EPIPE:
+                        self.logger.error("Broken pipe error occurred while processing packets")
+                    else:
+                        self.logger.error(f"Connection error occurred: {e}")
+                    self.disconnect_reason = f"connection error: {e}"
                     break
-                else:
-                    self.logger.error(f"Connection error occurred: {e}")
+                except Exception as e:
+                    self.logger.error(f"Unexpected error occurred while processing packets: {e}")
+                    self.disconnect_reason = f"error: {e}"
                     break
-            except Exception as e:
-                self.logger.error(f"Unexpected error occurred while processing packets: {e}")
-                break
-        
-            await asyncio.sleep(0.1)  # Small delay to prevent tight loop
-        
-        self.logger.info("Stopped processing incoming packets")
+        except asyncio.CancelledError:
+            self.disconnect_reason = "closed"
+            raise
+        finally:
+            if self._drop_reason is not None:
+                self.disconnect_reason = self._drop_reason
+            self.state = "offline"
+            await self.keepalive.stop()
+            self.fail_snac_waiters(ConnectionError("Connection closed"))
+            self.fail_requests(ConnectionError("Connection closed"))
+            self.delivery.close()
+            await self.dispatcher.stop()
+            await self.stop_send_queue()
+            self.logger.info("Stopped processing incoming packets")
+    
+    async def dispatch_frame(self, channel, seq_num, flap_data):
+        """Turn one FLAP into an event. Returns False on a disconnect notice."""
+        self.logger.info(f"FLAP: Channel {channel}, Sequence {seq_num}, Length {len(flap_data)}")
+        
+        if channel == 0x02:
+            if len(flap_data) < 10:
+                self.logger.error("Incomplete SNAC header")
+                return True
+            family_id, subtype_id, flags, request_id = struct.unpack_from('!HHHL', flap_data)
+            event = SnacEvent(family_id, subtype_id, flags, request_id, flap_data[10:])
+            await self.dispatcher.put(event, (family_id, subtype_id) in self.DROPPABLE_SNACS)
+        elif channel == 0x01:
+            await self.dispatcher.put(FlapEvent(channel, seq_num, flap_data))
+        elif channel == 0x04:
+            self.logger.info("Received disconnect notification")
+            return False
+        elif channel == 0x05:
+            self.logger.debug("Received keep-alive packet")
+        else:
+            self.logger.warning(f"Received unknown FLAP channel: {channel}")
+        return True
+    
+    async def handle_event(self, event):
+        if isinstance(event, SnacEvent):
+            await self.dispatch_snac(event)
+        elif event.channel == 0x01:
+            await self.handle_channel_1(event.data)
     
     async def handle_channel_1(self, data):
         # Handle connection-related packets
@@ -101,35 +223,96 @@ class AIMClient:
             return
         
         family_id, subtype_id, flags, request_id = struct.unpack('!HHHL', data[:10])
-        snac_data = data[10:]
-        
-        self.logger.info(f"SNAC: Family 0x{family_id:04x}, Subtype 0x{subtype_id:04x}, Flags 0x{flags:04x}, Request ID {request_id}")
-        
-        if family_id == 0x0004:
-            if subtype_id == 0x000c:  # ICBM Error
-                await self.handle_icbm_error(snac_data)
-            elif subtype_id == 0x000b:  # ICBM Acknowledgement
-                self.logger.info("Received ICBM Acknowledgement")
-            elif subtype_id == 0x0007:  # Incoming IM
-                await self.handle_incoming_im(snac_data)
-            else:
-                self.logger.warning(f"Received unknown ICBM subtype: 0x{subtype_id:04x}")
-        else:
-            handler = self.get_snac_handler(family_id, subtype_id)
-            if handler:
-                await handler(snac_data, flags, request_id)
-            else:
-                self.logger.warning(f"Unhandled SNAC: Family 0x{family_id:04x}, Subtype 0x{subtype_id:04x}")
-                await self.handle_unknown_snac(family_id, subtype_id, snac_data, flags, request_id)
+        await self.handle_snac(family_id, subtype_id, flags, request_id, data[10:])
+    
+    async def handle_snac(self, family_id, subtype_id, flags, request_id, snac_data):
+        await self.dispatch_snac(SnacEvent(family_id, subtype_id, flags, request_id, snac_data))
     
+    async def dispatch_snac(self, snac):
+        key = (snac.family, snac.subtype)
+        self.logger.info(f"SNAC: Family 0x{snac.family:04x}, Subtype 0x{snac.subtype:04x}, Flags 0x{snac.flags:04x}, Request ID {snac.request_id}")
+        handler = self.snac_handlers.lookup(snac.family, snac.subtype)
+        stats = self.snac_stats.get(key)
+        if stats is None:
+            stats = self.snac_stats[key] = TimingStats()
+        start = time.perf_counter()
+        try:
+            if handler is not None:
+                await handler(self, snac)
+        finally:
+            stats.add(time.perf_counter() - start)
+            waiters = self._snac_waiters.pop(key, None)
+            if waiters:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(snac)
+            pending = self._requests.get(snac.request_id)
+            if pending is not None and pending[1] == snac.family:
+                self.resolve_request(pending, snac)
+
+    def expect_snac(self, family_id, subtype_id):
+        """Return a future for the next (family, subtype) SNAC.
+
+        It resolves after the SNAC's registered handler has run, so e.g. the
+        rate limiter is already loaded when a rate info waiter wakes up.
+        Register before sending the request the SNAC answers.
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self._snac_waiters.setdefault((family_id, subtype_id), []).append(waiter)
+        return waiter
+
+    def fail_snac_waiters(self, error):
+        waiters, self._snac_waiters = self._snac_waiters, {}
+        for pending in waiters.values():
+            for waiter in pending:
+                if not waiter.done():
+                    waiter.set_exception(error)
+                    waiter.exception()
+
+    async def request(self, family_id, subtype_id, payload=b'', timeout=10.0, flags=0x0000, lane=CONTROL):
+        """Send a SNAC and wait for the reply carrying the same request ID.
+        
+        Returns the reply SnacEvent (after its registered handler has run);
+        raises SnacError if the server answers with an error SNAC and
+        asyncio.TimeoutError after ``timeout`` seconds (None waits forever).
+        Any number of requests can be in flight at once.
+        """
+        request_id = self.next_request_id()
+        future = asyncio.get_running_loop().create_future()
+        self._requests[request_id] = (future, family_id, subtype_id)
+        try:
+            await self.send_snac(family_id, subtype_id, payload, flags, request_id, lane)
+            if timeout is None:
+                return await future
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._requests.pop(request_id, None)
+
+    def resolve_request(self, pending, snac):
+        future, family_id, subtype_id = pending
+        if future.done():
+            return
+        if snac.subtype == 0x0001:
+            code, = U16.unpack_from(snac.data) if len(snac.data) >= 2 else (0,)
+            tlvs = self.oscar.read_tlvs(snac.data, 2) if len(snac.data) > 2 else None
+            future.set_exception(SnacError(family_id, subtype_id, code, tlvs))
+        else:
+            future.set_result(snac)
+
+    def fail_requests(self, error):
+        requests, self._requests = self._requests, {}
+        for future, _, _ in requests.values():
+            if not future.done():
+                future.set_exception(error)
+                future.exception()
+
     def get_snac_handler(self, family_id, subtype_id):
-        handlers = {
-            (0x0001, 0x0003): self.handle_server_ready,
-            (0x0001, 0x0007): self.handle_rate_limits,
-            (0x0001, 0x0013): self.handle_motd,
-            # Could afford to add a lot more to this list, but these made sign on less noisy.
-        }
-        return handlers.get((family_id, subtype_id))
+        return self.snac_handlers.get(family_id, subtype_id)
+    
+    def snac_metrics(self):
+        """Per-SNAC dispatch counts and handler time, keyed "0xFFFF/0xSSSS"."""
+        return {f"0x{family:04x}/0x{subtype:04x}": stats.snapshot()
+                for (family, subtype), stats in sorted(self.snac_stats.items())}
     
     async def handle_unknown_snac(self, family_id, subtype_id, data, flags, request_id):
         self.logger.info(f"Parsing unknown SNAC: Family 0x{family_id:04x}, Subtype 0x{subtype_id:04x}")
@@ -145,75 +328,39 @@ class AIMClient:
     
     def parse_rate_limits(self, data):
         try:
-            offset = 0
-            num_classes, = struct.unpack('!H', data[offset:offset+2])
-            offset += 2
-            self.logger.debug(f"Number of rate classes: {num_classes}")
-        
-            for i in range(num_classes):
-                if offset + 34 > len(data):
-                    self.logger.error(f"Incomplete rate class data for class {i+1}")
-                    break
-        
-                class_id, window, clear, alert, limit, disconnect, current, max_level, last_time, current_state = struct.unpack('!H8I', data[offset:offset+34])
-                offset += 34
-        
-                self.logger.debug(f"Rate class {class_id}:")
-                self.logger.debug(f"  Window: {window} ms")
-                self.logger.debug(f"  Clear: {clear}")
-                self.logger.debug(f"  Alert: {alert}")
-                self.logger.debug(f"  Limit: {limit}")
-                self.logger.debug(f"  Disconnect: {disconnect}")
-                self.logger.debug(f"  Current: {current}")
-                self.logger.debug(f"  Max Level: {max_level}")
-                self.logger.debug(f"  Last Time: {last_time}")
-                self.logger.debug(f"  Current State: {current_state}")
-        
-            if offset + 2 > len(data):
-                self.logger.error("Incomplete rate group data")
-                return
-        
-            num_groups, = struct.unpack('!H', data[offset:offset+2])
-            offset += 2
-            self.logger.info(f"Number of rate groups: {num_groups}")
-        
-            for i in range(num_groups):
-                if offset + 4 > len(data):
-                    self.logger.error(f"Incomplete rate group header for group {i+1}")
-                    break
-        
-                group_id, num_pairs = struct.unpack('!HH', data[offset:offset+4])
-                offset += 4
-                self.logger.info(f"Rate group {group_id}: {num_pairs} SNAC pairs")
-        
-                for j in range(num_pairs):
-                    if offset + 4 > len(data):
-                        self.logger.error(f"Incomplete SNAC pair data for group {i+1}, pair {j+1}")
-                        break
-        
-                    family, subtype = struct.unpack('!HH', data[offset:offset+4])
-                    offset += 4
-                    self.logger.info(f"  SNAC family 0x{family:04x}, subtype 0x{subtype:04x}")
-        
-            self.logger.info("Rate limits parsing completed")
+            rate_classes = self.rate_limiter.load_rate_info(data)
+            self.logger.debug(f"Number of rate classes: {len(rate_classes)}")
+            for rate_class in rate_classes:
+                self.logger.debug(f"Rate class {rate_class.class_id}:")
+                self.logger.debug(f"  Window: {rate_class.window}")
+                self.logger.debug(f"  Clear: {rate_class.clear}")
+                self.logger.debug(f"  Alert: {rate_class.alert}")
+                self.logger.debug(f"  Limit: {rate_class.limit}")
+                self.logger.debug(f"  Disconnect: {rate_class.disconnect}")
+                self.logger.debug(f"  Current: {rate_class.current}")
+                self.logger.debug(f"  Max Level: {rate_class.max_level}")
+            self.logger.info(f"Rate limits parsing completed: {len(self.rate_limiter.snac_classes)} SNACs mapped to rate classes")
         
         except Exception as e:
             self.logger.error(f"Error parsing rate limits: {e}")
-            import traceback
-            traceback.print_exc()
+    
+    async def handle_rate_change(self, data, flags, request_id):
+        try:
+            code, rate_class = self.rate_limiter.apply_change(data)
+        except Exception as e:
+            self.logger.error(f"Error parsing rate change: {e}")
+            return
+        message = f"Rate class {rate_class.class_id} {RATE_CHANGE_CODES.get(code, f'code 0x{code:04x}')}: level {rate_class.current}, alert {rate_class.alert}, limit {rate_class.limit}"
+        if code in (0x0002, 0x0003):
+            self.logger.warning(message)
+        else:
+            self.logger.info(message)
     
     async def send_rate_ack(self):
         try:
-            self.seq_num = (self.seq_num + 1) % 0x10000
-            snac_data = b''  # No additional data needed for this acknowledgement
-            snac_packet = self.oscar.create_snac(0x0001, 0x0008, 0x0000, self.seq_num, snac_data)
-            flap_packet = self.oscar.create_flap(0x02, self.seq_num, snac_packet)
-            
             self.logger.info("Sending Rate Limits Acknowledgement")
-            self.logger.info(flap_packet, "Rate Ack FLAP packet:")
-            
-            self.writer.write(flap_packet)
-            await self.writer.drain()
+            flap_packet = await self.send_snac(0x0001, 0x0008)  # No additional data needed for this acknowledgement
+            self.logger.debug(f"Rate Ack FLAP packet: {flap_packet.hex()}")
             
             self.logger.info("Rate Limits Acknowledgement sent successfully")
         except Exception as e:
@@ -221,232 +368,280 @@ class AIMClient:
             import traceback
             traceback.print_exc()
     
+    async def handle_self_info(self, data, flags, request_id):
+        try:
+            screen_name, warning_level, tlvs, _ = self.oscar.read_user_info(data)
+            self.logger.debug(f"Own info: {screen_name}, warning level {warning_level}, TLVs {tlvs.types()}")
+        except Exception as e:
+            self.logger.error(f"Error parsing own info: {e}")
+    
     async def handle_motd(self, data, flags, request_id):
         self.logger.info("Received Message of the Day")
     
-    async def handle_icbm_error(self, data):
-        if len(data) < 10:
+    async def handle_icbm_error(self, data, request_id):
+        # 0x0004/0x0001: error code, optionally followed by TLVs; the SNAC
+        # request ID identifies the send it refers to.
+        if len(data) < 2:
             self.logger.error("Incomplete ICBM Error data")
             return
         
-        cookie = data[:8]
-        error_code, = struct.unpack('!H', data[8:10])
-        self.logger.error(f"ICBM Error: Cookie {cookie.hex()}, Error Code 0x{error_code:04x}")
-        
-        error_messages = {
-            0x0001: "Invalid ICBM parameters",
-            0x0002: "Service unavailable",
-            0x0003: "Client rate limit exceeded",
-            0x0004: "Sender too evil",
-            0x0005: "Receiver too evil",
-            }
-            
-        error_message = error_messages.get(error_code, "Unknown error")
-        self.logger.error(f"ICBM Error: {error_message}")
+        error_code, = U16.unpack_from(data)
+        entry = self.delivery.error(request_id, error_code)
+        recipient = f" sending to {entry.recipient}" if entry is not None else ""
+        self.logger.error(f"ICBM Error{recipient}: {SNAC_ERRORS.get(error_code, 'Unknown error')} (0x{error_code:04x})")
+    
+    async def handle_icbm_ack(self, data):
+        # 0x0004/0x000C host ack: cookie, channel, recipient
+        if len(data) < 8:
+            self.logger.error("Incomplete ICBM Acknowledgement")
+            return
+        entry = self.delivery.ack(bytes(data[:8]))
+        if entry is not None:
+            self.logger.info(f"Message to {entry.recipient} acknowledged")
+        else:
+            self.logger.info("Received ICBM Acknowledgement")
+    
+    async def handle_icbm_client_error(self, data):
+        # 0x0004/0x000B: cookie, channel, recipient, reason
+        try:
+            cookie, channel = ICBM_HEADER.unpack_from(data)
+            recipient_length = data[ICBM_HEADER.size]
+            offset = ICBM_HEADER.size + 1 + recipient_length
+            recipient = bytes(data[ICBM_HEADER.size + 1:offset]).decode('utf-8', errors='replace')
+            reason, = U16.unpack_from(data, offset)
+        except (IndexError, struct.error):
+            self.logger.error("Incomplete ICBM client error")
+            return
+        self.logger.warning(f"Client of {recipient} rejected ICBM on channel {channel}: reason 0x{reason:04x}")
+        self.delivery.fail(cookie, 0x000A, f"rejected by the recipient's client (reason 0x{reason:04x})")
     
     async def handle_incoming_im(self, data):
         try:
-            self.logger.debug(f"Handling incoming message. Raw data: {data.hex()}")
-        
-            offset = 0
-            
-            # Extract ICBM Cookie (8 bytes)
-            cookie = data[offset:offset+8]
-            offset += 8
-            self.logger.debug(f"ICBM Cookie: {cookie.hex()}")
-        
-            # Extract Channel ID (2 bytes)
-            channel = struct.unpack('!H', data[offset:offset+2])[0]
-            offset += 2
-            self.logger.debug(f"Channel: {channel}")
-        
-            if channel != 0x01:
-                self.logger.warning(f"Unsupported channel: {channel}")
-                return
-        
-            # Extract sender information
-            sender_length = data[offset]
-            offset += 1
-            sender = data[offset:offset + sender_length].decode('utf-8', errors='replace')
-            offset += sender_length
-            self.logger.info(f"Sender: {sender}")
-        
-            # Find HTML content
-            html_start = data.find(b'<HTML>')
-            html_end = data.find(b'</HTML>') + 7  # Include the closing tag
-        
-            self.logger.info(f"HTML content start: {html_start}, end: {html_end}")
-        
-            if html_start != -1 and html_end != -1:
-                html_content = data[html_start:html_end].decode('utf-8', errors='replace')
-                self.logger.info(f"HTML content: {html_content}")
-                
-                # Extract text content from HTML
-                message = re.sub('<[^<]+?>', '', html_content)
-                message = message.strip()
-        
-                self.logger.info(f"Extracted message: {message}")
-        
-                if self.message_callback:
-                    self.logger.info(f"Calling message callback with sender: {sender}, message: {message}")
-                    await self.message_callback(sender, message)
-                else:
-                    self.logger.warning("Message callback not set")
-            else:
-                self.logger.warning("No HTML content found in the incoming data")
-                self.logger.debug(f"Remaining data after sender: {data[offset:].hex()}")
-        
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"Handling incoming message. Raw data: {bytes(data).hex()}")
+            im = decode_incoming_im(data)
         except Exception as e:
             self.logger.error(f"Error parsing incoming message: {e}")
-            import traceback
-            traceback.print_exc()
+            return
+        
+        if im.channel != 0x01:
+            self.logger.warning(f"Unsupported channel: {im.channel}")
+            return
+        self.logger.info(f"Sender: {im.sender}")
+        if self.recent_ims.seen(im.sender, im.cookie):
+            self.logger.info(f"Dropping duplicate IM from {im.sender} (cookie {im.cookie.hex()})")
+            return
+        if im.text is None:
+            self.logger.warning(f"No message text in IM from {im.sender}")
+            return
+        self.logger.debug(f"Message HTML (charset 0x{im.charset:04x}): {im.html}")
+        self.logger.info(f"Extracted message: {im.text}")
+        
+        if self.message_callback:
+            self.logger.info(f"Calling message callback with sender: {im.sender}, message: {im.text}")
+            self.dispatcher.spawn(self.message_callback(im.sender, im.text))
+        else:
+            self.logger.warning("Message callback not set")
     
-    async def read_flap(self, timeout=30.0):
+    async def handle_typing(self, data):
         try:
-            # Read FLAP header
-            flap_header = await asyncio.wait_for(self.read_exact(6), timeout)
-            if len(flap_header) < 6:
-                self.logger.error(f"Incomplete FLAP header: {flap_header.hex()}")
+            typing = decode_typing(data)
+        except (ValueError, struct.error) as e:
+            self.logger.error(f"Error parsing typing notification: {e}")
+            return
+        self.logger.debug(f"Typing notification from {typing.sender}: state 0x{typing.state:04x}")
+        if self.typing_callback:
+            self.dispatcher.spawn(self.typing_callback(typing.sender, typing.state))
+    
+    def parse_tlvs(self, data):
+        return self.oscar.read_tlvs(data)
+
+    async def read_frames(self):
+        """Wait for data and return every FLAP it completes, or None on EOF."""
+        if self._pending_frames:
+            # Frames that arrived together with the last sign-on response
+            frames = list(self._pending_frames)
+            self._pending_frames.clear()
+            return frames
+        while True:
+            chunk = await self.reader.read(self.read_size)
+            if not chunk:
                 return None
+            self.last_received = time.monotonic()
+            frames = self.framer.feed(chunk)
+            if self.capture is not None:
+                self.capture_inbound(frames)
+            if frames:
+                return frames
     
-            channel, seq_num, data_length = struct.unpack('>BHH', flap_header[1:6])
-            self.logger.debug(f"FLAP Header: Channel {channel}, Sequence {seq_num}, Length {data_length}")
+    async def read_frame(self):
+        """Return the next FLAP on the current connection (used during sign-on)."""
+        while not self._pending_frames:
+            chunk = await self.reader.read(self.read_size)
+            if not chunk:
+                raise ConnectionError("Connection closed by server")
+            self.last_received = time.monotonic()
+            frames = self.framer.feed(chunk)
+            if self.capture is not None:
+                self.capture_inbound(frames)
+            self._pending_frames.extend(frames)
+        return self._pending_frames.popleft()
     
-            # Read FLAP data in chunks
-            flap_data = b""
-            chunk_size = 4096  # 4KB chunks
-            start_time = time.time()
-            while len(flap_data) < data_length:
-                remaining = min(chunk_size, data_length - len(flap_data))
-                try:
-                    chunk = await asyncio.wait_for(self.reader.read(remaining), 5.0)
-                except asyncio.TimeoutError:
-                    self.logger.warning(f"Timeout while reading FLAP data, got {len(flap_data)}/{data_length} bytes")
-                    break
-                if not chunk:
-                    self.logger.error("Connection closed while reading FLAP data")
-                    break
-                flap_data += chunk
-                self.logger.info(f"Read {len(chunk)} bytes, total {len(flap_data)}/{data_length}")
-                
-                # Check if we've exceeded the overall timeout
-                if time.time() - start_time > timeout:
-                    self.logger.error("Overall timeout while reading FLAP data")
-                    break
+    def capture_inbound(self, frames):
+        now = time.time()
+        for channel, seq_num, payload in frames:
+            self.capture.write_flap(INBOUND, channel, seq_num, payload, now)
     
-            full_flap = flap_header + flap_data
-            self.logger.debug(f"Partial FLAP packet ({len(full_flap)} bytes): {full_flap.hex()}")
-            return full_flap
+    def next_seq(self):
+        self.seq_num = (self.seq_num + 1) % 0x10000
+        return self.seq_num
     
-        except Exception as e:
-            self.logger.error(f"Error reading FLAP packet: {e}")
-            return None
+    def next_request_id(self):
+        self.request_id = self.request_id % 0x7FFFFFFF + 1
+        return self.request_id
     
-    def parse_tlvs(self, data):
-        tlvs = {}
-        offset = 0
-        data_len = len(data)
-        
-        while offset < data_len - 4:
-            try:
-                # Read Type and Length (2 bytes each)
-                tlv_type = struct.unpack('!H', data[offset:offset+2])[0]
-                tlv_length = struct.unpack('!H', data[offset+2:offset+4])[0]
-                offset += 4
-        
-                # Extract Value
-                tlv_value = data[offset:offset+tlv_length]
-                offset += tlv_length
-        
-                tlvs[tlv_type] = tlv_value
-                self.logger.debug(f"Found TLV: Type 0x{tlv_type:04X}, Length {tlv_length}")
-                self.logger.debug(f"TLV 0x{tlv_type:04X} value: {tlv_value.hex()}")
-        
-            except Exception as e:
-                self.logger.error(f"Error parsing TLV at offset {offset}: {e}")
-                break
-        
-        if offset != data_len:
-            self.logger.info(f"Finished reading TLVs. Total TLVs found: {len(tlvs)}")
-        else:
-            self.logger.info(f"Finished reading TLVs. Total TLVs found: {len(tlvs)}")
-        
-        return tlvs
-
-    async def read_exact(self, n):
-        data = b""
-        while len(data) < n:
-            chunk = await self.reader.read(n - len(data))
-            if not chunk:
-                break
-            data += chunk
-        return data
+    async def send_frame(self, frame, lane=CONTROL, family=None, subtype=None, key=None):
+        """Send an encoded frame; its FLAP sequence number is assigned here.
+        
+        Once connected to BOS everything goes through the send queue's writer
+        task; before that (sign-on) the frame is written directly.  After the
+        queue has stopped (disconnect, or a failed write) this raises
+        ConnectionError until the next sign-on.
+        """
+        if self.send_queue is not None:
+            if not self.send_queue.running:
+                error = self.send_queue.error
+                raise ConnectionError(f"Send queue failed: {error}" if error is not None else "Send queue stopped")
+            return await self.send_queue.send(frame, lane, family, subtype, key)
+        patch_seq(frame, self.next_seq())
+        if self.capture is not None:
+            self.capture.write(OUTBOUND, frame)
+        self.writer.write(frame)
+        await self.writer.drain()
+        return True
     
-    async def read_complete_flap(self, timeout=60.0):
-        try:
-            # Read FLAP header
-            flap_header = await asyncio.wait_for(self.read_exact(6), timeout)
-            if len(flap_header) < 6:
-                self.logger.info("No incoming FLAPs to process. Sending keep-alive.")
-                await self.send_keep_alive()
-                return None
-        
-            flap_id, channel, seq_num, data_length = struct.unpack('>BBHH', flap_header)
-            self.logger.debug(f"FLAP Header: ID 0x{flap_id:02x}, Channel {channel}, Sequence {seq_num}, Length {data_length}")
-        
-            if flap_id != 0x2a:
-                self.logger.warning(f"Invalid FLAP ID: 0x{flap_id:02x}")
-                return None
-        
-            # Read FLAP data
-            flap_data = await asyncio.wait_for(self.read_exact(data_length), timeout)
-            if len(flap_data) < data_length:
-                self.logger.warning(f"Incomplete FLAP data: expected {data_length}, got {len(flap_data)}")
-                return None
-        
-            full_flap = flap_header + flap_data
-            self.logger.debug(f"Complete FLAP packet ({len(full_flap)} bytes)")
-            self.logger.debug(f"FLAP packet: {full_flap.hex()}")
-            return full_flap
-        
-        except asyncio.TimeoutError:
-            self.logger.info("No incoming FLAPs to process. Sending keep-alive.")
-            await self.send_keep_alive()
-            return None
-        except Exception as e:
-            self.logger.error(f"Error reading FLAP packet: {e}")
-            return None
+    async def send_snac(self, family_id, subtype_id, body=b'', flags=0x0000, request_id=None, lane=CONTROL, key=None):
+        """Encode a SNAC into a single FLAP frame and send it."""
+        if request_id is None:
+            request_id = self.next_request_id()
+        frame = self.oscar.encode_snac_frame(family_id, subtype_id, flags, request_id, body)
+        await self.send_frame(frame, lane, family_id, subtype_id, key)
+        return frame
+    
+    async def start_send_queue(self):
+        await self.stop_send_queue()
+        self.send_queue = SendQueue(self.writer, self.next_seq, self.rate_limiter, logger=self.logger,
+                                    capture=self.capture)
+        self.send_queue.start()
+    
+    async def stop_send_queue(self):
+        if self.send_queue is not None:
+            await self.send_queue.stop()
     
     async def send_keep_alive(self):
         try:
-            self.seq_num = (self.seq_num + 1) % 0x10000
-            keep_alive_packet = self.oscar.create_flap(0x05, self.seq_num, b'')
-            self.writer.write(keep_alive_packet)
-            await self.writer.drain()
+            keep_alive_packet = bytearray(self.oscar.create_flap(0x05, 0))
+            await self.send_frame(keep_alive_packet)
             self.logger.info("Sent keep-alive packet")
             self.logger.debug(f"Keep-alive FLAP packet: {keep_alive_packet.hex()}")
+            return True
         except Exception as e:
             self.logger.error(f"Error sending keep-alive packet: {e}")
+            return False
         
     async def connect(self):
-        
-        reader, writer = await asyncio.open_connection(self.host, self.port)
-        self.reader, self.writer = reader, writer
-        self.logger.info(f"Connected to {self.host}:{self.port}")
-        
-        
-        await asyncio.sleep(0.5)
-        await self.authenticate()
-        await self.connect_to_bos()
-        
+        """Sign on: authenticate, then bring up the BOS connection.
+        
+        Each step waits for the server's actual response rather than a fixed
+        delay, under its own timeout from ``signon_timeouts``; a step that
+        fails or times out raises SignOnError.  Per-step durations end up in
+        ``signon_timings``.
+        """
+        await self.close()
+        self.send_queue = None  # sign-on writes directly until BOS starts a new queue
+        self.signon_timings = {}
+        started = time.perf_counter()
+        try:
+            await self.signon_step("auth_connect", self.open_connection(self.host, self.port))
+            self.logger.info(f"Connected to {self.host}:{self.port}")
+            await self.authenticate()
+            await self.connect_to_bos()
+        except BaseException:
+            await self.close()
+            raise
+        self.signon_timings["total"] = time.perf_counter() - started
+        self.state = "online"
+        if self.keepalive_interval:
+            self.keepalive.start()
+        self.logger.info("Signed on in {:.3f} s ({})".format(
+            self.signon_timings["total"],
+            ", ".join(f"{phase} {elapsed * 1000:.1f} ms" for phase, elapsed in self.signon_timings.items()
+                      if phase != "total")))
+    
+    async def signon_step(self, phase, awaitable):
+        """Await one sign-on step under its timeout and record how long it took."""
+        self.state = phase
+        timeout = self.signon_timeouts.get(phase, self.SIGNON_TIMEOUT)
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise SignOnError(phase, f"no response after {timeout:.1f} s") from None
+        except SignOnError:
+            raise
+        except Exception as e:
+            raise SignOnError(phase, str(e) or type(e).__name__) from e
+        self.signon_timings[phase] = time.perf_counter() - start
+        return result
+    
+    async def open_connection(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        try:
+            apply_socket_options(self.writer.get_extra_info('socket'), self.socket_options)
+        except OSError as e:
+            self.logger.warning(f"Could not set socket options: {e}")
+        self.framer.reset()
+        self._pending_frames.clear()
+        if self.capture is not None:
+            self.capture.new_connection()
+    
+    def drop_connection(self, reason):
+        """Abort the connection (e.g. a dead peer); the reader then stops with ``reason``."""
+        self.logger.warning(f"Dropping connection: {reason}")
+        self._drop_reason = reason
+        if self.writer is not None:
+            self.writer.transport.abort()
+    
+    async def close(self):
+        """Stop the reader and send queue and close the connection, if any."""
+        if self._reader_task is not None:
+            if not self._reader_task.done():
+                self._reader_task.cancel()
+                try:
+                    await self._reader_task
+                except asyncio.CancelledError:
+                    pass
+            self._reader_task = None
+        await self.keepalive.stop()
+        await self.stop_send_queue()
+        self.fail_snac_waiters(ConnectionError("Connection closed"))
+        self.fail_requests(ConnectionError("Connection closed"))
+        self.delivery.close()
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+        if self.capture is not None:
+            self.capture.flush()
+        self.state = "offline"
+    
     async def authenticate(self):
         # Receive connection acknowledge
-        flap_packet = await self.reader.read(10)
-        if len(flap_packet) < 10:
-            self.logger.error(f"Received invalid connection acknowledge packet: {flap_packet.hex()}")
-        else:
-            self.logger.debug(f"Received raw data: {flap_packet.hex()}")
-            self.logger.debug(f"\nConnection Acknowledge:\n {self.oscar.read_flap(flap_packet)}")
+        channel, _, hello = await self.signon_step("auth_hello", self.read_frame())
+        self.logger.debug(f"Connection Acknowledge on channel {channel}: {bytes(hello).hex()}")
         
         # Roasting the password using the roast_password method
         roasted_password = self.roast_password(self.password.encode('utf-8'))
@@ -459,7 +654,6 @@ class AIMClient:
         self.logger.debug(f"Encoded Username: {encoded_username.hex()}")
         
         # Create and send Authorization Request
-        self.seq_num = (self.seq_num + 1) % 0x10000
         protocol_version = struct.pack("!I", 0x00000001)
         tlv_screen_name = self.oscar.create_tlv(0x0001, self.username.encode('utf-8'))
         tlv_password = self.oscar.create_tlv(0x0002, roasted_password)
@@ -479,86 +673,38 @@ class AIMClient:
         # Log the full authorization request
         self.logger.debug(f"Authorization Request (auth_data): {auth_data.hex()}")
         
-        # FLAP Packet Header
-        channel = 0x01
-        data_len = len(auth_data)
-        flap_header = struct.pack("!BBH", 0x2A, channel, self.seq_num) + struct.pack("!H", data_len)
-        
-        # Complete FLAP Packet
-        flap_packet = flap_header + auth_data
-        
-        # Send and process through the reader
-        self.writer.write(flap_packet)
-        await self.writer.drain()
+        flap_packet = bytearray(self.oscar.create_flap(0x01, 0, auth_data))
+        await self.send_frame(flap_packet)
         self.logger.debug(f"\nSent Authorization Request: \n  {self.oscar.read_flap(flap_packet)}")
         
-        try:
-            # Receive and process server response
-            initial_response = await asyncio.wait_for(self.reader.read(1024), timeout=5.0)
-            self.logger.debug(f"Received initial raw data: {initial_response .hex()}")
-            if not await self.parse_authorization_response(initial_response):
-                self.logger.error("Authentication failed")
-                return False
-            return True
-        except asyncio.TimeoutError:
-            self.logger.error("Timeout while waiting for server response")
-            return False
-        except Exception as e:
-            self.logger.error(f"Error during authentication: {e}")
-            return False
+        # The reply carries the BOS address and cookie; the auth server is done with us after it
+        channel, _, response = await self.signon_step("auth_reply", self.read_frame())
+        self.logger.info(f"Authorization response on channel {channel}, Length {len(response)}")
+        self.writer.close()
+        self.writer = None
+        if not self.parse_authorization_response(response):
+            raise SignOnError("auth_reply", "Authentication failed")
+        return True
 
-    async def parse_authorization_response(self, initial_response):
-        response = initial_response
-        while len(response) < 6:
-            chunk = await self.reader.read(6 - len(response))
-            if not chunk:
-                raise ConnectionError("Connection closed while reading FLAP header")
-            response += chunk
-        
-        channel, length = struct.unpack('>BxH', response[1:5])
-        self.logger.info(f"FLAP Header: Channel {channel}, Length {length}")
-        
-        full_length = 6 + length
-        while len(response) < full_length:
-            chunk = await self.reader.read(full_length - len(response))
-            if not chunk:
-                break  # We'll process what we have instead of raising an exception
-            response += chunk
-            self.logger.debug(f"Received additional data: {chunk.hex()}")
-        
-        self.logger.debug(f"Full response received: {response.hex()}")
-        
-        data = response[6:]
-        index = 0
-        while index < len(data):
-            if index + 4 > len(data):
-                self.logger.error(f"Incomplete TLV at index {index}")
-                break
-            tlv_type, tlv_length = struct.unpack("!HH", data[index:index+4])
-            if index + 4 + tlv_length > len(data):
-                self.logger.error(f"Incomplete TLV value for type {tlv_type} at index {index}")
-                break
-            tlv_value = data[index+4:index+4+tlv_length]
-            
-            if tlv_type == 0x0005:
-                self.bos_server = tlv_value.decode('utf-8')
-                self.logger.info(f"BOS Server Address: {self.bos_server}")
-            elif tlv_type == 0x0006:
-                self.auth_cookie = tlv_value
-                self.logger.debug(f"Authorization Cookie: {self.auth_cookie.hex()}")
-            elif tlv_type == 0x0008:  # Error code
-                error_code = struct.unpack("!H", tlv_value)[0]
-                self.logger.error(f"Error Code: {error_code}")
-            elif tlv_type == 0x0004:  # Error URL
-                error_url = tlv_value.decode('utf-8')
-                self.logger.error(f"Error URL: {error_url}")
-            elif tlv_type == 0x000b:  # Error message
-                error_message = tlv_value.decode('utf-8')
-                self.logger.error(f"Error Message: {error_message}")
-            else:
-                self.logger.debug(f"Unknown TLV: Type {tlv_type:#06x}, Value: {tlv_value.hex()}")
-            
-            index += 4 + tlv_length
+    def parse_authorization_response(self, response):
+        """Read the BOS address and auth cookie out of an authorization reply FLAP payload."""
+        self.logger.debug(f"Full response received: {bytes(response).hex()}")
+        
+        tlvs = self.oscar.read_tlvs(response)
+        
+        bos_server = tlvs.get(0x0005)
+        if bos_server is not None:
+            self.bos_server = bos_server.decode('utf-8')
+            self.logger.info(f"BOS Server Address: {self.bos_server}")
+        if 0x0006 in tlvs:
+            self.auth_cookie = tlvs[0x0006]
+            self.logger.debug(f"Authorization Cookie: {self.auth_cookie.hex()}")
+        if 0x0008 in tlvs:  # Error code
+            self.logger.error(f"Error Code: {tlvs.get_u16(0x0008)}")
+        if 0x0004 in tlvs:  # Error URL
+            self.logger.error(f"Error URL: {tlvs[0x0004].decode('utf-8', errors='replace')}")
+        if 0x000b in tlvs:  # Error message
+            self.logger.error(f"Error Message: {tlvs[0x000b].decode('utf-8', errors='replace')}")
         
         if not self.bos_server or not self.auth_cookie:
             self.logger.error("Failed to extract BOS server or auth cookie")
@@ -567,102 +713,48 @@ class AIMClient:
         return True
 
     async def connect_to_bos(self):
-        if not self.bos_server:
-            self.logger.error("BOS server address not available")
-            return False
-        
-        try:
-            bos_server_parts = self.bos_server.split(':')
-            if len(bos_server_parts) != 2:
-                self.logger.error(f"Invalid BOS server address format: {self.bos_server}")
-                return False
-            bos_host, bos_port = bos_server_parts
-            bos_port = int(bos_port)
-            self.logger.info(f"Connecting to BOS Server at {bos_host}:{bos_port}")
-        
-            self.reader, self.writer = await asyncio.open_connection(bos_host, bos_port)
-            self.logger.info(f"Connected to BOS Server: {bos_host}:{bos_port}")
-        
-            # Wait for connection acknowledge
-            flap_packet = await self.read_flap(timeout=10.0)
-            if flap_packet:
-                self.logger.info("Received FLAP response from BOS server")
-                # Send BOS SignOn command with authorization cookie
-                return await self.send_bos_signon()
-            else:
-                self.logger.warning("Did not receive complete FLAP response from BOS server, but continuing...")
-                return await self.send_bos_signon()
-        
-        except Exception as e:
-            self.logger.error(f"Error connecting to BOS Server: {e}")
-            return False
+        bos_host, separator, bos_port = self.bos_server.rpartition(':')
+        if not separator or not bos_port.isdigit():
+            raise SignOnError("bos_connect", f"Invalid BOS server address format: {self.bos_server}")
+        bos_port = int(bos_port)
+        self.logger.info(f"Connecting to BOS Server at {bos_host}:{bos_port}")
+        
+        await self.signon_step("bos_connect", self.open_connection(bos_host, bos_port))
+        self.logger.info(f"Connected to BOS Server: {bos_host}:{bos_port}")
+        
+        # Wait for connection acknowledge
+        await self.signon_step("bos_hello", self.read_frame())
+        self.logger.info("Received FLAP response from BOS server")
+        
+        # From here on the reader task owns the socket and the handshake
+        # waits on the SNACs it dispatches.
+        server_ready = self.expect_snac(0x0001, 0x0003)
+        await self.start_send_queue()
+        await self.send_bos_signon()
+        self.start_reader()
+        await self.signon_step("server_ready", server_ready)
+        
+        # The rate info handler loads the rate classes and acks before this returns
+        await self.signon_step("rate_info", self.send_rate_request())
+        
+        await self.send_client_ready()
+        return True
     
     async def send_bos_signon(self):
-        self.seq_num = (self.seq_num + 1) % 0x10000
         fixed_data = struct.pack("!HH", 0x0000, 0x0001)
         tlv_auth_cookie = self.oscar.create_tlv(0x0006, self.auth_cookie)
         bos_signon_data = fixed_data + tlv_auth_cookie
-        flap_packet = self.oscar.create_flap(0x01, self.seq_num, bos_signon_data)
-        self.writer.write(flap_packet)
-        await self.writer.drain()
+        flap_packet = bytearray(self.oscar.create_flap(0x01, 0, bos_signon_data))
+        await self.send_frame(flap_packet)
         self.logger.debug(f"\nSent BOS SignOn: \n  {self.oscar.read_flap(flap_packet)}")
-        
-        response = await self.read_flap()
-        if response:
-            self.logger.debug(f"Received FLAP after BOS SignOn: {self.oscar.read_flap(response)}")
-        else:
-            self.logger.warning("Did not receive complete response after BOS SignOn, but continuing...")
-        
-        # Continue with the next steps of the authentication process
-        await self.send_rate_request()
-        return True
     
-    async def send_rate_request(self):
-        # Increment the sequence number for the request
-        self.seq_num = (self.seq_num + 1) % 0x10000
-        
-        # Create a SNAC header for the rate request
-        family_id = 0x0001  # Family ID for rate information
-        subtype_id = 0x0006  # Subtype ID for rate request
-        flags = 0x0000  # Flags for the request
-        request_id = self.seq_num  # Unique request ID
-        
-        # SNAC data for rate request (usually empty)
-        snac_data = b''
-        
-        # Create the SNAC packet
-        snac_packet = self.oscar.create_snac(family_id, subtype_id, flags, request_id, snac_data)
-        
-        # Create the FLAP packet with channel 0x02 (SNAC data)
-        flap_packet = self.oscar.create_flap(0x02, self.seq_num, snac_packet)
-        
-        # Send the FLAP packet
-        self.writer.write(flap_packet)
-        await self.writer.drain()
-        self.logger.debug(f"\nSent Rate Request: \n  {self.oscar.read_flap(flap_packet)}")
-        
-        # Receive and process the rate response
-        await asyncio.sleep(5) # Yuck!
-        response = await self.reader.read(4096)
-        self.logger.debug(f"Received raw data: {response.hex()}")
-        if len(response) > 0:
-            try:
-                # Parse the FLAP packet
-                flap_info = self.oscar.read_flap(response)
-                self.logger.debug(f"Received FLAP response: {flap_info}")
-                
-                # Process rate information and continue (e.g., client ready)
-                await self.send_client_ready()
-            except ValueError as e:
-                self.logger.error(f"Error parsing FLAP/SNAC: {e}")
+    async def send_rate_request(self, timeout=None):
+        # Family 0x0001 (OService), subtype 0x0006 (rate request); no SNAC data.
+        # Returns the 0x0001/0x0007 rate info reply.
+        self.logger.debug("Sending Rate Request")
+        return await self.request(0x0001, 0x0006, timeout=timeout)
     
     async def send_client_ready(self):
-        self.seq_num = (self.seq_num + 1) % 0x10000
-        family_id = 0x0001  # OService family
-        subtype_id = 0x0002  # Client Ready subtype
-        flags = 0x0000
-        request_id = self.seq_num
-        
         # Declare supported families and their versions
         supported_families = [
             (0x0001, 0x0003),  # OService
@@ -682,67 +774,69 @@ class AIMClient:
       
         client_ready_data = b''.join(struct.pack('>HH', family, version) for family, version in supported_families)
         
-        # Create and send the SNAC packet
-        snac_packet = self.oscar.create_snac(family_id, subtype_id, flags, request_id, client_ready_data)
-        flap_packet = self.oscar.create_flap(0x02, self.seq_num, snac_packet)
-        
         try:
-            self.writer.write(flap_packet)
-            await self.writer.drain()
+            # Family 0x0001 (OService), subtype 0x0002 (Client Ready)
+            flap_packet = await self.send_snac(0x0001, 0x0002, client_ready_data)
             self.logger.info("Sent Client Ready")
             self.logger.debug(f"\nClient Ready Flap: \n  {self.oscar.read_flap(flap_packet)}")
         except Exception as e:
             self.logger.error(f"Error sending Client Ready: {e}")
             raise
     
-    async def send_message(self, recipient, message):
+    async def send_message(self, recipient, message, escape=False):
+        """Send an IM. Returns a future that resolves to True once the server acks it.
+        
+        The message is tracked by its ICBM cookie until the host ack arrives;
+        rate-limit errors are retried (see DeliveryTracker).  The future
+        resolves to False if delivery ultimately fails.  ``message`` is
+        HTML unless ``escape`` is set; see ``icbm.message_html`` and
+        ``icbm.split_message`` for fitting long text into IMs.  Raises
+        ConnectionError if the connection is down.
+        """
         try:
             self.logger.info(f"Attempting to send message to {recipient}: {message}")
             
-            # Increment sequence number
-            self.seq_num = (self.seq_num + 1) % 0x10000
-            
             # Create ICBM Cookie (8 random bytes)
             cookie = os.urandom(8)
             
             # Convert newlines to HTML breaks and create HTML content
-            message_with_breaks = message.replace('\n', '<br>')
-            html_content = f'<HTML><BODY BGCOLOR="#ffffff"><FONT LANG="0">{message_with_breaks}</FONT></BODY></HTML>'
-            
-            # Create SNAC data
-            snac_data = (
-                cookie +  # ICBM Cookie
-                struct.pack('!H', 0x0001) +  # Channel
-                struct.pack('!B', len(recipient)) +  # Recipient length
-                recipient.encode('utf-8') +  # Recipient
-                struct.pack('!H', 0x0002) +  # TLV type
-                struct.pack('!H', len(html_content) + 0x0D) +  # TLV length
-                struct.pack('!B', 0x05) +  # Unknown byte
-                struct.pack('!H', 0x0100) +  # Unknown word
-                struct.pack('!H', 0x0101) +  # Unknown word
-                struct.pack('!H', 0x0101) +  # Unknown word
-                struct.pack('!H', len(html_content) + 0x04) +  # Message length + 4
-                struct.pack('!H', 0x0000) +  # Unknown word
-                struct.pack('!H', 0x0000) +  # Unknown word
-                html_content.encode('utf-8')  # Message content
-            )
-            
-            # Create SNAC packet
-            snac_packet = self.oscar.create_snac(0x0004, 0x0006, 0x0000, self.seq_num, snac_data)
-            
-            # Create FLAP packet
-            flap_packet = self.oscar.create_flap(0x02, self.seq_num, snac_packet)
-            
-            self.logger.info(f"Sending FLAP packet (length: {len(flap_packet)})")
-            self.logger.debug(f"FLAP packet contents: {flap_packet.hex()}")
+            html_content = message_html(message, escape)
             
-            # Send the packet
-            self.writer.write(flap_packet)
-            await self.writer.drain()
+            entry = self.delivery.track(cookie, recipient, html_content.encode('utf-8'))
+            await self.send_im(entry)
             
             self.logger.info(f"Message sent to {recipient}")
+            return entry.future
             
+        except ConnectionError as e:
+            self.delivery.discard(cookie)
+            self.logger.error(f"Message to {recipient} not sent: {e}")
+            raise
         except Exception as e:
             self.logger.error(f"Error sending message: {e}")
             import traceback
             traceback.print_exc()
+    
+    async def send_typing(self, recipient, state=TYPING_BEGUN):
+        """Send a typing notification (0x0004/0x0014) to ``recipient``.
+        
+        Goes out on the typing lane; a newer state for the same recipient
+        replaces one that hasn't been written yet. Returns False if the
+        notification was dropped as stale.
+        """
+        frame = self.typing_frames.frame(recipient, state)
+        return await self.send_frame(frame, TYPING, 0x0004, 0x0014, key=(0x0014, normalize_screen_name(recipient)))
+    
+    async def send_im(self, entry):
+        """Send (or re-send) a tracked IM under a fresh request ID, asking for a host ack."""
+        request_id = self.next_request_id()
+        # Encode FLAP + SNAC + ICBM body in one buffer
+        flap_packet = self.oscar.encode_im_frame(0, request_id, entry.cookie, entry.recipient.encode('utf-8'), entry.text,
+                                                 tlvs=((0x0003, b''),))
+        
+        self.logger.info(f"Sending FLAP packet (length: {len(flap_packet)})")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"FLAP packet contents: {flap_packet.hex()}")
+        
+        self.delivery.sent(entry, request_id)
+        await self.send_frame(flap_packet, IM, 0x0004, 0x0006)
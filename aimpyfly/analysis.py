@@ -0,0 +1,376 @@
+"""
+Offline traffic analysis over capture files (see ``aimpyfly.capture``), with NumPy.
+
+Record headers come from the capture's ``.idx`` sidecar in one read; record
+offsets follow from a cumulative sum, and the FLAP and SNAC headers of every
+record are gathered from the (memory-mapped) capture with fancy indexing and
+viewed through dtypes built from the same ``struct`` layouts the codec uses.
+Reports are then computed with array operations -- the only Python loops are
+over files, SNAC types and rate classes, never over packets.
+
+Needs NumPy (``pip install aimpyfly[analysis]``).  Command line:
+
+    python -m aimpyfly.analysis session.aimcap [--top 10] [--burst-gap 0.5] [--json]
+"""
+import argparse
+import json
+import os
+import struct
+
+from .capture import FILE_HEADER, INBOUND, OUTBOUND, RECORD_HEADER, capture_files
+from .oscar_protocol import FLAP_HEADER, FLAP_HEADER_SIZE, ICBM_CHANNEL_HEADER, SNAC_HEADER, SNAC_HEADER_SIZE
+from .rate_limit import RATE_CHANGE_CODES, RateLimiter
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+MAX_SCREEN_NAME = 16  # AIM screen names are at most 16 characters
+SIZE_BINS = (0, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 65536)
+
+_STRUCT_CODES = {'B': 'u1', 'H': 'u2', 'I': 'u4', 'Q': 'u8', 'd': 'f8'}
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("aimpyfly.analysis needs NumPy: pip install numpy")
+
+
+def struct_dtype(layout, names):
+    """NumPy dtype with the byte layout of a ``struct.Struct`` (pad bytes become void fields)."""
+    _require_numpy()
+    order = {'!': '>', '>': '>', '<': '<', '=': '=', '@': '='}.get(layout.format[0], '=')
+    fields = []
+    names = iter(names)
+    pad = 0
+    for code in layout.format.lstrip('!<>=@'):
+        if code == 'x':
+            fields.append((f"_pad{pad}", 'V1'))
+            pad += 1
+        else:
+            fields.append((next(names), order + _STRUCT_CODES[code]))
+    dtype = np.dtype(fields)
+    assert dtype.itemsize == layout.size
+    return dtype
+
+
+def record_dtype():
+    return struct_dtype(RECORD_HEADER, ('timestamp', 'direction', 'connection', 'length'))
+
+
+def flap_dtype():
+    return struct_dtype(FLAP_HEADER, ('start', 'channel', 'seq', 'flap_length'))
+
+
+def snac_dtype():
+    return struct_dtype(SNAC_HEADER, ('family', 'subtype', 'flags', 'request_id'))
+
+
+class Packets:
+    """Decoded headers of every FLAP in a capture, as parallel arrays.
+
+    ``records`` holds the capture record headers, ``flaps`` the FLAP headers
+    and ``snacs`` the SNAC headers (zero where a FLAP carries no SNAC;
+    ``is_snac`` says which do).  ``offsets`` are the FLAP offsets into
+    ``data``, the capture's bytes, which payload fields can be gathered from.
+    """
+
+    def __init__(self, records, flaps, snacs, is_snac, offsets, data):
+        self.records = records
+        self.flaps = flaps
+        self.snacs = snacs
+        self.is_snac = is_snac
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def snac_keys(self):
+        """``family << 16 | subtype`` per packet, -1 for non-SNAC FLAPs."""
+        keys = (self.snacs['family'].astype(np.int64) << 16) | self.snacs['subtype']
+        return np.where(self.is_snac, keys, -1)
+
+    def gather(self, rows, start, width):
+        """``width`` bytes from ``start`` bytes into the FLAPs of ``rows``, clipped to each FLAP (zero-filled)."""
+        offsets = self.offsets[rows]
+        ends = offsets + self.records['length'][rows]
+        index = offsets[:, None] + start + np.arange(width)
+        inside = index < ends[:, None]
+        return np.where(inside, self.data[np.minimum(index, len(self.data) - 1)], 0).astype(np.uint8)
+
+
+def _gather_view(data, offsets, width, dtype):
+    block = data[offsets[:, None] + np.arange(width)]
+    return np.ascontiguousarray(block, dtype=np.uint8).view(dtype).ravel()
+
+
+def load_capture_file(path, mmap=True):
+    """Decode the headers of one capture file (and its ``.idx``) into Packets."""
+    _require_numpy()
+    records = np.fromfile(path + '.idx', dtype=record_dtype())
+    data = np.memmap(path, dtype=np.uint8, mode='r') if mmap else np.fromfile(path, dtype=np.uint8)
+    if len(data) < FILE_HEADER.size:
+        raise ValueError(f"{path} is not a capture file")
+    sizes = RECORD_HEADER.size + records['length'].astype(np.int64)
+    # One start per record, so an empty file (as rotation leaves) gives empty arrays
+    starts = FILE_HEADER.size + np.cumsum(sizes) - sizes
+    complete = starts + sizes <= len(data)
+    # A record cut short by a crash, and index entries past it, are dropped
+    if not complete.all():
+        keep = np.argmin(complete)
+        records, starts = records[:keep], starts[:keep]
+    offsets = starts + RECORD_HEADER.size
+    if len(records) and not (data[offsets] == 0x2A).all():
+        raise ValueError(f"{path}: index does not match the capture")
+
+    flaps = _gather_view(data, offsets, FLAP_HEADER_SIZE, flap_dtype())
+    is_snac = (flaps['channel'] == 0x02) & (records['length'] >= FLAP_HEADER_SIZE + SNAC_HEADER_SIZE)
+    # Only SNAC rows have 10 header bytes to read; a short FLAP at the end of
+    # the file (a keep-alive, say) would otherwise be read past
+    snacs = np.zeros(len(records), dtype=snac_dtype())
+    snacs[is_snac] = _gather_view(data, offsets[is_snac] + FLAP_HEADER_SIZE, SNAC_HEADER_SIZE, snac_dtype())
+    return Packets(records, flaps, snacs, is_snac, offsets, data)
+
+
+def load_capture(path, mmap=True):
+    """Decode a capture, rotated files included (oldest first), into a list of Packets."""
+    files = capture_files(path)
+    if not files:
+        raise FileNotFoundError(path)
+    return [load_capture_file(file, mmap) for file in files]
+
+
+def _percentiles(values):
+    if len(values) == 0:
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(values, (50, 90, 99))
+    return {"count": int(len(values)), "min": float(values.min()), "p50": float(p50), "p90": float(p90),
+            "p99": float(p99), "max": float(values.max())}
+
+
+def _snac_name(key):
+    return f"0x{key >> 16:04x}/0x{key & 0xFFFF:04x}"
+
+
+def snac_mix(parts):
+    """Packet and byte counts per direction and SNAC type."""
+    report = {}
+    for direction, name in ((INBOUND, "inbound"), (OUTBOUND, "outbound")):
+        keys = np.concatenate([part.snac_keys[part.records['direction'] == direction] for part in parts])
+        lengths = np.concatenate([part.records['length'][part.records['direction'] == direction] for part in parts])
+        keys, lengths = keys[keys >= 0], lengths[keys >= 0]
+        unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        sizes = np.bincount(inverse, weights=lengths, minlength=len(unique))
+        order = np.argsort(-counts, kind='stable')
+        report[name] = [{"snac": _snac_name(int(unique[i])), "packets": int(counts[i]), "bytes": int(sizes[i])}
+                        for i in order]
+    return report
+
+
+def inter_arrival(parts, top=10):
+    """Inter-arrival time percentiles per inbound SNAC type (the ``top`` most frequent), in seconds."""
+    times = []
+    keys = []
+    for part in parts:
+        rows = (part.records['direction'] == INBOUND) & part.is_snac
+        times.append(part.records['timestamp'][rows])
+        keys.append(part.snac_keys[rows])
+    times, keys = np.concatenate(times), np.concatenate(keys)
+    order = np.lexsort((times, keys))
+    times, keys = times[order], keys[order]
+    gaps = np.diff(times)
+    same = keys[1:] == keys[:-1]
+    unique, counts = np.unique(keys, return_counts=True)
+    report = {"all": _percentiles(np.diff(np.sort(times)))}
+    for key in unique[np.argsort(-counts, kind='stable')][:top]:
+        report[_snac_name(int(key))] = _percentiles(gaps[same & (keys[1:] == key)])
+    return report
+
+
+def last_rate_info(parts):
+    """RateLimiter loaded from the last rate info reply (0x0001/0x0007) in the capture, or None."""
+    key = (0x0001 << 16) | 0x0007
+    for part in reversed(parts):
+        rows = np.flatnonzero((part.records['direction'] == INBOUND) & (part.snac_keys == key))
+        if len(rows):
+            row = rows[-1]
+            start = part.offsets[row] + FLAP_HEADER_SIZE + SNAC_HEADER_SIZE
+            payload = bytes(part.data[start:part.offsets[row] + part.records['length'][row]])
+            limiter = RateLimiter()
+            try:
+                limiter.load_rate_info(payload)
+            except (ValueError, struct.error):
+                return None
+            return limiter
+    return None
+
+
+def rate_class_bursts(parts, burst_gap=0.5):
+    """Outbound sends per rate class, grouped into bursts of sends less than ``burst_gap`` seconds apart.
+
+    Rate classes come from the capture's own rate info reply.  Rate change
+    notices (0x0001/0x000A) received are counted per class and code.
+    """
+    limiter = last_rate_info(parts)
+    if limiter is None:
+        return {}
+    mapped = np.array(sorted((family << 16) | subtype for family, subtype in limiter.snac_classes), dtype=np.int64)
+    class_of = np.array([limiter.snac_classes[(key >> 16, key & 0xFFFF)].class_id for key in mapped], dtype=np.int64)
+    times, keys = [], []
+    for part in parts:
+        rows = (part.records['direction'] == OUTBOUND) & part.is_snac
+        times.append(part.records['timestamp'][rows])
+        keys.append(part.snac_keys[rows])
+    times, keys = np.concatenate(times), np.concatenate(keys)
+    if len(mapped):
+        position = np.minimum(np.searchsorted(mapped, keys), len(mapped) - 1)
+        classes = np.where(mapped[position] == keys, class_of[position], -1)
+    else:
+        classes = np.full(len(keys), -1)
+
+    changes = {}
+    change_key = (0x0001 << 16) | 0x000A
+    for part in parts:
+        rows = np.flatnonzero((part.records['direction'] == INBOUND) & (part.snac_keys == change_key))
+        if len(rows):
+            fields = part.gather(rows, FLAP_HEADER_SIZE + SNAC_HEADER_SIZE, 4)
+            codes = (fields[:, 0].astype(np.int64) << 8) | fields[:, 1]
+            class_ids = (fields[:, 2].astype(np.int64) << 8) | fields[:, 3]
+            for class_id, code in zip(*np.unique(np.stack([class_ids, codes]), axis=1)):
+                count = int(((class_ids == class_id) & (codes == code)).sum())
+                name = RATE_CHANGE_CODES.get(int(code), f"0x{int(code):04x}")
+                changes.setdefault(int(class_id), {})[name] = count
+
+    report = {}
+    for class_id, rate_class in sorted(limiter.classes.items()):
+        sent = np.sort(times[classes == class_id])
+        gaps = np.diff(sent)
+        # A burst starts wherever the gap to the previous send is at least burst_gap
+        burst_ids = np.concatenate(([0], np.cumsum(gaps >= burst_gap))) if len(sent) else np.zeros(0, dtype=np.int64)
+        sizes = np.bincount(burst_ids) if len(sent) else np.zeros(0, dtype=np.int64)
+        report[class_id] = {
+            "limits_ms": {"alert": rate_class.alert, "limit": rate_class.limit, "disconnect": rate_class.disconnect,
+                          "window": rate_class.window},
+            "sends": int(len(sent)),
+            "bursts": int((sizes > 1).sum()),
+            "burst_size": _percentiles(sizes[sizes > 1]),
+            "gap_ms": _percentiles(gaps * 1000.0),
+            "rate_changes": changes.get(class_id, {}),
+        }
+    return report
+
+
+def _screen_names(part, rows, offset):
+    """Screen names (length byte then name) at ``offset`` into the FLAPs of ``rows``."""
+    fields = part.gather(rows, offset, 1 + MAX_SCREEN_NAME)
+    lengths = np.minimum(fields[:, 0], MAX_SCREEN_NAME)
+    names = np.where(np.arange(MAX_SCREEN_NAME) < lengths[:, None], fields[:, 1:], 0)
+    # Fold case and drop spaces the way the service does, still as arrays
+    names = np.where((names >= ord('A')) & (names <= ord('Z')), names + 32, names)
+    names = np.where(names == ord(' '), 0, names)
+    packed = np.zeros_like(names)
+    keep = names != 0
+    position = np.cumsum(keep, axis=1) - 1
+    packed[np.nonzero(keep)[0], position[keep]] = names[keep]
+    return np.ascontiguousarray(packed).view(f'S{MAX_SCREEN_NAME}').ravel()
+
+
+def top_talkers(parts, top=10):
+    """Screen names sending us the most IMs (0x0004/0x0007) and receiving the most from us (0x0004/0x0006)."""
+    name_offset = FLAP_HEADER_SIZE + SNAC_HEADER_SIZE + ICBM_CHANNEL_HEADER.size - 1
+    report = {}
+    for direction, key, label in ((INBOUND, 0x00040007, "senders"), (OUTBOUND, 0x00040006, "recipients")):
+        names, sizes = [], []
+        for part in parts:
+            rows = np.flatnonzero((part.records['direction'] == direction) & (part.snac_keys == key))
+            names.append(_screen_names(part, rows, name_offset))
+            sizes.append(part.records['length'][rows])
+        names, sizes = np.concatenate(names), np.concatenate(sizes)
+        unique, inverse, counts = np.unique(names, return_inverse=True, return_counts=True)
+        volume = np.bincount(inverse, weights=sizes, minlength=len(unique))
+        order = np.argsort(-counts, kind='stable')[:top]
+        report[label] = [{"screen_name": unique[i].decode('utf-8', errors='replace'), "ims": int(counts[i]),
+                          "bytes": int(volume[i])} for i in order]
+    return report
+
+
+def message_sizes(parts):
+    """FLAP size distribution of IMs received and sent, with a histogram over SIZE_BINS."""
+    report = {}
+    for direction, key, label in ((INBOUND, 0x00040007, "received"), (OUTBOUND, 0x00040006, "sent")):
+        sizes = np.concatenate([part.records['length'][(part.records['direction'] == direction) &
+                                                       (part.snac_keys == key)] for part in parts])
+        histogram, _ = np.histogram(sizes, bins=SIZE_BINS)
+        report[label] = {**_percentiles(sizes),
+                         "histogram": {f"<{upper}": int(count)
+                                       for upper, count in zip(SIZE_BINS[1:], histogram) if count}}
+    return report
+
+
+def analyze(path, top=10, burst_gap=0.5, mmap=True):
+    """Every report for the capture at ``path``."""
+    parts = load_capture(path, mmap)
+    times = np.concatenate([part.records['timestamp'] for part in parts])
+    return {
+        "files": len(parts),
+        "packets": int(sum(len(part) for part in parts)),
+        "bytes": int(sum(int(part.records['length'].sum()) for part in parts)),
+        "span_seconds": float(times.max() - times.min()) if len(times) else 0.0,
+        "snac_mix": snac_mix(parts),
+        "inter_arrival": inter_arrival(parts, top),
+        "rate_classes": rate_class_bursts(parts, burst_gap),
+        "top_talkers": top_talkers(parts, top),
+        "message_sizes": message_sizes(parts),
+    }
+
+
+def _print_report(report):
+    print(f"{report['packets']} packets, {report['bytes']} bytes over {report['span_seconds']:.1f} s "
+          f"({report['files']} file{'s' if report['files'] != 1 else ''})")
+    for direction, rows in report["snac_mix"].items():
+        print(f"\nSNAC mix, {direction}:")
+        for row in rows:
+            print(f"  {row['snac']}  {row['packets']:>9}  {row['bytes']:>12} bytes")
+    print("\nInter-arrival (s), inbound:")
+    for name, stats in report["inter_arrival"].items():
+        if stats["count"]:
+            print(f"  {name:15} n={stats['count']:<8} p50 {stats['p50']:.4f}  p99 {stats['p99']:.4f}  max {stats['max']:.4f}")
+    print("\nRate classes, outbound:")
+    for class_id, stats in report["rate_classes"].items():
+        burst = stats["burst_size"]
+        print(f"  class {class_id}: {stats['sends']} sends, {stats['bursts']} bursts"
+              + (f" (p50 {burst['p50']:.0f}, max {burst['max']:.0f} SNACs)" if burst["count"] else "")
+              + (f", changes {stats['rate_changes']}" if stats["rate_changes"] else ""))
+    for label, rows in report["top_talkers"].items():
+        print(f"\nTop {label}:")
+        for row in rows:
+            print(f"  {row['screen_name']:16} {row['ims']:>7} IMs  {row['bytes']:>10} bytes")
+    print("\nIM sizes (FLAP bytes):")
+    for label, stats in report["message_sizes"].items():
+        if stats["count"]:
+            print(f"  {label:8} n={stats['count']:<8} p50 {stats['p50']:.0f}  p99 {stats['p99']:.0f}  max {stats['max']:.0f}"
+                  f"  {stats['histogram']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Traffic reports over an aimpyfly capture")
+    parser.add_argument("capture", help="capture path as given to CaptureWriter (rotated files are included)")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--burst-gap", type=float, default=0.5, help="seconds between sends that end a burst")
+    parser.add_argument("--no-mmap", action="store_true", help="read the files instead of memory-mapping them")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    if not os.path.exists(args.capture):
+        parser.error(f"{args.capture} does not exist")
+    report = analyze(args.capture, args.top, args.burst_gap, not args.no_mmap)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
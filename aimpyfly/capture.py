@@ -0,0 +1,251 @@
+"""
+Wire capture: raw FLAPs with timestamps and direction, in a compact binary file.
+
+A capture file starts with ``FILE_HEADER`` (magic, version) and holds one
+record per FLAP: ``RECORD_HEADER`` (unix time, direction, connection
+number, FLAP length, little-endian) followed by the FLAP exactly as it
+crossed the wire, header included.  Every record header is also appended
+to a sidecar index (``<path>.idx``), a headerless run of fixed-size
+entries, so tools can load or memory-map the whole index in one call and
+find each record's offset with a cumulative sum instead of walking the
+file.
+
+Files rotate like logging's RotatingFileHandler: past ``max_bytes`` the
+current file becomes ``<path>.1``, older ones shift up, and anything beyond
+``backups`` is deleted, so a capture left running is a bounded ring.
+
+The roasted password in the sign-on request is blanked before it is
+written; the BOS cookie and message contents are captured as sent.
+"""
+import asyncio
+import logging
+import os
+import struct
+import time
+from typing import NamedTuple
+
+from .log_utils import get_custom_logger
+from .oscar_protocol import FLAP_HEADER, FLAP_HEADER_SIZE, TLV_HEADER
+
+FILE_MAGIC = b'AIMCAP'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<6sH')       # magic, version
+RECORD_HEADER = struct.Struct('<dBxHI')   # unix time, direction, connection, FLAP length
+
+INBOUND = 0
+OUTBOUND = 1
+
+
+class CaptureRecord(NamedTuple):
+    timestamp: float
+    direction: int
+    connection: int
+    frame: bytes    # the whole FLAP, header included
+
+
+def _redact_signon(frame):
+    """Blank the password TLV (0x0002) of an outbound channel 1 sign-on FLAP."""
+    frame = bytearray(frame)
+    offset = FLAP_HEADER_SIZE + 4  # FLAP header, protocol version
+    while offset + TLV_HEADER.size <= len(frame):
+        tlv_type, length = TLV_HEADER.unpack_from(frame, offset)
+        offset += TLV_HEADER.size
+        if tlv_type == 0x0002:
+            frame[offset:offset + length] = bytes(length)
+        offset += length
+    return frame
+
+
+class CaptureWriter:
+    """Appends FLAPs to a rotating capture file and its index."""
+
+    def __init__(self, path, max_bytes=64 * 2 ** 20, backups=3, clock=time.time, logger=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.clock = clock
+        self.logger = logger or get_custom_logger(name="AIMCapture", level=logging.WARNING)
+        self.connection = 0
+        self.records = 0
+        self.rotations = 0
+        self._data = None
+        self._index = None
+        self._size = 0
+        self._open()
+
+    def _open(self):
+        self._data = open(self.path, 'ab')
+        self._index = open(self.path + '.idx', 'ab')
+        self._size = self._data.tell()
+        if self._size == 0:
+            self._data.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION))
+            self._size = FILE_HEADER.size
+
+    def new_connection(self):
+        """Number the records that follow as a new connection."""
+        self.connection = (self.connection + 1) % 0x10000
+        return self.connection
+
+    def write(self, direction, frame, timestamp=None):
+        """Record one encoded FLAP (header included)."""
+        if self._data is None:
+            return
+        if direction == OUTBOUND and frame[1] == 0x01 and len(frame) > FLAP_HEADER_SIZE + 4:
+            frame = _redact_signon(frame)
+        header = RECORD_HEADER.pack(self.clock() if timestamp is None else timestamp,
+                                    direction, self.connection, len(frame))
+        self._data.write(header)
+        self._data.write(frame)
+        self._index.write(header)
+        self._size += len(header) + len(frame)
+        self.records += 1
+        if self._size >= self.max_bytes:
+            self.rotate()
+
+    def write_flap(self, direction, channel, seq_num, payload, timestamp=None):
+        """Record a FLAP given as its header fields and payload (as the framer returns it)."""
+        if self._data is None:
+            return
+        if direction == OUTBOUND and channel == 0x01:
+            self.write(direction, FLAP_HEADER.pack(0x2A, channel, seq_num, len(payload)) + bytes(payload), timestamp)
+            return
+        header = RECORD_HEADER.pack(self.clock() if timestamp is None else timestamp,
+                                    direction, self.connection, FLAP_HEADER_SIZE + len(payload))
+        self._data.write(header)
+        self._data.write(FLAP_HEADER.pack(0x2A, channel, seq_num, len(payload)))
+        self._data.write(payload)
+        self._index.write(header)
+        self._size += len(header) + FLAP_HEADER_SIZE + len(payload)
+        self.records += 1
+        if self._size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self._close_files()
+        for suffix in ('', '.idx'):
+            for n in range(self.backups, 0, -1):
+                source = f"{self.path}.{n - 1}{suffix}" if n > 1 else f"{self.path}{suffix}"
+                target = f"{self.path}.{n}{suffix}"
+                if os.path.exists(source):
+                    os.replace(source, target)
+            if self.backups == 0 and os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+        self.rotations += 1
+        self._open()
+
+    def flush(self):
+        if self._data is not None:
+            self._data.flush()
+            self._index.flush()
+
+    def _close_files(self):
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+
+    def close(self):
+        self._close_files()
+
+    def metrics(self):
+        return {"records": self.records, "bytes": self._size, "rotations": self.rotations}
+
+
+def capture_files(path):
+    """The files of a rotated capture, oldest first."""
+    files = []
+    n = 1
+    while os.path.exists(f"{path}.{n}"):
+        files.append(f"{path}.{n}")
+        n += 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_capture(path):
+    """Yield the CaptureRecords of one capture file; a truncated last record is ignored."""
+    with open(path, 'rb') as f:
+        magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        if version != FILE_VERSION:
+            raise ValueError(f"{path}: unsupported capture version {version}")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, direction, connection, length = RECORD_HEADER.unpack(header)
+            frame = f.read(length)
+            if len(frame) < length:
+                return
+            yield CaptureRecord(timestamp, direction, connection, frame)
+
+
+class _DiscardWriter:
+    """Stands in for the transport while replaying, so handlers can 'send' replies."""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    def write(self, data):
+        self.frames += 1
+        self.bytes += len(data)
+
+    def writelines(self, frames):
+        for frame in frames:
+            self.write(frame)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+async def replay(client, path, realtime=False, speed=1.0, connection=None):
+    """Feed the inbound FLAPs of a capture through ``client``'s decode and dispatch path.
+
+    ``path`` is a capture as given to CaptureWriter; rotated files are replayed
+    oldest first.  As fast as possible by default, or with ``realtime`` at the
+    captured pace (divided by ``speed``).  Anything the handlers send is
+    discarded.  ``connection`` restricts the replay to one connection number.
+    Returns replay statistics.
+    """
+    writer = client.writer
+    client.writer = _DiscardWriter()
+    client.dispatcher.start()
+    replayed = skipped = 0
+    first = None
+    started = time.perf_counter()
+    try:
+        for file in capture_files(path):
+            for record in read_capture(file):
+                if record.direction != INBOUND or (connection is not None and record.connection != connection):
+                    skipped += 1
+                    continue
+                if realtime:
+                    if first is None:
+                        first = record.timestamp
+                    delay = (record.timestamp - first) / speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                _, channel, seq_num, _ = FLAP_HEADER.unpack_from(record.frame)
+                await client.dispatch_frame(channel, seq_num, memoryview(record.frame)[FLAP_HEADER_SIZE:])
+                replayed += 1
+        await client.dispatcher.stop()
+    finally:
+        discarded, client.writer = client.writer, writer
+    elapsed = time.perf_counter() - started
+    return {
+        "replayed": replayed,
+        "skipped": skipped,
+        "elapsed": elapsed,
+        "frames_per_sec": replayed / elapsed if elapsed else 0.0,
+        "frames_sent": discarded.frames,
+    }
@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+
+
+def normalize_screen_name(screen_name):
+    """Screen names compare case- and space-insensitively."""
+    return screen_name.replace(' ', '').lower()
+
+
+class RecentCookies:
+    """Bounded, time-windowed LRU of recently seen ``(sender, cookie)`` pairs.
+
+    ``seen`` is O(1): entries are kept in arrival order, so expiring old ones
+    only ever pops from the front.  At most ``maxsize`` pairs are held; a
+    duplicate is recognised if it arrives within ``window`` seconds of the
+    original (and before the original was pushed out by newer traffic).
+    """
+
+    def __init__(self, maxsize=4096, window=300.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.window = window
+        self.clock = clock
+        self._seen = OrderedDict()
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def seen(self, sender, cookie):
+        """Record a message. Returns True if it is a duplicate of a recent one."""
+        now = self.clock()
+        entries = self._seen
+        deadline = now - self.window
+        while entries:
+            oldest = next(iter(entries.values()))
+            if oldest >= deadline:
+                break
+            entries.popitem(last=False)
+
+        key = (normalize_screen_name(sender), bytes(cookie))
+        if key in entries:
+            self.duplicates += 1
+            return True
+        entries[key] = now
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        return False
+
+    def clear(self):
+        self._seen.clear()
+
+    def metrics(self):
+        return {
+            "size": len(self._seen),
+            "maxsize": self.maxsize,
+            "window": self.window,
+            "duplicates": self.duplicates,
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+
+from .log_utils import get_custom_logger
+from .metrics import TimingStats
+from .oscar_protocol import SNAC_ERRORS
+
+# ICBM send errors worth another attempt: the server or the client side of
+# the rate limit, or a service that is only briefly unavailable.
+RETRYABLE_ERRORS = frozenset({
+    0x0002,  # Server rate limit exceeded
+    0x0003,  # Client rate limit exceeded
+    0x0005,  # Requested service unavailable
+    0x0017,  # Server queue full
+})
+
+
+class OutboundIM:
+    __slots__ = ('cookie', 'recipient', 'text', 'first_sent', 'last_sent', 'attempts', 'request_id', 'future',
+                 'deadline')
+
+    def __init__(self, cookie, recipient, text, future):
+        self.cookie = cookie
+        self.recipient = recipient
+        self.text = text
+        self.first_sent = None
+        self.last_sent = None
+        self.attempts = 0
+        self.request_id = None
+        self.future = future
+        self.deadline = None
+
+
+class DeliveryTracker:
+    """In-flight table for outbound IMs, keyed by ICBM cookie.
+
+    Each IM is sent requesting a host ack (0x0004/0x000C), which completes
+    its entry.  An ICBM error (0x0004/0x0001, matched by SNAC request ID)
+    with a retryable code re-sends the same cookie after an exponential
+    backoff, up to ``max_attempts`` sends; anything else fails the entry.
+    An entry not acknowledged within ``ack_timeout`` of its latest send (or
+    of being tracked, if it never went out) expires on its own timer, so
+    callers awaiting it are released and servers that never ack don't grow
+    the table.  Every entry's future resolves to
+    True when delivered and False otherwise.
+    """
+
+    def __init__(self, resend, max_attempts=4, retry_delay=1.0, ack_timeout=60.0, logger=None, clock=time.monotonic):
+        self.resend = resend
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.ack_timeout = ack_timeout
+        self.clock = clock
+        self.logger = logger or get_custom_logger(name="AIMDelivery", level=logging.WARNING)
+        self.in_flight = {}
+        self._by_request = {}
+        self._retries = set()
+
+        self.latency = TimingStats()
+        self.tracked = 0
+        self.delivered = 0
+        self.retried = 0
+        self.expired = 0
+        self.failures = {}
+
+    def __len__(self):
+        return len(self.in_flight)
+
+    def track(self, cookie, recipient, text):
+        """Start tracking an IM. Returns its entry; ``entry.future`` resolves on delivery or failure."""
+        entry = OutboundIM(cookie, recipient, text, asyncio.get_running_loop().create_future())
+        self.in_flight[cookie] = entry
+        self._arm(entry)
+        self.tracked += 1
+        return entry
+
+    def sent(self, entry, request_id):
+        """Record that an attempt for ``entry`` went out under ``request_id``."""
+        now = self.clock()
+        if entry.first_sent is None:
+            entry.first_sent = now
+        entry.last_sent = now
+        entry.attempts += 1
+        self._by_request.pop(entry.request_id, None)
+        entry.request_id = request_id
+        self._by_request[request_id] = entry.cookie
+        self._arm(entry)
+
+    def ack(self, cookie):
+        entry = self._finish(cookie)
+        if entry is None:
+            return None
+        self.delivered += 1
+        if entry.first_sent is not None:
+            self.latency.add(self.clock() - entry.first_sent)
+        entry.future.set_result(True)
+        return entry
+
+    def error(self, request_id, code):
+        """Handle an ICBM error for the send with ``request_id``.
+
+        Returns the entry, or None if the request was not a tracked IM.
+        """
+        cookie = self._by_request.get(request_id)
+        entry = self.in_flight.get(cookie)
+        if entry is None:
+            return None
+        if code in RETRYABLE_ERRORS and entry.attempts < self.max_attempts:
+            delay = self.retry_delay * (2 ** (entry.attempts - 1))
+            self.retried += 1
+            self.logger.warning(f"IM to {entry.recipient} failed ({SNAC_ERRORS.get(code, f'0x{code:04x}')}), retrying in {delay:.1f} s (attempt {entry.attempts + 1}/{self.max_attempts})")
+            task = asyncio.create_task(self._retry(entry, delay))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+        else:
+            self.fail(cookie, code)
+        return entry
+
+    def fail(self, cookie, code, description=None):
+        entry = self._finish(cookie)
+        if entry is None:
+            return None
+        self.failures[code] = self.failures.get(code, 0) + 1
+        if description is None:
+            description = SNAC_ERRORS.get(code, f'error 0x{code:04x}')
+        self.logger.error(f"IM to {entry.recipient} not delivered after {entry.attempts} attempts: {description}")
+        entry.future.set_result(False)
+        return entry
+
+    def discard(self, cookie):
+        """Stop tracking an IM that never went out; its future is cancelled."""
+        entry = self._finish(cookie)
+        if entry is not None:
+            entry.future.cancel()
+        return entry
+
+    def _arm(self, entry):
+        if entry.deadline is not None:
+            entry.deadline.cancel()
+        entry.deadline = asyncio.get_running_loop().call_later(self.ack_timeout, self._expire, entry.cookie)
+
+    def _expire(self, cookie):
+        entry = self._finish(cookie)
+        if entry is None:
+            return
+        self.expired += 1
+        self.logger.warning(f"IM to {entry.recipient} not acknowledged within {self.ack_timeout:.0f} s")
+        entry.future.set_result(False)
+
+    def close(self):
+        """Stop pending retries and resolve every in-flight entry as undelivered."""
+        for task in list(self._retries):
+            task.cancel()
+        for cookie in list(self.in_flight):
+            self._finish(cookie).future.set_result(False)
+
+    async def _retry(self, entry, delay):
+        await asyncio.sleep(delay)
+        if entry.cookie in self.in_flight:
+            try:
+                await self.resend(entry)
+            except Exception as e:
+                self.logger.error(f"Error re-sending IM to {entry.recipient}: {e}")
+
+    def _finish(self, cookie):
+        entry = self.in_flight.pop(cookie, None)
+        if entry is not None:
+            self._by_request.pop(entry.request_id, None)
+            if entry.deadline is not None:
+                entry.deadline.cancel()
+                entry.deadline = None
+        return entry
+
+    def metrics(self):
+        return {
+            "in_flight": len(self.in_flight),
+            "tracked": self.tracked,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "expired": self.expired,
+            "failed": sum(self.failures.values()),
+            "failures": {f"0x{code:04x}": count for code, count in sorted(self.failures.items())},
+            "latency": self.latency.snapshot(),
+        }
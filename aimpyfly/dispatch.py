@@ -0,0 +1,245 @@
+import asyncio
+import logging
+from collections import deque
+from typing import NamedTuple
+
+from .log_utils import get_custom_logger
+
+# Backpressure policies applied when the event queue is full.
+BLOCK = "block"              # reader waits until the dispatcher catches up
+DROP_OLDEST = "drop_oldest"  # evict the oldest droppable event to make room
+SHED = "shed"                # discard the incoming droppable event
+BACKPRESSURE_POLICIES = (BLOCK, DROP_OLDEST, SHED)
+
+
+class FlapEvent(NamedTuple):
+    channel: int
+    seq_num: int
+    data: bytes
+
+
+class SnacEvent(NamedTuple):
+    family: int
+    subtype: int
+    flags: int
+    request_id: int
+    data: bytes
+
+
+_STOP = object()
+
+
+class EventQueue:
+    """Bounded FIFO between the socket reader and the dispatcher.
+
+    Only events put with ``droppable=True`` are subject to the backpressure
+    policy.  Control events (rate changes, server notices, keep-alives) are
+    always admitted, even past ``maxsize``, so protocol housekeeping keeps
+    flowing while conversations back up.
+    """
+
+    def __init__(self, maxsize=1024, policy=BLOCK):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy!r}")
+        if maxsize < 1:
+            raise ValueError("Event queue size must be at least 1")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.shed = 0
+        self.blocked = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def full(self):
+        return len(self._items) >= self.maxsize
+
+    async def put(self, event, droppable=False):
+        """Enqueue an event. Returns False if the event was shed."""
+        if droppable:
+            while self.full():
+                if self.policy == SHED:
+                    self.shed += 1
+                    return False
+                if self.policy == DROP_OLDEST and self._drop_oldest():
+                    break
+                self.blocked += 1
+                self._not_full.clear()
+                await self._not_full.wait()
+        self._append(event, droppable)
+        return True
+
+    def put_nowait(self, event):
+        """Enqueue a control event without waiting or applying the policy."""
+        self._append(event, False)
+
+    def close(self):
+        """Queue the sentinel that tells the consumer to stop."""
+        self._items.append((_STOP, False))
+        self._not_empty.set()
+
+    def _append(self, event, droppable):
+        self._items.append((event, droppable))
+        self.enqueued += 1
+        if len(self._items) > self.high_water:
+            self.high_water = len(self._items)
+        self._not_empty.set()
+
+    def _drop_oldest(self):
+        for index, (_, droppable) in enumerate(self._items):
+            if droppable:
+                del self._items[index]
+                self.dropped += 1
+                return True
+        return False
+
+    async def get(self):
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        event, _ = self._items.popleft()
+        if len(self._items) < self.maxsize:
+            self._not_full.set()
+        return event
+
+    def metrics(self):
+        return {
+            "depth": len(self._items),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "shed": self.shed,
+            "blocked": self.blocked,
+        }
+
+
+class EventDispatcher:
+    """Runs protocol handlers off the socket reader's task.
+
+    The reader only decodes frames and calls :meth:`put`.  A single consumer
+    task feeds each event to ``handler`` in arrival order; handlers hand slow
+    application work (message callbacks) to :meth:`spawn`, which runs it as
+    its own task.  At most ``max_tasks`` spawned tasks run at once.  Past the
+    cap, callbacks wait in a backlog of up to ``maxsize`` and start as tasks
+    finish; the consumer itself never waits on them, so control SNACs keep
+    flowing.  A full backlog gets the queue's backpressure policy: ``shed``
+    discards the new callback, ``drop_oldest`` the oldest waiting one, and
+    ``block`` holds the reader's next droppable event until there is room.
+    """
+
+    def __init__(self, handler, maxsize=1024, policy=BLOCK, max_tasks=64, logger=None):
+        self.handler = handler
+        self.queue = EventQueue(maxsize, policy)
+        self.max_tasks = max_tasks
+        self.max_backlog = maxsize
+        self._tasks = set()
+        self._backlog = deque()
+        self._backlog_room = asyncio.Event()
+        self._backlog_room.set()
+        self._consumer = None
+        self.processed = 0
+        self.spawned = 0
+        self.callbacks_shed = 0
+        self.callbacks_dropped = 0
+        self.handler_errors = 0
+        self.logger = logger or get_custom_logger(name="AIMDispatch", level=logging.WARNING)
+
+    @property
+    def running(self):
+        return self._consumer is not None and not self._consumer.done()
+
+    def start(self):
+        if not self.running:
+            self._consumer = asyncio.create_task(self._run())
+
+    async def put(self, event, droppable=False):
+        if droppable and self.queue.policy == BLOCK:
+            while len(self._backlog) >= self.max_backlog:
+                self.queue.blocked += 1
+                self._backlog_room.clear()
+                await self._backlog_room.wait()
+        return await self.queue.put(event, droppable)
+
+    async def stop(self):
+        """Let the consumer finish queued events, then stop it.
+
+        Spawned handler tasks are left running, and backlogged callbacks still
+        start as they finish; they belong to conversations that outlive the
+        connection.
+        """
+        if not self.running:
+            return
+        self.queue.close()
+        await self._consumer
+        self._consumer = None
+
+    def spawn(self, coro):
+        """Run ``coro`` as a handler task without waiting for a free slot.
+
+        Returns the task, or None if the callback was backlogged or shed.
+        """
+        if len(self._tasks) < self.max_tasks:
+            return self._start(coro)
+        if len(self._backlog) >= self.max_backlog:
+            if self.queue.policy == SHED:
+                coro.close()
+                self.callbacks_shed += 1
+                return None
+            if self.queue.policy == DROP_OLDEST:
+                self._backlog.popleft().close()
+                self.callbacks_dropped += 1
+        self._backlog.append(coro)
+        return None
+
+    def _start(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        self.spawned += 1
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.handler_errors += 1
+            self.logger.error(f"Handler task failed: {task.exception()}")
+        while self._backlog and len(self._tasks) < self.max_tasks:
+            self._start(self._backlog.popleft())
+        if len(self._backlog) < self.max_backlog:
+            self._backlog_room.set()
+
+    async def _run(self):
+        while True:
+            event = await self.queue.get()
+            if event is _STOP:
+                break
+            try:
+                await self.handler(event)
+            except Exception as e:
+                self.handler_errors += 1
+                self.logger.error(f"Error dispatching {type(event).__name__}: {e}")
+            self.processed += 1
+
+    def metrics(self):
+        metrics = self.queue.metrics()
+        metrics.update({
+            "processed": self.processed,
+            "spawned": self.spawned,
+            "active_tasks": len(self._tasks),
+            "max_tasks": self.max_tasks,
+            "backlog": len(self._backlog),
+            "callbacks_shed": self.callbacks_shed,
+            "callbacks_dropped": self.callbacks_dropped,
+            "handler_errors": self.handler_errors,
+        })
+        return metrics
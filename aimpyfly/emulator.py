@@ -0,0 +1,406 @@
+"""
+Local OSCAR server emulator for protocol-level testing and load tests.
+
+Speaks enough of the auth and BOS protocol for an unmodified AIMClient:
+the auth exchange with BOS redirect and cookie, server ready, rate info,
+own info, ICBM send/receive with host acks and errors, typing
+notifications, and channel 4 disconnects.  Screen names listed in
+``echo_users`` answer every IM with the same text, which lets a single
+client measure IM round trips.
+
+Run standalone:
+
+    python -m aimpyfly.emulator [--port 5190] [--bos-port 5191] [--latency 0.02] [--fragment 7]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import struct
+import time
+
+from .dedup import normalize_screen_name
+from .framer import FlapFramer
+from .log_utils import get_custom_logger
+from .oscar_protocol import (FLAP_HEADER, ICBM_CHANNEL_HEADER, SNAC_HEADER, SNAC_HEADER_SIZE, U16,
+                             USER_INFO_HEADER, OSCARProtocol, TLVView)
+from .rate_limit import RATE_CLASS, RATE_GROUP_HEADER, SNAC_PAIR, RateClass
+
+# Default rate class: window, clear, alert, limit, disconnect, max level (ms).
+# Sending faster than one SNAC per 30 ms on average gets rate limited.
+DEFAULT_RATE_CLASS = (20, 50, 40, 30, 10, 600)
+# Never limits, so clients don't pace either: for measuring raw throughput.
+UNLIMITED_RATE_CLASS = (1, 0, 0, 0, 0, 6000)
+ROAST_TABLE = (0xF3, 0x26, 0x81, 0xC4, 0x39, 0x86, 0xDB, 0x92, 0x71, 0xA3, 0xB9, 0xE6, 0x53, 0x7A, 0x95, 0x7C)
+RATE_LIMITED_SNACS = ((0x0004, 0x0006), (0x0004, 0x0014))
+SERVICE_FAMILIES = (0x0001, 0x0002, 0x0003, 0x0004, 0x0009, 0x0013)
+
+
+class EmulatorSession:
+    """One signed-on BOS connection."""
+
+    def __init__(self, emulator, screen_name, writer):
+        self.emulator = emulator
+        self.screen_name = screen_name
+        self.writer = writer
+        self.seq_num = 0
+        self.online = False
+        self.closed = False
+        self.rate_class = RateClass(1, *emulator.rate_class[:5], emulator.rate_class[5], emulator.rate_class[5])
+        self._outbound = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._write_loop())
+
+    def send_flap(self, channel, payload):
+        self.seq_num = (self.seq_num + 1) % 0x10000
+        frame = bytearray(FLAP_HEADER.size + len(payload))
+        FLAP_HEADER.pack_into(frame, 0, 0x2A, channel, self.seq_num, len(payload))
+        frame[FLAP_HEADER.size:] = payload
+        self._outbound.put_nowait((time.monotonic() + self.emulator.latency, frame))
+
+    def send_snac(self, family, subtype, body=b'', request_id=0, flags=0):
+        self.send_flap(0x02, SNAC_HEADER.pack(family, subtype, flags, request_id) + body)
+
+    def disconnect(self, code=0x0001):
+        """Send a channel 4 disconnect notice, then close once it is written."""
+        if not self.closed:
+            self.send_flap(0x04, _tlv(0x0009, U16.pack(code)))
+            self._outbound.put_nowait((0.0, None))
+            self.closed = True
+
+    async def _write_loop(self):
+        emulator = self.emulator
+        try:
+            while True:
+                due, frame = await self._outbound.get()
+                frames = [frame]
+                while not self._outbound.empty() and frames[-1] is not None:
+                    frames.append(self._outbound.get_nowait()[1])
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                done = frames[-1] is None
+                data = b''.join(f for f in frames if f is not None)
+                if emulator.fragment:
+                    for offset in range(0, len(data), emulator.fragment):
+                        self.writer.write(data[offset:offset + emulator.fragment])
+                        await self.writer.drain()
+                else:
+                    self.writer.write(data)
+                    await self.writer.drain()
+                if done:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.writer.close()
+
+    async def close(self):
+        self.closed = True
+        self._writer_task.cancel()
+        try:
+            await self._writer_task
+        except asyncio.CancelledError:
+            pass
+
+
+def _tlv(tlv_type, value):
+    return struct.pack('!HH', tlv_type, len(value)) + value
+
+
+def _user_info(screen_name):
+    name = screen_name.encode('utf-8')
+    return bytes([len(name)]) + name + USER_INFO_HEADER.pack(0, 1) + _tlv(0x0001, U16.pack(0x0010))
+
+
+class OscarEmulator:
+    """Auth and BOS servers on two local ports.
+
+    ``latency`` delays every server-to-client frame by that many seconds,
+    ``fragment`` splits the server's writes into chunks of that many bytes,
+    and with ``enforce_rates`` the BOS server models the advertised rate
+    class per session: ICBM sends and typing notifications below the limit
+    level are answered with a client rate limit error, 0x0003 (and a
+    0x0001/0x000A limited notice) instead of being delivered, and falling
+    below the disconnect level drops the session.
+    """
+
+    def __init__(self, host='127.0.0.1', auth_port=0, bos_port=0, latency=0.0, fragment=None,
+                 rate_class=DEFAULT_RATE_CLASS, enforce_rates=True, echo_users=('echo',), passwords=None,
+                 logger=None):
+        self.host = host
+        self.auth_port = auth_port
+        self.bos_port = bos_port
+        self.latency = latency
+        self.fragment = fragment
+        self.rate_class = rate_class
+        self.enforce_rates = enforce_rates
+        self.echo_users = {normalize_screen_name(name) for name in echo_users}
+        self.passwords = passwords
+        self.logger = logger or get_custom_logger(name="OSCAREmulator", level=logging.WARNING)
+        self.oscar = OSCARProtocol()
+        self.sessions = {}
+        self._cookies = {}
+        self._servers = []
+        self.stats = {
+            "signons": 0,
+            "ims_delivered": 0,
+            "ims_echoed": 0,
+            "acks": 0,
+            "errors": 0,
+            "typing": 0,
+            "rate_limited": 0,
+            "disconnects": 0,
+        }
+
+    async def start(self):
+        auth = await asyncio.start_server(self._handle_auth, self.host, self.auth_port)
+        bos = await asyncio.start_server(self._handle_bos, self.host, self.bos_port)
+        self._servers = [auth, bos]
+        self.auth_port = auth.sockets[0].getsockname()[1]
+        self.bos_port = bos.sockets[0].getsockname()[1]
+        self.logger.info(f"Emulator listening: auth {self.host}:{self.auth_port}, BOS {self.host}:{self.bos_port}")
+        return self
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+        for session in list(self.sessions.values()):
+            await session.close()
+        self.sessions.clear()
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def disconnect(self, screen_name, code=0x0001):
+        """Drop a signed-on user with a channel 4 disconnect notice."""
+        session = self.sessions.pop(normalize_screen_name(screen_name), None)
+        if session is not None:
+            self.stats["disconnects"] += 1
+            session.disconnect(code)
+
+    def deliver_im(self, sender, recipient, text, auto_response=False):
+        """Deliver an IM from ``sender`` (who need not be signed on). Returns False if the recipient is offline."""
+        session = self.sessions.get(normalize_screen_name(recipient))
+        if session is None or not session.online:
+            return False
+        encoded = text.encode('utf-8')
+        message = (struct.pack('!BBH', 0x05, 0x01, 1) + b'\x01' +
+                   struct.pack('!BBHHH', 0x01, 0x01, len(encoded) + 4, 0, 0) + encoded)
+        self._deliver(session, os.urandom(8), sender, message, auto_response)
+        return True
+
+    def _deliver(self, session, cookie, sender, message, auto_response=False):
+        body = cookie + U16.pack(0x0001) + _user_info(sender) + _tlv(0x0002, message)
+        if auto_response:
+            body += _tlv(0x0004, b'')
+        session.send_snac(0x0004, 0x0007, body)
+        self.stats["ims_delivered"] += 1
+
+    async def _read_frames(self, reader, framer):
+        chunk = await reader.read(65536)
+        if not chunk:
+            return None
+        return framer.feed(chunk)
+
+    async def _handle_auth(self, reader, writer):
+        framer = FlapFramer()
+        try:
+            writer.write(self.oscar.create_flap(0x01, 1, b'\x00\x00\x00\x01'))
+            await writer.drain()
+            while True:
+                frames = await self._read_frames(reader, framer)
+                if frames is None:
+                    return
+                for channel, _, payload in frames:
+                    if channel != 0x01 or len(payload) <= 4:
+                        continue
+                    tlvs = TLVView(payload, 4)
+                    screen_name = (tlvs.get(0x0001) or b'').decode('utf-8', errors='replace')
+                    if not self._password_ok(screen_name, tlvs.get(0x0002)):
+                        reply = _tlv(0x0001, screen_name.encode()) + _tlv(0x0008, U16.pack(0x0005))
+                    else:
+                        cookie = os.urandom(256)
+                        self._cookies[cookie] = screen_name
+                        reply = (_tlv(0x0001, screen_name.encode()) +
+                                 _tlv(0x0005, f"{self.host}:{self.bos_port}".encode()) +
+                                 _tlv(0x0006, cookie))
+                    writer.write(self.oscar.create_flap(0x04, 2, reply))
+                    await writer.drain()
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _password_ok(self, screen_name, roasted):
+        if self.passwords is None:
+            return True
+        password = self.passwords.get(normalize_screen_name(screen_name))
+        if password is None or roasted is None:
+            return False
+        return bytes(b ^ ROAST_TABLE[i % len(ROAST_TABLE)] for i, b in enumerate(roasted)) == password.encode('utf-8')
+
+    async def _handle_bos(self, reader, writer):
+        framer = FlapFramer()
+        session = None
+        writer.write(self.oscar.create_flap(0x01, 1, b'\x00\x00\x00\x01'))
+        try:
+            while session is None or not session.closed:
+                frames = await self._read_frames(reader, framer)
+                if frames is None:
+                    break
+                for channel, _, payload in frames:
+                    if channel == 0x01 and session is None:
+                        session = self._sign_on(payload, writer)
+                        if session is None:
+                            return
+                    elif channel == 0x02 and session is not None and len(payload) >= SNAC_HEADER_SIZE:
+                        self._handle_snac(session, *SNAC_HEADER.unpack_from(payload), payload[SNAC_HEADER_SIZE:])
+                    elif channel == 0x04:
+                        return
+                    if session is not None and session.closed:
+                        break
+        except (ConnectionError, ValueError, struct.error):
+            # A malformed frame or SNAC body ends the session like a disconnect
+            pass
+        finally:
+            if session is not None:
+                key = normalize_screen_name(session.screen_name)
+                if self.sessions.get(key) is session:
+                    del self.sessions[key]
+                if not session.closed:
+                    await session.close()
+            else:
+                writer.close()
+
+    def _sign_on(self, payload, writer):
+        tlvs = TLVView(payload, 4)
+        screen_name = self._cookies.pop(tlvs.get(0x0006), None)
+        if screen_name is None:
+            writer.write(self.oscar.create_flap(0x04, 2, _tlv(0x0009, U16.pack(0x0004))))
+            return None
+        key = normalize_screen_name(screen_name)
+        if key in self.sessions:
+            # Signing on again replaces the old session, as on the real service
+            self.disconnect(screen_name)
+        session = self.sessions[key] = EmulatorSession(self, screen_name, writer)
+        session.seq_num = 1
+        session.send_snac(0x0001, 0x0003, b''.join(U16.pack(family) for family in SERVICE_FAMILIES))
+        self.stats["signons"] += 1
+        return session
+
+    def _handle_snac(self, session, family, subtype, flags, request_id, body):
+        if (family, subtype) in RATE_LIMITED_SNACS and self.enforce_rates and not self._admit(session):
+            if not session.closed:
+                session.send_snac(family, 0x0001, U16.pack(0x0003), request_id)  # client rate limit exceeded
+                self.stats["errors"] += 1
+            return
+        if family == 0x0001:
+            if subtype == 0x0006:
+                session.send_snac(0x0001, 0x0007, self._rate_info(session), request_id)
+            elif subtype == 0x0002:
+                session.online = True
+            elif subtype == 0x000E:
+                session.send_snac(0x0001, 0x000F, _user_info(session.screen_name), request_id)
+        elif family == 0x0004:
+            if subtype == 0x0006:
+                self._route_im(session, request_id, body)
+            elif subtype == 0x0014:
+                self._route_typing(session, body)
+
+    def _admit(self, session):
+        rate_class = session.rate_class
+        now = time.monotonic()
+        level = rate_class.level_after_send(now)
+        rate_class.record_send(now)
+        if level < rate_class.disconnect:
+            self.logger.warning(f"{session.screen_name} exceeded the disconnect rate")
+            self.disconnect(session.screen_name, 0x0002)
+            return False
+        if level < rate_class.limit:
+            self.stats["rate_limited"] += 1
+            session.send_snac(0x0001, 0x000A, U16.pack(0x0003) + self._rate_class_record(rate_class))
+            return False
+        if level < rate_class.alert:
+            session.send_snac(0x0001, 0x000A, U16.pack(0x0002) + self._rate_class_record(rate_class))
+        return True
+
+    @staticmethod
+    def _rate_class_record(rate_class):
+        return RATE_CLASS.pack(rate_class.class_id, rate_class.window, rate_class.clear, rate_class.alert,
+                               rate_class.limit, rate_class.disconnect, int(rate_class.current),
+                               rate_class.max_level, 0, 0)
+
+    def _rate_info(self, session):
+        pairs = b''.join(SNAC_PAIR.pack(*pair) for pair in RATE_LIMITED_SNACS)
+        return (U16.pack(1) + self._rate_class_record(session.rate_class) +
+                U16.pack(1) + RATE_GROUP_HEADER.pack(1, len(RATE_LIMITED_SNACS)) + pairs)
+
+    def _route_im(self, session, request_id, body):
+        cookie, channel, name_length = ICBM_CHANNEL_HEADER.unpack_from(body)
+        offset = ICBM_CHANNEL_HEADER.size
+        recipient = bytes(body[offset:offset + name_length]).decode('utf-8', errors='replace')
+        tlvs = TLVView(body, offset + name_length)
+        message = tlvs.get(0x0002)
+        key = normalize_screen_name(recipient)
+        target = self.sessions.get(key)
+        if key in self.echo_users and message is not None:
+            self._deliver(session, os.urandom(8), recipient, message)
+            self.stats["ims_echoed"] += 1
+        elif target is not None and target.online and message is not None:
+            self._deliver(target, cookie, session.screen_name, message, 0x0004 in tlvs)
+        else:
+            session.send_snac(0x0004, 0x0001, U16.pack(0x0004), request_id)  # recipient not logged in
+            self.stats["errors"] += 1
+            return
+        if 0x0003 in tlvs:
+            session.send_snac(0x0004, 0x000C, bytes(body[:offset + name_length]), request_id)
+            self.stats["acks"] += 1
+
+    def _route_typing(self, session, body):
+        cookie, channel, name_length = ICBM_CHANNEL_HEADER.unpack_from(body)
+        offset = ICBM_CHANNEL_HEADER.size
+        recipient = bytes(body[offset:offset + name_length]).decode('utf-8', errors='replace')
+        target = self.sessions.get(normalize_screen_name(recipient))
+        self.stats["typing"] += 1
+        if target is not None and target.online:
+            sender = session.screen_name.encode('utf-8')
+            target.send_snac(0x0004, 0x0014, ICBM_CHANNEL_HEADER.pack(cookie, channel, len(sender)) + sender +
+                             bytes(body[offset + name_length:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OSCAR auth+BOS server emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5190, help="auth server port")
+    parser.add_argument("--bos-port", type=int, default=5191)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every server-to-client frame")
+    parser.add_argument("--fragment", type=int, default=None, help="split server writes into chunks of this many bytes")
+    parser.add_argument("--no-rate-limits", action="store_true", help="advertise a rate class that never limits")
+    args = parser.parse_args()
+
+    async def serve():
+        emulator = OscarEmulator(args.host, args.port, args.bos_port, args.latency, args.fragment,
+                                 UNLIMITED_RATE_CLASS if args.no_rate_limits else DEFAULT_RATE_CLASS,
+                                 logger=get_custom_logger(name="OSCAREmulator", level=logging.INFO))
+        await emulator.start()
+        print(f"auth {args.host}:{emulator.auth_port}  BOS {args.host}:{emulator.bos_port}  (Ctrl-C to stop)")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await emulator.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
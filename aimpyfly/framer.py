@@ -0,0 +1,74 @@
+from .oscar_protocol import FLAP_HEADER, FLAP_HEADER_SIZE
+
+
+class FlapFramer:
+    """Incremental FLAP splitter for a TCP byte stream.
+
+    ``feed`` takes whatever a single socket read returned and hands back every
+    FLAP completed by it as ``(channel, seq_num, payload)`` tuples.  Frames
+    that lie entirely inside the chunk are returned as memoryview slices of
+    the (immutable) chunk, so splitting a burst of FLAPs copies nothing.  Only
+    a frame straddling two reads is assembled in a reusable bytearray, and is
+    copied out once when complete.
+    """
+
+    def __init__(self):
+        self._partial = bytearray()
+        self.frames = 0
+        self.bytes_received = 0
+
+    @property
+    def pending(self):
+        """Number of buffered bytes belonging to an incomplete frame."""
+        return len(self._partial)
+
+    def reset(self):
+        self._partial.clear()
+
+    def feed(self, chunk):
+        self.bytes_received += len(chunk)
+        view = memoryview(chunk)
+        end = len(view)
+        offset = 0
+        frames = []
+
+        if self._partial:
+            offset = self._complete_partial(view, frames)
+            if self._partial:
+                return frames
+
+        unpack_from = FLAP_HEADER.unpack_from
+        while end - offset >= FLAP_HEADER_SIZE:
+            flap_id, channel, seq_num, length = unpack_from(view, offset)
+            if flap_id != 0x2A:
+                raise ValueError(f"Invalid FLAP ID 0x{flap_id:02x} at stream offset {self.bytes_received - end + offset}")
+            stop = offset + FLAP_HEADER_SIZE + length
+            if stop > end:
+                break
+            frames.append((channel, seq_num, view[offset + FLAP_HEADER_SIZE:stop]))
+            offset = stop
+
+        if offset < end:
+            self._partial += view[offset:]
+        self.frames += len(frames)
+        return frames
+
+    def _complete_partial(self, view, frames):
+        partial = self._partial
+        offset = 0
+        if len(partial) < FLAP_HEADER_SIZE:
+            offset = min(FLAP_HEADER_SIZE - len(partial), len(view))
+            partial += view[:offset]
+            if len(partial) < FLAP_HEADER_SIZE:
+                return offset
+        flap_id, channel, seq_num, length = FLAP_HEADER.unpack_from(partial)
+        if flap_id != 0x2A:
+            raise ValueError(f"Invalid FLAP ID 0x{flap_id:02x}")
+        missing = FLAP_HEADER_SIZE + length - len(partial)
+        take = min(missing, len(view) - offset)
+        partial += view[offset:offset + take]
+        offset += take
+        if take == missing:
+            frames.append((channel, seq_num, memoryview(bytes(partial[FLAP_HEADER_SIZE:]))))
+            partial.clear()
+        return offset
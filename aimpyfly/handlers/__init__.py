@@ -0,0 +1,9 @@
+# Importing the family modules registers their handlers in SNAC_HANDLERS.
+from ..snac_registry import SNAC_HANDLERS
+from . import icbm, oservice
+
+
+@SNAC_HANDLERS.fallback
+async def unknown_snac(client, snac):
+    client.logger.warning(f"Unhandled SNAC: Family 0x{snac.family:04x}, Subtype 0x{snac.subtype:04x}")
+    await client.handle_unknown_snac(snac.family, snac.subtype, snac.data, snac.flags, snac.request_id)
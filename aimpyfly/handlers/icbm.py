@@ -0,0 +1,27 @@
+# Family 0x0004: ICBM (instant messages)
+from ..snac_registry import SNAC_HANDLERS
+
+
+@SNAC_HANDLERS.handler(0x0004, 0x0001)
+async def icbm_error(client, snac):
+    await client.handle_icbm_error(snac.data, snac.request_id)
+
+
+@SNAC_HANDLERS.handler(0x0004, 0x000b)
+async def icbm_client_error(client, snac):
+    await client.handle_icbm_client_error(snac.data)
+
+
+@SNAC_HANDLERS.handler(0x0004, 0x000c)
+async def icbm_ack(client, snac):
+    await client.handle_icbm_ack(snac.data)
+
+
+@SNAC_HANDLERS.handler(0x0004, 0x0007)
+async def incoming_im(client, snac):
+    await client.handle_incoming_im(snac.data)
+
+
+@SNAC_HANDLERS.handler(0x0004, 0x0014)
+async def typing_notification(client, snac):
+    await client.handle_typing(snac.data)
@@ -0,0 +1,27 @@
+# Family 0x0001: OService (generic service controls)
+from ..snac_registry import SNAC_HANDLERS
+
+
+@SNAC_HANDLERS.handler(0x0001, 0x0003)
+async def server_ready(client, snac):
+    await client.handle_server_ready(snac.data, snac.flags, snac.request_id)
+
+
+@SNAC_HANDLERS.handler(0x0001, 0x0007)
+async def rate_limits(client, snac):
+    await client.handle_rate_limits(snac.data, snac.flags, snac.request_id)
+
+
+@SNAC_HANDLERS.handler(0x0001, 0x000A)
+async def rate_change(client, snac):
+    await client.handle_rate_change(snac.data, snac.flags, snac.request_id)
+
+
+@SNAC_HANDLERS.handler(0x0001, 0x000F)
+async def self_info(client, snac):
+    await client.handle_self_info(snac.data, snac.flags, snac.request_id)
+
+
+@SNAC_HANDLERS.handler(0x0001, 0x0013)
+async def motd(client, snac):
+    await client.handle_motd(snac.data, snac.flags, snac.request_id)
@@ -0,0 +1,277 @@
+import re
+import struct
+from collections import OrderedDict
+from html.entities import html5
+from typing import NamedTuple, Optional
+
+from .oscar_protocol import ICBM_CHANNEL_HEADER, U16, OSCARProtocol, TLVView
+
+ICBM_HEADER = struct.Struct('!8sH')       # cookie, channel
+ICBM_FRAGMENT = struct.Struct('!BBH')     # fragment id, version, length
+TEXT_CHARSET = struct.Struct('!HH')       # charset, subset
+
+FRAGMENT_CAPABILITIES = 0x05
+FRAGMENT_TEXT = 0x01
+
+# Charsets of a channel 1 text fragment
+CHARSET_ASCII = 0x0000
+CHARSET_UNICODE = 0x0002  # UCS-2BE
+CHARSET_LATIN1 = 0x0003
+
+# Message TLVs following the sender's user info block
+TLV_MESSAGE = 0x0002
+TLV_ACK_REQUEST = 0x0003
+TLV_AUTO_RESPONSE = 0x0004
+
+# Longest message text (the HTML document, as encoded) the AIM service accepts
+MAX_MESSAGE_BYTES = 2544
+
+# What AIMClient.send_message wraps a message in
+HTML_PREFIX = '<HTML><BODY BGCOLOR="#ffffff"><FONT LANG="0">'
+HTML_SUFFIX = '</FONT></BODY></HTML>'
+
+# Typing notification (0x0004/0x0014) states
+TYPING_FINISHED = 0x0000
+TYPING_TYPED = 0x0001   # text entered, but not typing right now
+TYPING_BEGUN = 0x0002
+
+_oscar = OSCARProtocol()
+
+
+class IncomingIM(NamedTuple):
+    cookie: bytes
+    channel: int
+    sender: str
+    warning_level: int
+    html: Optional[str]         # message as sent, None if it carried no text
+    text: Optional[str]         # html with markup stripped and entities decoded
+    charset: int
+    capabilities: bytes
+    auto_response: bool
+    ack_requested: bool
+
+
+class TypingNotification(NamedTuple):
+    cookie: bytes
+    channel: int
+    sender: str
+    state: int      # TYPING_FINISHED, TYPING_TYPED or TYPING_BEGUN
+
+
+def decode_typing(data):
+    """Decode an ICBM 0x0004/0x0014 payload.
+
+    Raises ValueError (or struct.error) on a truncated payload.
+    """
+    cookie, channel, length = ICBM_CHANNEL_HEADER.unpack_from(data)
+    offset = ICBM_CHANNEL_HEADER.size
+    if len(data) < offset + length + U16.size:
+        raise ValueError("Truncated typing notification")
+    sender = str(data[offset:offset + length], 'utf-8', errors='replace')
+    state, = U16.unpack_from(data, offset + length)
+    return TypingNotification(cookie, channel, sender, state)
+
+
+def decode_text(data, charset):
+    if charset == CHARSET_UNICODE:
+        return str(data, 'utf-16-be', errors='replace')
+    if charset == CHARSET_LATIN1:
+        return str(data, 'latin-1')
+    # "ASCII" is what most clients claim while actually sending UTF-8
+    try:
+        return str(data, 'utf-8')
+    except UnicodeDecodeError:
+        return str(data, 'latin-1')
+
+
+def read_message_fragments(data):
+    """Walk the fragments of a channel 1 message TLV.
+
+    Returns ``(html, charset, capabilities)``; text fragments are
+    concatenated, and ``html`` is None when there are none.
+    """
+    offset = 0
+    end = len(data)
+    parts = []
+    charset = CHARSET_ASCII
+    capabilities = b''
+    while end - offset >= ICBM_FRAGMENT.size:
+        fragment_id, _, length = ICBM_FRAGMENT.unpack_from(data, offset)
+        offset += ICBM_FRAGMENT.size
+        value = data[offset:offset + length]
+        offset += length
+        if fragment_id == FRAGMENT_TEXT and len(value) >= TEXT_CHARSET.size:
+            charset, _ = TEXT_CHARSET.unpack_from(value)
+            parts.append(decode_text(value[TEXT_CHARSET.size:], charset))
+        elif fragment_id == FRAGMENT_CAPABILITIES:
+            capabilities = bytes(value)
+    return (''.join(parts) if parts else None), charset, capabilities
+
+
+def decode_incoming_im(data):
+    """Decode an ICBM 0x0004/0x0007 payload.
+
+    Raises ValueError (or struct.error) on a truncated payload.  Only channel
+    1 messages are decoded past the sender; other channels come back with
+    ``html`` and ``text`` set to None.
+    """
+    cookie, channel = ICBM_HEADER.unpack_from(data)
+    sender, warning_level, _, offset = _oscar.read_user_info(data, ICBM_HEADER.size)
+    html = text = None
+    charset = CHARSET_ASCII
+    capabilities = b''
+    auto_response = ack_requested = False
+    if channel == 0x0001:
+        tlvs = TLVView(data, offset)
+        message = tlvs.view(TLV_MESSAGE)
+        if message is not None:
+            html, charset, capabilities = read_message_fragments(message)
+            if html is not None:
+                text = html_to_text(html)
+        auto_response = TLV_AUTO_RESPONSE in tlvs
+        ack_requested = TLV_ACK_REQUEST in tlvs
+    return IncomingIM(cookie, channel, sender, warning_level, html, text, charset,
+                      capabilities, auto_response, ack_requested)
+
+
+# One pass over the markup: a tag (group 1 is its name), comment or doctype,
+# or a character reference (group 2 is the name or number between '&' and ';').
+# A tag name must follow '<' or '</' directly, so a plain "3 < 5" is left alone.
+_MARKUP = re.compile(r'<(?:/?([a-zA-Z][a-zA-Z0-9]*)|[!?])[^>]*>|&(#[0-9]{1,7}|#[xX][0-9a-fA-F]{1,6}|[a-zA-Z][a-zA-Z0-9]{1,31});')
+
+
+def _replace_markup(match):
+    reference = match.group(2)
+    if reference is None:
+        tag = match.group(1)
+        return '\n' if tag is not None and tag.lower() == 'br' else ''
+    if reference[0] == '#':
+        code = int(reference[2:], 16) if reference[1] in 'xX' else int(reference[1:])
+        # Like html.unescape: NUL, surrogates and out-of-range numbers are replaced
+        if code == 0 or 0xD800 <= code <= 0xDFFF or code > 0x10FFFF:
+            return '\ufffd'
+        return chr(code)
+    return html5.get(reference + ';', match.group(0))
+
+
+def html_to_text(markup):
+    """Strip tags (``<br>`` becomes a newline) and decode entities in one pass."""
+    if '<' not in markup and '&' not in markup:
+        return markup.strip()
+    return _MARKUP.sub(_replace_markup, markup).strip()
+
+
+_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\n': '<br>'})
+_BREAKS = str.maketrans({'\n': '<br>'})
+
+
+def message_html(text, escape=False):
+    """The HTML document sent for ``text``: newlines become ``<br>``, and with
+    ``escape`` the characters ``&``, ``<`` and ``>`` are escaped so the text
+    shows as written."""
+    return HTML_PREFIX + text.translate(_ESCAPES if escape else _BREAKS) + HTML_SUFFIX
+
+
+def _html_size(text, escape):
+    return len(text.translate(_ESCAPES if escape else _BREAKS).encode('utf-8'))
+
+
+# A sentence: up to terminal punctuation followed by whitespace, a newline,
+# or the end; trailing whitespace included.  Words likewise.
+_SENTENCE = re.compile(r'.+?(?:[.!?]+(?=\s)|\n|$)\s*', re.S)
+_WORD = re.compile(r'\S+\s*|\s+')
+
+
+def split_message(text, max_bytes=MAX_MESSAGE_BYTES, reserve=0, escape=True):
+    """Split ``text`` into parts whose encoded IM text fits in ``max_bytes``.
+
+    Sizes are of the UTF-8 HTML document ``message_html`` builds, wrapper
+    and escaping included, plus ``reserve`` bytes the caller will add (e.g.
+    an ASCII "[1/3] " prefix).  Parts break between sentences where
+    possible, else between words; a single word longer than a whole part is
+    cut between characters.  Whitespace around the breaks is dropped.
+    """
+    budget = max_bytes - len(HTML_PREFIX) - len(HTML_SUFFIX) - reserve
+    # Room for any one character: "&amp;" when escaping, else "<br>" or 4 UTF-8 bytes
+    if budget < (5 if escape else 4):
+        raise ValueError(f"max_bytes={max_bytes} leaves no room for text")
+    parts = []
+    current = []
+    used = 0
+
+    def flush():
+        part = ''.join(current).strip()
+        if part:
+            parts.append(part)
+        current.clear()
+        return 0
+
+    for sentence in _SENTENCE.findall(text):
+        size = _html_size(sentence, escape)
+        if used + size <= budget:
+            current.append(sentence)
+            used += size
+            continue
+        used = flush()
+        if size <= budget:
+            current.append(sentence)
+            used = size
+            continue
+        for word in _WORD.findall(sentence):
+            size = _html_size(word, escape)
+            if used + size > budget:
+                used = flush()
+            if size <= budget:
+                current.append(word)
+                used += size
+                continue
+            for char in word:
+                size = _html_size(char, escape)
+                if used + size > budget:
+                    used = flush()
+                current.append(char)
+                used += size
+    flush()
+    return parts
+
+
+class TypingFrameCache:
+    """Pre-encoded typing notification frames, per screen name and state.
+
+    A typing notification differs between calls only in recipient and state,
+    so the whole FLAP (zero cookie, request ID 0) is encoded once and later
+    calls copy it; the send path then patches in the sequence number.  The
+    least recently used recipients are evicted beyond ``maxsize``.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def frame(self, recipient, state):
+        """Return a new bytearray holding the frame, ready for the send queue."""
+        key = (recipient, state)
+        template = self._frames.get(key)
+        if template is None:
+            self.misses += 1
+            template = self._frames[key] = self.encode(recipient, state)
+            if len(self._frames) > self.maxsize:
+                self._frames.popitem(last=False)
+        else:
+            self.hits += 1
+            self._frames.move_to_end(key)
+        return bytearray(template)
+
+    @staticmethod
+    def encode(recipient, state):
+        screen_name = recipient.encode('utf-8')
+        body = bytearray(ICBM_CHANNEL_HEADER.size + len(screen_name) + U16.size)
+        ICBM_CHANNEL_HEADER.pack_into(body, 0, bytes(8), 0x0001, len(screen_name))
+        body[ICBM_CHANNEL_HEADER.size:-U16.size] = screen_name
+        U16.pack_into(body, len(body) - U16.size, state)
+        return bytes(_oscar.encode_snac_frame(0x0004, 0x0014, 0, 0, body))
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import socket
+import time
+
+from .log_utils import get_custom_logger
+from .metrics import TimingStats
+
+# Applied to the auth and BOS sockets.  The TCP keep-alive timings only take
+# effect where the platform exposes them (Linux; macOS has TCP_KEEPALIVE for
+# the idle time).
+SOCKET_OPTIONS = {
+    "nodelay": True,
+    "keepalive": True,
+    "keepidle": 60,   # seconds idle before the first TCP probe
+    "keepintvl": 10,  # seconds between TCP probes
+    "keepcnt": 3,     # unanswered TCP probes before the kernel drops the connection
+}
+
+# OService "request own info"; the server always answers with 0x0001/0x000F,
+# which makes it a cheap echo for measuring the round trip.
+PROBE_REQUEST = (0x0001, 0x000E)
+PROBE_REPLY = (0x0001, 0x000F)
+
+
+def apply_socket_options(sock, options=None):
+    """Set TCP_NODELAY and SO_KEEPALIVE (with its timings) on a connected socket."""
+    options = SOCKET_OPTIONS if options is None else {**SOCKET_OPTIONS, **options}
+    if sock is None:
+        return
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(bool(options["nodelay"])))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, int(bool(options["keepalive"])))
+    if not options["keepalive"]:
+        return
+    idle_option = getattr(socket, "TCP_KEEPIDLE", getattr(socket, "TCP_KEEPALIVE", None))
+    for option, value in ((idle_option, options["keepidle"]),
+                          (getattr(socket, "TCP_KEEPINTVL", None), options["keepintvl"]),
+                          (getattr(socket, "TCP_KEEPCNT", None), options["keepcnt"])):
+        if option is not None and value is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, option, int(value))
+
+
+class KeepAlive:
+    """Keep-alive timer and liveness tracker for a signed-on client.
+
+    Every ``interval`` seconds, independent of the read loop, it sends an
+    echo probe (request own info) and times the reply.  The probe is also
+    the keep-alive.  If the server sends nothing at all for ``max_missed``
+    intervals in a row, the peer is declared dead and the client's
+    connection is dropped, so a half-open connection is noticed within
+    ``interval * max_missed`` seconds instead of at the next failed write.
+    """
+
+    def __init__(self, client, interval=30.0, max_missed=3, logger=None, clock=time.monotonic):
+        self.client = client
+        self.interval = interval
+        self.max_missed = max_missed
+        self.clock = clock
+        self.logger = logger or get_custom_logger(name="AIMKeepAlive", level=logging.WARNING)
+        self.rtt = TimingStats()
+        self.last_rtt = None
+        self.missed = 0
+        self.probes = 0
+        self.dead = 0
+        self._probe_sent = None
+        self._pending = set()
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self.missed = 0
+            self._probe_sent = None
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for probe in list(self._pending):
+            probe.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not await self.tick():
+                return
+
+    async def tick(self):
+        """Check liveness and send the next probe. Returns False once the peer is declared dead."""
+        now = self.clock()
+        if self._probe_sent is not None and self.client.last_received < self._probe_sent:
+            self.missed += 1
+            self.logger.warning(f"No data from server for {now - self._probe_sent:.1f} s ({self.missed}/{self.max_missed} keep-alive intervals missed)")
+            if self.missed >= self.max_missed:
+                self.dead += 1
+                self.client.drop_connection(f"no response to {self.missed} keep-alives")
+                return False
+        else:
+            self.missed = 0
+        await self.probe()
+        return True
+
+    async def probe(self):
+        """Send a probe without waiting for it; the reply is matched by request ID."""
+        sent = self._probe_sent = self.clock()
+        self.probes += 1
+        probe = asyncio.ensure_future(self.client.request(*PROBE_REQUEST, timeout=self.interval * self.max_missed))
+        self._pending.add(probe)
+        probe.add_done_callback(lambda done: self._reply(done, sent))
+
+    def _reply(self, probe, sent):
+        self._pending.discard(probe)
+        if probe.cancelled() or probe.exception() is not None:
+            return
+        self.last_rtt = self.clock() - sent
+        self.rtt.add(self.last_rtt)
+        self.logger.debug(f"Keep-alive round trip: {self.last_rtt * 1000:.1f} ms")
+
+    def metrics(self):
+        return {
+            "interval": self.interval,
+            "probes": self.probes,
+            "missed": self.missed,
+            "dead_peers": self.dead,
+            "last_rtt": self.last_rtt,
+            "rtt": self.rtt.snapshot(),
+        }
@@ -0,0 +1,48 @@
+from collections import deque
+
+
+class TimingStats:
+    """Running count/total/min/max of durations plus a window of recent samples.
+
+    The bounded sample window is what percentiles are computed from, so memory
+    stays fixed no matter how long the process runs.
+    """
+    __slots__ = ('count', 'total', 'min', 'max', '_samples')
+
+    def __init__(self, window=1024):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self._samples.append(seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct):
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "min": self.min or 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+        }
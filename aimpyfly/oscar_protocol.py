@@ -1,9 +1,64 @@
 import struct
 import logging
+from array import array
 from .log_utils import get_custom_logger
 
+# Precompiled wire layouts. Encoders write into a single preallocated
+# bytearray with pack_into; decoders use unpack_from on the receive buffer.
+FLAP_HEADER = struct.Struct('!BBHH')     # '*', channel, sequence, data length
+SNAC_HEADER = struct.Struct('!HHHI')     # family, subtype, flags, request id
+TLV_HEADER = struct.Struct('!HH')        # type, length
+U8 = struct.Struct('!B')
+U16 = struct.Struct('!H')
+U32 = struct.Struct('!I')
+FLAP_HEADER_SIZE = FLAP_HEADER.size
+SNAC_HEADER_SIZE = SNAC_HEADER.size
+FLAP_SEQ_OFFSET = 2
+SNAC_REQUEST_ID_OFFSET = FLAP_HEADER_SIZE + 6
+
+# ICBM channel 1 message TLV 0x0002 up to the text: TLV header, the
+# capabilities fragment (0x05 0x01, length 1, 0x01) and the text fragment
+# header (0x01 0x01, length, charset, subset).
+ICBM_TEXT_HEADER = struct.Struct('!HHBBHBBBHHH')
+ICBM_CHANNEL_HEADER = struct.Struct('!8sHB')  # cookie, channel, recipient length
+USER_INFO_HEADER = struct.Struct('!HH')       # warning level, TLV count
+
+# Error codes carried by the 0x0001 error subtype of every family
+SNAC_ERRORS = {
+    0x0001: "Invalid SNAC header",
+    0x0002: "Server rate limit exceeded",
+    0x0003: "Client rate limit exceeded",
+    0x0004: "Recipient is not logged in",
+    0x0005: "Requested service unavailable",
+    0x0006: "Requested service not defined",
+    0x0007: "Obsolete SNAC",
+    0x0008: "Not supported by server",
+    0x0009: "Not supported by client",
+    0x000A: "Refused by client",
+    0x000B: "Reply too big",
+    0x000C: "Responses lost",
+    0x000D: "Request denied",
+    0x000E: "Incorrect SNAC format",
+    0x000F: "Insufficient rights",
+    0x0010: "In local permit/deny list",
+    0x0011: "Sender too evil",
+    0x0012: "Receiver too evil",
+    0x0013: "User temporarily unavailable",
+    0x0014: "No match",
+    0x0015: "List overflow",
+    0x0016: "Request ambiguous",
+    0x0017: "Server queue full",
+    0x0018: "Not while on AOL",
+}
+
+
+def patch_seq(frame, seq_num):
+    """Rewrite the FLAP sequence number of an encoded frame in place."""
+    U16.pack_into(frame, FLAP_SEQ_OFFSET, seq_num)
+
+
 class OSCARProtocol:
-    FLAP_HEADER_SIZE = 6
+    FLAP_HEADER_SIZE = FLAP_HEADER_SIZE
     logger = get_custom_logger(name="OSCAR",level=logging.WARNING)
     def parse_flap_header(self, data):
         if len(data) < 6:
@@ -18,9 +73,11 @@ class OSCARProtocol:
         return channel, seq_num, data_length
 
     def create_snac_with_tlvs(self, family, subtype, flags, req_id, tlvs):
-        snac_header = struct.pack('>HHHL', family, subtype, flags, req_id)
-        tlv_data = b''.join(self.create_tlv(tlv_type, tlv_value) for tlv_type, tlv_value in tlvs)
-        return snac_header + tlv_data
+        size = SNAC_HEADER_SIZE + sum(TLV_HEADER.size + len(value) for _, value in tlvs)
+        snac = bytearray(size)
+        SNAC_HEADER.pack_into(snac, 0, family, subtype, flags, req_id)
+        self._write_tlvs(snac, SNAC_HEADER_SIZE, tlvs)
+        return bytes(snac)
 
     def parse_snac(self, data):
         if len(data) < 10:
@@ -34,8 +91,7 @@ class OSCARProtocol:
 
     def create_flap(self, channel, seq_num, data=b''):
         # FLAP header: * (1 byte), Channel (1 byte), Sequence Number (2 bytes), Data Length (2 bytes)
-        flap_header = struct.pack('!BBHH', 0x2A, channel, seq_num, len(data))
-        return flap_header + data
+        return FLAP_HEADER.pack(0x2A, channel, seq_num, len(data)) + data
     
     def read_flap(self, data):
         if len(data) < self.FLAP_HEADER_SIZE:
@@ -51,8 +107,7 @@ class OSCARProtocol:
     
     def create_snac(self, family_id, subtype_id, flags, request_id, data=b''):
         # SNAC header: Family ID (2 bytes), Subtype ID (2 bytes), Flags (2 bytes), Request ID (4 bytes)
-        snac_header = struct.pack('!HHHI', family_id, subtype_id, flags, request_id)
-        return snac_header + data
+        return SNAC_HEADER.pack(family_id, subtype_id, flags, request_id) + data
     
     def read_snac(self, data):
         if len(data) < 10:
@@ -65,8 +120,78 @@ class OSCARProtocol:
         return family_id, subtype_id, flags, req_id, snac_data
     
     def create_tlv(self, tlv_type, tlv_value):
-        tlv_header = struct.pack('!HH', tlv_type, len(tlv_value))
-        return tlv_header + tlv_value
+        return TLV_HEADER.pack(tlv_type, len(tlv_value)) + tlv_value
+
+    def _write_tlvs(self, buffer, offset, tlvs):
+        for tlv_type, tlv_value in tlvs:
+            length = len(tlv_value)
+            TLV_HEADER.pack_into(buffer, offset, tlv_type, length)
+            offset += TLV_HEADER.size
+            buffer[offset:offset + length] = tlv_value
+            offset += length
+        return offset
+
+    def snac_frame_size(self, body=b'', tlvs=()):
+        return (FLAP_HEADER_SIZE + SNAC_HEADER_SIZE + len(body) +
+                sum(TLV_HEADER.size + len(value) for _, value in tlvs))
+
+    def encode_snac_frame(self, family_id, subtype_id, flags=0, request_id=0, body=b'', tlvs=(), seq_num=0, channel=0x02):
+        """Encode a whole FLAP+SNAC(+TLVs) frame in a single allocation."""
+        frame = bytearray(self.snac_frame_size(body, tlvs))
+        self._write_snac_frame(frame, 0, seq_num, channel, family_id, subtype_id, flags, request_id, body, tlvs)
+        return frame
+
+    def encode_snac_frames(self, snacs, seq_num=0):
+        """Encode many SNACs back to back into one buffer.
+
+        ``snacs`` yields ``(family, subtype, flags, request_id, body)`` tuples;
+        frames are numbered from ``seq_num`` upwards.  Returns the buffer and
+        the next free sequence number, ready for ``writer.writelines``.
+        """
+        snacs = list(snacs)
+        buffer = bytearray(sum(self.snac_frame_size(snac[4]) for snac in snacs))
+        offset = 0
+        for family_id, subtype_id, flags, request_id, body in snacs:
+            offset = self._write_snac_frame(buffer, offset, seq_num, 0x02, family_id, subtype_id, flags, request_id, body, ())
+            seq_num = (seq_num + 1) % 0x10000
+        return buffer, seq_num
+
+    def _write_snac_frame(self, buffer, offset, seq_num, channel, family_id, subtype_id, flags, request_id, body, tlvs):
+        start = offset
+        offset += FLAP_HEADER_SIZE
+        SNAC_HEADER.pack_into(buffer, offset, family_id, subtype_id, flags, request_id)
+        offset += SNAC_HEADER_SIZE
+        buffer[offset:offset + len(body)] = body
+        offset = self._write_tlvs(buffer, offset + len(body), tlvs)
+        FLAP_HEADER.pack_into(buffer, start, 0x2A, channel, seq_num, offset - start - FLAP_HEADER_SIZE)
+        return offset
+
+    def encode_im_frame(self, seq_num, request_id, cookie, recipient, text, charset=0x0000, tlvs=()):
+        """Encode an ICBM channel 1 send (0x0004/0x0006) in a single allocation.
+
+        ``recipient`` and ``text`` are already-encoded bytes; ``tlvs`` are
+        appended after the message TLV (e.g. 0x0003 to request a host ack).
+        """
+        text_length = len(text)
+        body_size = (ICBM_CHANNEL_HEADER.size + len(recipient) + ICBM_TEXT_HEADER.size + text_length +
+                     sum(TLV_HEADER.size + len(value) for _, value in tlvs))
+        frame = bytearray(FLAP_HEADER_SIZE + SNAC_HEADER_SIZE + body_size)
+        FLAP_HEADER.pack_into(frame, 0, 0x2A, 0x02, seq_num, SNAC_HEADER_SIZE + body_size)
+        SNAC_HEADER.pack_into(frame, FLAP_HEADER_SIZE, 0x0004, 0x0006, 0x0000, request_id)
+        offset = FLAP_HEADER_SIZE + SNAC_HEADER_SIZE
+        ICBM_CHANNEL_HEADER.pack_into(frame, offset, cookie, 0x0001, len(recipient))
+        offset += ICBM_CHANNEL_HEADER.size
+        frame[offset:offset + len(recipient)] = recipient
+        offset += len(recipient)
+        ICBM_TEXT_HEADER.pack_into(frame, offset,
+                                   0x0002, text_length + 13,      # message TLV
+                                   0x05, 0x01, 0x0001, 0x01,      # capabilities fragment
+                                   0x01, 0x01, text_length + 4,   # text fragment
+                                   charset, 0x0000)
+        offset += ICBM_TEXT_HEADER.size
+        frame[offset:offset + text_length] = text
+        self._write_tlvs(frame, offset + text_length, tlvs)
+        return frame
         
     def read_tlv(self, data):
         if len(data) < 4:
@@ -76,58 +201,126 @@ class OSCARProtocol:
         tlv_value = data[4:4 + length]
         return tlv_type, length, tlv_value
     
-    def read_tlvs(self, data):
-        tlvs = {}
-        offset = 0
-        self.logger.info(f"Starting to read TLVs from data of length {len(data)}")
-        self.logger.debug(f"Raw TLV data: {data.hex()}")
-        while offset < len(data):
-            if len(data) - offset < 2:
-                self.logger.warning(f"Not enough data for TLV type at offset {offset}")
-                break
-            tlv_type = struct.unpack('!H', data[offset:offset+2])[0]
-            offset += 2
-
-            if tlv_type == 0x000E:  # Special handling for chat server URL
-                end = data.find(b'\x00', offset)
-                if end == -1:
-                    end = len(data)
-                tlv_value = data[offset:end]
-                tlv_length = len(tlv_value)
-                offset = end + 1  # Skip the null terminator
-            elif tlv_type == 0x0006:  # Special handling for cookie
-                tlv_length = 256  # Cookie is always 256 bytes
-                tlv_value = data[offset:offset+tlv_length]
-                offset += tlv_length
-            else:
-                if len(data) - offset < 2:
-                    self.logger.warning(f"Not enough data for TLV length at offset {offset}")
-                    break
-                tlv_length = struct.unpack('!H', data[offset:offset+2])[0]
-                offset += 2
-                if offset + tlv_length > len(data):
-                    self.logger.warning(f"TLV data exceeds buffer: Type 0x{tlv_type:04X}, Length {tlv_length}, Remaining data {len(data) - offset}")
-                    break
-                tlv_value = data[offset:offset+tlv_length]
-                offset += tlv_length
-
-            tlvs[tlv_type] = tlv_value
-            self.logger.info(f"Found TLV: Type 0x{tlv_type:04X}, Length {len(tlv_value)}")
-            self.logger.debug(f"TLV 0x{tlv_type:04X} value: {tlv_value.hex()}")
-
-        self.logger.info(f"Finished reading TLVs. Total TLVs found: {len(tlvs)}")
+    def read_tlvs(self, data, offset=0, count=None):
+        tlvs = TLVView(data, offset, count)
+        if tlvs.truncated:
+            self.logger.warning(f"TLV data exceeds buffer at offset {tlvs.end} of {len(data)}")
+        # Hot path: build no log strings unless debug logging is on
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Finished reading TLVs. Total TLVs found: {len(tlvs)}")
+            for tlv_type, tlv_value in tlvs:
+                self.logger.debug(f"TLV 0x{tlv_type:04X} value: {tlv_value.hex()}")
         return tlvs
         
-    def parse_user_info(self, data):
-        offset = 0
-        # Screen name length (1 byte)
+    def read_user_info(self, data, offset=0):
+        """Parse an OSCAR user info block.
+
+        Returns ``(screen_name, warning_level, tlvs, end)`` where ``tlvs`` is a
+        TLVView over the block's TLVs and ``end`` the offset just past it.
+        """
         sn_length = data[offset]
         offset += 1
-        
-        # Screen name (variable length)
-        screen_name = data[offset:offset+sn_length].decode('utf-8', errors='ignore')
+        screen_name = bytes(data[offset:offset + sn_length]).decode('utf-8', errors='replace')
         offset += sn_length
-        
-        # Additional user info can be parsed here if necessary
-        
-        return screen_name
\ No newline at end of file
+        warning_level, tlv_count = USER_INFO_HEADER.unpack_from(data, offset)
+        tlvs = TLVView(data, offset + USER_INFO_HEADER.size, tlv_count)
+        return screen_name, warning_level, tlvs, tlvs.end
+
+    def parse_user_info(self, data):
+        # Screen name length (1 byte) followed by the screen name
+        sn_length = data[0]
+        return bytes(data[1:1 + sn_length]).decode('utf-8', errors='ignore')
+
+
+class TLVView:
+    """Copy-free index over a run of TLVs.
+
+    The buffer is scanned once; the type, value offset and length of every TLV
+    are kept in compact parallel arrays.  Values stay in the original buffer
+    and are only materialised on request: :meth:`view` returns a memoryview,
+    :meth:`get` / ``[]`` return bytes.  Repeated types are preserved in wire
+    order -- lookups return the first occurrence, :meth:`get_all` all of them.
+
+    ``count`` limits parsing to a fixed number of TLVs (as in user info
+    blocks); ``end`` is then the offset just past the last one parsed.
+    """
+    __slots__ = ('_data', '_types', '_offsets', '_lengths', 'end', 'truncated')
+
+    def __init__(self, data, offset=0, count=None, end=None):
+        view = data if isinstance(data, memoryview) else memoryview(data)
+        limit = len(view) if end is None else end
+        types = array('H')
+        offsets = array('I')
+        lengths = array('H')
+        unpack_from = TLV_HEADER.unpack_from
+        truncated = False
+        while offset + 4 <= limit and (count is None or len(types) < count):
+            tlv_type, length = unpack_from(view, offset)
+            start = offset + 4
+            if start + length > limit:
+                truncated = True
+                break
+            types.append(tlv_type)
+            offsets.append(start)
+            lengths.append(length)
+            offset = start + length
+        self._data = view
+        self._types = types
+        self._offsets = offsets
+        self._lengths = lengths
+        self.end = offset
+        self.truncated = truncated or (count is not None and len(types) < count)
+
+    def __len__(self):
+        return len(self._types)
+
+    def __contains__(self, tlv_type):
+        return tlv_type in self._types
+
+    def __iter__(self):
+        data = self._data
+        for tlv_type, start, length in zip(self._types, self._offsets, self._lengths):
+            yield tlv_type, data[start:start + length]
+
+    def __getitem__(self, tlv_type):
+        value = self.view(tlv_type)
+        if value is None:
+            raise KeyError(tlv_type)
+        return value.tobytes()
+
+    def __repr__(self):
+        return f"TLVView({', '.join(f'0x{t:04X}' for t in self._types)})"
+
+    def types(self):
+        return list(self._types)
+
+    def view(self, tlv_type):
+        try:
+            index = self._types.index(tlv_type)
+        except ValueError:
+            return None
+        start = self._offsets[index]
+        return self._data[start:start + self._lengths[index]]
+
+    def get(self, tlv_type, default=None):
+        value = self.view(tlv_type)
+        return default if value is None else value.tobytes()
+
+    def get_all(self, tlv_type):
+        return [value.tobytes() for t, value in self if t == tlv_type]
+
+    def get_u16(self, tlv_type, default=None):
+        value = self.view(tlv_type)
+        return default if value is None or len(value) < 2 else U16.unpack_from(value)[0]
+
+    def get_u32(self, tlv_type, default=None):
+        value = self.view(tlv_type)
+        return default if value is None or len(value) < 4 else U32.unpack_from(value)[0]
+
+    def to_dict(self):
+        """Materialise as ``{type: bytes}``; the first occurrence wins."""
+        result = {}
+        for tlv_type, value in self:
+            if tlv_type not in result:
+                result[tlv_type] = value.tobytes()
+        return result
@@ -0,0 +1,174 @@
+import struct
+import time
+
+from .oscar_protocol import U16
+
+# Rate class record in 0x0001/0x0007 (rate info) and 0x0001/0x000A (rate
+# change): class id, window, clear, alert, limit, disconnect, current level,
+# max level, last time, current state.
+RATE_CLASS = struct.Struct('!H8IB')
+RATE_GROUP_HEADER = struct.Struct('!HH')  # class id, number of SNAC pairs
+SNAC_PAIR = struct.Struct('!HH')
+
+RATE_CHANGE_CODES = {
+    0x0001: "changed",
+    0x0002: "warning",
+    0x0003: "limited",
+    0x0004: "clear",
+}
+
+
+class RateClass:
+    """Client-side model of one OSCAR rate class.
+
+    OSCAR tracks a moving average of the gap between messages: after a send,
+    ``level = ((window - 1) * level + elapsed_ms) / window``, capped at
+    ``max_level``.  Falling below ``alert`` draws a warning, below ``limit``
+    the server drops messages, below ``disconnect`` it drops the connection.
+    """
+    __slots__ = ('class_id', 'window', 'clear', 'alert', 'limit', 'disconnect',
+                 'current', 'max_level', 'state', 'last_send', 'sends')
+
+    def __init__(self, class_id, window, clear, alert, limit, disconnect, current, max_level,
+                 state=0, now=None):
+        self.class_id = class_id
+        self.sends = 0
+        self.update(window, clear, alert, limit, disconnect, current, max_level, state, now)
+
+    def update(self, window, clear, alert, limit, disconnect, current, max_level, state=0, now=None):
+        # The server's level is authoritative; it describes the class as of now.
+        self.window = max(1, window)
+        self.clear = clear
+        self.alert = alert
+        self.limit = limit
+        self.disconnect = disconnect
+        self.current = current
+        self.max_level = max_level
+        self.state = state
+        self.last_send = time.monotonic() if now is None else now
+
+    def level_after_send(self, now):
+        """The level this class would drop to if a SNAC were sent at ``now``."""
+        elapsed_ms = (now - self.last_send) * 1000.0
+        return min(self.max_level, ((self.window - 1) * self.current + elapsed_ms) / self.window)
+
+    def delay_for(self, floor, now):
+        """Seconds to wait so that a send keeps the level at or above ``floor``."""
+        needed_ms = self.window * floor - (self.window - 1) * self.current
+        return max(0.0, needed_ms / 1000.0 - (now - self.last_send))
+
+    def record_send(self, now):
+        self.current = self.level_after_send(now)
+        self.last_send = now
+        self.sends += 1
+
+    def snapshot(self, now=None):
+        now = time.monotonic() if now is None else now
+        return {
+            "window": self.window,
+            "clear": self.clear,
+            "alert": self.alert,
+            "limit": self.limit,
+            "disconnect": self.disconnect,
+            "max_level": self.max_level,
+            "level": self.current,
+            "level_if_sent_now": self.level_after_send(now),
+            "sends": self.sends,
+        }
+
+
+class RateLimiter:
+    """Paces outbound SNACs against the rate classes the server announced.
+
+    Until rate info arrives (and for SNACs the server did not map to a class)
+    sends are not delayed.  ``headroom`` keeps a margin above the alert level
+    as a fraction of the clear-to-alert band, which absorbs clock skew between
+    us and the server without giving up much throughput.
+
+    The limiter never sleeps itself: the SendQueue asks ``delay`` before
+    writing a SNAC and calls ``record`` once it goes out.
+    """
+
+    def __init__(self, headroom=0.1, clock=time.monotonic):
+        self.headroom = headroom
+        self.clock = clock
+        self.classes = {}
+        self.snac_classes = {}
+        self.warnings = 0
+        self.limited = 0
+
+    def floor(self, rate_class):
+        return rate_class.alert + self.headroom * max(0, rate_class.clear - rate_class.alert)
+
+    def load_rate_info(self, data):
+        """Parse a 0x0001/0x0007 rate info payload. Returns the RateClasses."""
+        now = self.clock()
+        offset = 0
+        num_classes, = U16.unpack_from(data, offset)
+        offset += U16.size
+        for _ in range(num_classes):
+            if offset + RATE_CLASS.size > len(data):
+                raise ValueError("Incomplete rate class data")
+            self._apply_class(RATE_CLASS.unpack_from(data, offset), now)
+            offset += RATE_CLASS.size
+
+        if offset + U16.size > len(data):
+            return list(self.classes.values())
+        num_groups, = U16.unpack_from(data, offset)
+        offset += U16.size
+        for _ in range(num_groups):
+            if offset + RATE_GROUP_HEADER.size > len(data):
+                raise ValueError("Incomplete rate group header")
+            class_id, num_pairs = RATE_GROUP_HEADER.unpack_from(data, offset)
+            offset += RATE_GROUP_HEADER.size
+            if offset + num_pairs * SNAC_PAIR.size > len(data):
+                raise ValueError("Incomplete rate group SNAC pairs")
+            rate_class = self.classes.get(class_id)
+            for _ in range(num_pairs):
+                pair = SNAC_PAIR.unpack_from(data, offset)
+                offset += SNAC_PAIR.size
+                if rate_class is not None:
+                    self.snac_classes[pair] = rate_class
+        return list(self.classes.values())
+
+    def apply_change(self, data):
+        """Parse a 0x0001/0x000A rate change. Returns ``(code, RateClass)``."""
+        code, = U16.unpack_from(data, 0)
+        rate_class = self._apply_class(RATE_CLASS.unpack_from(data, U16.size), self.clock())
+        if code == 0x0002:
+            self.warnings += 1
+        elif code == 0x0003:
+            self.limited += 1
+        return code, rate_class
+
+    def _apply_class(self, fields, now):
+        class_id, window, clear, alert, limit, disconnect, current, max_level, _last_time, state = fields
+        rate_class = self.classes.get(class_id)
+        if rate_class is None:
+            rate_class = self.classes[class_id] = RateClass(
+                class_id, window, clear, alert, limit, disconnect, current, max_level, state, now)
+        else:
+            rate_class.update(window, clear, alert, limit, disconnect, current, max_level, state, now)
+        return rate_class
+
+    def class_for(self, family, subtype):
+        return self.snac_classes.get((family, subtype))
+
+    def delay(self, family, subtype):
+        rate_class = self.snac_classes.get((family, subtype))
+        if rate_class is None:
+            return 0.0
+        return rate_class.delay_for(self.floor(rate_class), self.clock())
+
+    def record(self, family, subtype):
+        rate_class = self.snac_classes.get((family, subtype))
+        if rate_class is not None:
+            rate_class.record_send(self.clock())
+
+    def metrics(self):
+        now = self.clock()
+        return {
+            "classes": {class_id: rate_class.snapshot(now) for class_id, rate_class in sorted(self.classes.items())},
+            "warnings": self.warnings,
+            "limited": self.limited,
+        }
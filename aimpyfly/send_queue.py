@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from .capture import OUTBOUND
+from .log_utils import get_custom_logger
+from .oscar_protocol import patch_seq
+
+# Priority lanes, drained in this order on every writer wakeup.
+CONTROL = 0  # keep-alives, acks, sign-on and service requests
+IM = 1       # instant messages
+TYPING = 2   # typing notifications
+LANES = (CONTROL, IM, TYPING)
+LANE_NAMES = ("control", "im", "typing")
+
+
+class OutboundFrame:
+    __slots__ = ('frame', 'lane', 'family', 'subtype', 'key', 'enqueued', 'future')
+
+    def __init__(self, frame, lane, family, subtype, key, enqueued, future):
+        self.frame = frame
+        self.lane = lane
+        self.family = family
+        self.subtype = subtype
+        self.key = key
+        self.enqueued = enqueued
+        self.future = future
+
+
+class SendQueue:
+    """The only task that writes to the connection.
+
+    Frames are queued already encoded, with a placeholder FLAP sequence
+    number; the writer stamps sequence numbers at write time, so numbering
+    always matches wire order.  Each wakeup takes everything that is ready --
+    control first, then IMs, then typing -- and hands it to the transport in
+    a single ``writelines`` call.
+
+    A frame queued with a ``key`` replaces a still-pending frame with the same
+    key (e.g. a newer typing state for the same buddy), and frames older than
+    their lane's ``stale_after`` are dropped instead of sent.  SNACs that
+    belong to a rate class are held back, without blocking other lanes, until
+    the rate limiter says they can go.
+    """
+
+    def __init__(self, writer, next_seq, rate_limiter=None, stale_after=None, logger=None, clock=time.monotonic,
+                 capture=None):
+        self.writer = writer
+        self.next_seq = next_seq
+        self.rate_limiter = rate_limiter
+        self.stale_after = {TYPING: 3.0} if stale_after is None else dict(stale_after)
+        self.clock = clock
+        self.capture = capture
+        self.logger = logger or get_custom_logger(name="AIMSend", level=logging.WARNING)
+        self._lanes = tuple(deque() for _ in LANES)
+        self._keyed = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.error = None
+
+        self.wakeups = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.max_batch = 0
+        self.superseded = 0
+        self.stale = 0
+        self.rate_delayed = 0
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def __len__(self):
+        return sum(len(lane) for lane in self._lanes)
+
+    def start(self):
+        if not self.running:
+            self.error = None
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._fail_pending(ConnectionError("Send queue stopped"))
+
+    def enqueue(self, frame, lane=CONTROL, family=None, subtype=None, key=None):
+        """Queue an encoded frame. Returns a future resolved once it is written.
+
+        The future's result is True once the frame (or the newer frame that
+        superseded it under the same key) is written, and False if it was
+        dropped as stale.
+        """
+        if self.error is not None:
+            raise ConnectionError(f"Send queue failed: {self.error}")
+        if key is not None:
+            pending = self._keyed.get(key)
+            if pending is not None:
+                pending.frame = frame
+                pending.enqueued = self.clock()
+                self.superseded += 1
+                return pending.future
+        item = OutboundFrame(frame, lane, family, subtype, key, self.clock(),
+                             asyncio.get_running_loop().create_future())
+        self._lanes[lane].append(item)
+        if key is not None:
+            self._keyed[key] = item
+        self._wakeup.set()
+        return item.future
+
+    async def send(self, frame, lane=CONTROL, family=None, subtype=None, key=None):
+        return await self.enqueue(frame, lane, family, subtype, key)
+
+    def _take_ready(self, now):
+        """Pop every frame that may be written now. Returns (batch, retry_delay)."""
+        batch = []
+        retry = None
+        limiter = self.rate_limiter
+        for lane, queue in enumerate(self._lanes):
+            stale_after = self.stale_after.get(lane)
+            while queue:
+                item = queue[0]
+                if stale_after is not None and now - item.enqueued > stale_after:
+                    queue.popleft()
+                    self._forget(item)
+                    self.stale += 1
+                    if not item.future.done():
+                        item.future.set_result(False)
+                    continue
+                if limiter is not None and item.family is not None:
+                    wait = limiter.delay(item.family, item.subtype)
+                    if wait > 0:
+                        # Keep this lane in order; other lanes may still go.
+                        self.rate_delayed += 1
+                        retry = wait if retry is None else min(retry, wait)
+                        break
+                    limiter.record(item.family, item.subtype)
+                queue.popleft()
+                self._forget(item)
+                patch_seq(item.frame, self.next_seq())
+                batch.append(item)
+        return batch, retry
+
+    def _forget(self, item):
+        if item.key is not None and self._keyed.get(item.key) is item:
+            del self._keyed[item.key]
+
+    async def _run(self):
+        while True:
+            if not len(self):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            batch, retry = self._take_ready(self.clock())
+            if batch:
+                if not await self._write(batch):
+                    return
+            elif retry is not None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), retry)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _write(self, batch):
+        frames = [item.frame for item in batch]
+        try:
+            self.writer.writelines(frames)
+            await self.writer.drain()
+        except Exception as e:
+            self.error = e
+            self.logger.error(f"Error writing {len(frames)} frames: {e}")
+            for item in batch:
+                self._fail(item, e)
+            self._fail_pending(e)
+            return False
+        if self.capture is not None:
+            for frame in frames:
+                self.capture.write(OUTBOUND, frame)
+        self.wakeups += 1
+        self.frames_written += len(frames)
+        self.bytes_written += sum(len(frame) for frame in frames)
+        if len(frames) > self.max_batch:
+            self.max_batch = len(frames)
+        for item in batch:
+            if not item.future.done():
+                item.future.set_result(True)
+        return True
+
+    def _fail_pending(self, error):
+        for queue in self._lanes:
+            while queue:
+                self._fail(queue.popleft(), error)
+        self._keyed.clear()
+
+    @staticmethod
+    def _fail(item, error):
+        if not item.future.done():
+            item.future.set_exception(error)
+            # Retrieve it so a fire-and-forget sender doesn't trigger
+            # "exception was never retrieved" warnings.
+            item.future.exception()
+
+    def metrics(self):
+        return {
+            "depth": {LANE_NAMES[lane]: len(queue) for lane, queue in enumerate(self._lanes)},
+            "wakeups": self.wakeups,
+            "frames_written": self.frames_written,
+            "bytes_written": self.bytes_written,
+            "max_batch": self.max_batch,
+            "superseded": self.superseded,
+            "stale": self.stale,
+            "rate_delayed": self.rate_delayed,
+        }
@@ -0,0 +1,46 @@
+class SnacRegistry:
+    """Table of SNAC handlers keyed by ``(family, subtype)``.
+
+    Handlers are coroutines taking ``(client, snac)`` where ``snac`` is a
+    :class:`~aimpyfly.dispatch.SnacEvent`.  Family modules under
+    ``aimpyfly.handlers`` register into :data:`SNAC_HANDLERS` at import time;
+    each client works on its own :meth:`copy`, so per-client additions never
+    leak into other clients.
+    """
+
+    def __init__(self, handlers=None, fallback=None):
+        self._handlers = dict(handlers or {})
+        self._fallback = fallback
+
+    def __contains__(self, key):
+        return key in self._handlers
+
+    def __len__(self):
+        return len(self._handlers)
+
+    def register(self, family, subtype, handler):
+        self._handlers[(family, subtype)] = handler
+        return handler
+
+    def handler(self, family, subtype):
+        """Decorator form of :meth:`register`."""
+        def decorator(handler):
+            return self.register(family, subtype, handler)
+        return decorator
+
+    def fallback(self, handler):
+        """Decorator setting the handler used for unregistered SNACs."""
+        self._fallback = handler
+        return handler
+
+    def get(self, family, subtype):
+        return self._handlers.get((family, subtype))
+
+    def lookup(self, family, subtype):
+        return self._handlers.get((family, subtype), self._fallback)
+
+    def copy(self):
+        return SnacRegistry(self._handlers, self._fallback)
+
+
+SNAC_HANDLERS = SnacRegistry()
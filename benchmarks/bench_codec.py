@@ -0,0 +1,239 @@
+"""
+Codec microbenchmarks: OSCARProtocol encoders/decoders and the client's parsers.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_codec                 # compare against the saved baseline
+    python -m benchmarks.bench_codec --save          # record a new baseline
+    python -m benchmarks.bench_codec -k tlv          # only cases whose name contains "tlv"
+
+Every case runs on payloads shaped like ones captured from AIM servers and
+clients (HTML-wrapped IMs with full sender user info, a five-class rate
+info reply, an auth reply with a 256-byte cookie).  capture_write_flap and
+hex_debug_log compare recording a FLAP to a capture file with dumping it
+as hex to a DEBUG log.  Each reports ops/s (the
+best of several timed repeats) and two allocation figures from tracemalloc:
+
+    bytes/op   peak memory allocated above the starting level during one call
+    blocks/op  memory blocks still alive per call when the results are kept,
+               i.e. what the result itself costs
+
+Against a baseline, a case regresses when its ops/s drops by more than
+--tolerance (default 25%) or its bytes/op grows by more than the tolerance
+and 64 bytes; the exit status is 1 if any case regressed.  The allocation
+figures are deterministic for a given Python version; timings only compare
+on the same (quiet) machine, which the baseline records.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import struct
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+from aimpyfly.aim_client import AIMClient
+from aimpyfly.capture import INBOUND, CaptureWriter
+from aimpyfly.framer import FlapFramer
+from aimpyfly.icbm import decode_incoming_im
+from aimpyfly.oscar_protocol import OSCARProtocol
+from aimpyfly.rate_limit import RATE_CLASS, RATE_GROUP_HEADER, SNAC_PAIR
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "codec.json")
+
+oscar = OSCARProtocol()
+oscar.logger.setLevel(logging.WARNING)
+
+
+def tlv(tlv_type, value):
+    return oscar.create_tlv(tlv_type, value)
+
+
+# An auth reply: screen name, BOS address, 256-byte cookie, email, registration status.
+AUTH_REPLY = (tlv(0x0001, b'chatbot1') + tlv(0x0005, b'64.12.25.47:5190') + tlv(0x0006, bytes(range(256))) +
+              tlv(0x0011, b'chatbot1@example.com') + tlv(0x0013, b'\x00\x03') +
+              tlv(0x0054, b'http://aim.example.com/password/change_password.adp'))
+
+# Sender user info as an AIM 5.x client shows up: class, member since, online time, status, capabilities.
+USER_INFO = (b'\x09BuddyName' + struct.pack('!HH', 0, 6) +
+             tlv(0x0001, b'\x00\x10') + tlv(0x0005, struct.pack('!I', 1103932800)) +
+             tlv(0x000F, struct.pack('!I', 3742)) + tlv(0x0003, struct.pack('!I', 1130000000)) +
+             tlv(0x0006, b'\x00\x00\x00\x00') + tlv(0x000D, bytes(range(16)) * 6))
+
+IM_HTML = ('<HTML><BODY BGCOLOR="#ffffff"><FONT FACE="Arial" LANG="0" SIZE=2>hey, are you around? '
+           'can you look up the weather for <B>Chicago</B> &amp; Milwaukee tomorrow?<BR>thx :-)'
+           '</FONT></BODY></HTML>').encode()
+IM_MESSAGE = (struct.pack('!BBH', 0x05, 0x01, 4) + b'\x01\x01\x01\x02' +
+              struct.pack('!BBHHH', 0x01, 0x01, len(IM_HTML) + 4, 0, 0) + IM_HTML)
+INCOMING_IM = (b'\x91\x2c\x07\x7e\x1d\x03\x00\x00' + b'\x00\x01' + USER_INFO +
+               tlv(0x0002, IM_MESSAGE) + tlv(0x0003, b''))
+
+REPLY_TEXT = ("It'll be partly cloudy in Chicago tomorrow with a high of 58F, and rain\n"
+              "in Milwaukee with a high of 54F. Anything else?")
+
+
+def rate_info():
+    """Five rate classes; all SNACs of families 1-4, 9 and 0x13 mapped to them."""
+    classes = [(1, 80, 2500, 2000, 1500, 800, 6000, 6000, 0, 0), (2, 80, 3000, 2000, 1500, 1000, 6000, 6000, 0, 0),
+               (3, 20, 5100, 5000, 4000, 3000, 6000, 6000, 0, 0), (4, 20, 5500, 5300, 4200, 3000, 8000, 8000, 0, 0),
+               (5, 10, 5500, 5300, 4200, 3000, 8000, 8000, 0, 0)]
+    pairs = [(family, subtype) for family in (1, 2, 3, 4, 9, 0x13) for subtype in range(1, 0x22)]
+    data = struct.pack('!H', len(classes)) + b''.join(RATE_CLASS.pack(*fields) for fields in classes)
+    for class_id in range(1, 6):
+        group = pairs[class_id - 1::5]
+        data += RATE_GROUP_HEADER.pack(class_id, len(group)) + b''.join(SNAC_PAIR.pack(*pair) for pair in group)
+    return data
+
+
+def flap_stream():
+    """A 16 KB read as a busy bot sees it: IMs, typing notifications and acks."""
+    typing = oscar.create_snac(0x0004, 0x0014, 0, 0, bytes(8) + b'\x00\x01\x09BuddyName\x00\x02')
+    im = oscar.create_snac(0x0004, 0x0007, 0, 0, INCOMING_IM)
+    ack = oscar.create_snac(0x0004, 0x000C, 0, 0x8001, bytes(8) + b'\x00\x01\x09BuddyName')
+    stream = b''
+    seq = 0
+    while len(stream) < 16384:
+        for payload in (typing, im, ack, typing):
+            seq += 1
+            stream += oscar.create_flap(0x02, seq, payload)
+    return stream
+
+
+def make_client():
+    client = AIMClient('127.0.0.1', 5190, 'chatbot1', 'secret', loglevel=logging.WARNING)
+    client.logger.setLevel(logging.WARNING)
+    client.oscar.logger.setLevel(logging.WARNING)
+    return client
+
+
+def encode_reply(client, cookie=b'\x91\x2c\x07\x7e\x1d\x03\x00\x01'):
+    """What send_message/send_im do to a reply before it is queued."""
+    html = f'<HTML><BODY BGCOLOR="#ffffff"><FONT LANG="0">{REPLY_TEXT.replace(chr(10), "<br>")}</FONT></BODY></HTML>'
+    return client.oscar.encode_im_frame(0, 0x8001, cookie, b'BuddyName', html.encode('utf-8'), tlvs=((0x0003, b''),))
+
+
+def hex_logger():
+    """A DEBUG logger that formats records but writes them nowhere, like a hex dump to a quiet log."""
+    logger = logging.getLogger("bench_codec.hex")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+
+def cases(workdir):
+    client = make_client()
+    capture = CaptureWriter(os.path.join(workdir, "bench.aimcap"), backups=0)
+    debug = hex_logger()
+    rates = rate_info()
+    stream = flap_stream()
+    flap_payload = oscar.create_snac(0x0004, 0x0007, 0, 0, INCOMING_IM)
+    im_tlvs = INCOMING_IM[10 + len(USER_INFO):]
+    return {
+        "create_flap": lambda: oscar.create_flap(0x02, 42, flap_payload),
+        "create_snac": lambda: oscar.create_snac(0x0004, 0x0006, 0, 0x8001, INCOMING_IM),
+        "create_tlv": lambda: oscar.create_tlv(0x0006, AUTH_REPLY[:256]),
+        "read_tlvs": lambda: oscar.read_tlvs(AUTH_REPLY),
+        "read_tlvs.to_dict": lambda: oscar.read_tlvs(AUTH_REPLY).to_dict(),
+        "parse_tlvs": lambda: client.parse_tlvs(im_tlvs),
+        "parse_rate_limits": lambda: client.parse_rate_limits(rates),
+        "decode_incoming_im": lambda: decode_incoming_im(INCOMING_IM),
+        "send_message_encode": lambda: encode_reply(client),
+        "framer_16k_read": lambda: FlapFramer().feed(stream),
+        "capture_write_flap": lambda: capture.write_flap(INBOUND, 0x02, 42, flap_payload),
+        "hex_debug_log": lambda: debug.debug(f"FLAP packet contents: {bytes(flap_payload).hex()}"),
+    }
+
+
+def measure(func, repeat=7, min_time=0.2):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    best = min(timer.repeat(repeat, number)) / number
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(20):
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - start)
+    count = 1000
+    before = tracemalloc.take_snapshot()
+    kept = [func() for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    del kept
+    peaks.sort()
+    return {"ops_per_sec": 1.0 / best, "bytes_per_op": peaks[len(peaks) // 2], "blocks_per_op": max(0, blocks) / count}
+
+
+def compare(name, result, baseline, tolerance):
+    """Return a list of regression messages for one case."""
+    problems = []
+    if result["ops_per_sec"] < baseline["ops_per_sec"] * (1 - tolerance):
+        problems.append(f"ops/s {baseline['ops_per_sec']:,.0f} -> {result['ops_per_sec']:,.0f}")
+    allowed = baseline["bytes_per_op"] * (1 + tolerance) + 64
+    if result["bytes_per_op"] > allowed:
+        problems.append(f"bytes/op {baseline['bytes_per_op']} -> {result['bytes_per_op']}")
+    return [f"{name}: {problem}" for problem in problems]
+
+
+def environment():
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "processor": platform.processor() or None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-k", dest="pattern", default=None, help="only run cases whose name contains this")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved.get("results", {})
+        if saved.get("environment") != environment() and not args.save:
+            print(f"note: baseline was recorded on {saved.get('environment')}; timings may not compare")
+
+    results = {}
+    regressions = []
+    print(f"{'case':22} {'ops/s':>14} {'bytes/op':>9} {'blocks/op':>9}  vs baseline")
+    with tempfile.TemporaryDirectory() as workdir:
+        selected = {name: func for name, func in cases(workdir).items() if not args.pattern or args.pattern in name}
+        for name, func in selected.items():
+            result = results[name] = measure(func, args.repeat)
+            previous = baseline.get(name)
+            change = f"{result['ops_per_sec'] / previous['ops_per_sec'] - 1:+.1%}" if previous else "new"
+            print(f"{name:22} {result['ops_per_sec']:14,.0f} {result['bytes_per_op']:9,} {result['blocks_per_op']:9.1f}  {change}")
+            if previous and not args.save:
+                regressions += compare(name, result, previous, args.tolerance)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        if args.pattern:
+            results = {**baseline, **results}
+        with open(args.baseline, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+    elif regressions:
+        print("\nregressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
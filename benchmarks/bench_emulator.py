@@ -0,0 +1,115 @@
+"""
+Sign-on time, IM round trip and sustained IM throughput against the local emulator.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_emulator [--signons N] [--round-trips N] [--messages N]
+                                        [--latency SECONDS] [--fragment BYTES] [--no-rate-limits]
+
+Everything runs on one event loop: an OscarEmulator on two ephemeral ports
+and unmodified AIMClients connecting to it.  Round trips go through the
+emulator's echo user; throughput is one client sending to a second one,
+counted when the receiver's message callback runs.  By default throughput
+is bounded by the advertised rate class, which the client paces itself to;
+--no-rate-limits advertises one that never binds, to measure the client and
+emulator themselves.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from aimpyfly.aim_client import AIMClient
+from aimpyfly.emulator import DEFAULT_RATE_CLASS, UNLIMITED_RATE_CLASS, OscarEmulator
+from aimpyfly.metrics import TimingStats
+
+
+def new_client(emulator, username):
+    return AIMClient('127.0.0.1', emulator.auth_port, username, 'secret', loglevel=logging.ERROR)
+
+
+async def measure_signon(emulator, count):
+    stats = TimingStats()
+    for n in range(count):
+        client = new_client(emulator, f"signon{n}")
+        start = time.perf_counter()
+        await client.connect()
+        stats.add(time.perf_counter() - start)
+        await client.close()
+    return stats
+
+
+async def measure_round_trips(emulator, count):
+    client = new_client(emulator, "pinger")
+    replies = asyncio.Queue()
+
+    async def on_message(sender, text):
+        replies.put_nowait(time.perf_counter())
+
+    client.set_message_callback(on_message)
+    await client.connect()
+    stats = TimingStats(window=count)
+    for n in range(count):
+        start = time.perf_counter()
+        await client.send_message("echo", f"ping {n}")
+        stats.add(await asyncio.wait_for(replies.get(), 10) - start)
+    await client.close()
+    return stats
+
+
+async def measure_throughput(emulator, count):
+    sender = new_client(emulator, "sender")
+    receiver = new_client(emulator, "receiver")
+    done = asyncio.Event()
+    received = 0
+
+    async def on_message(who, text):
+        nonlocal received
+        received += 1
+        if received == count:
+            done.set()
+
+    receiver.set_message_callback(on_message)
+    await receiver.connect()
+    await sender.connect()
+    start = time.perf_counter()
+    deliveries = [await sender.send_message("receiver", f"message {n}") for n in range(count)]
+    await asyncio.wait_for(done.wait(), max(60, count))
+    elapsed = time.perf_counter() - start
+    delivered = sum(await asyncio.gather(*deliveries))
+    await sender.close()
+    await receiver.close()
+    return count / elapsed, delivered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--signons", type=int, default=20)
+    parser.add_argument("--round-trips", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the emulator adds to every frame it sends")
+    parser.add_argument("--fragment", type=int, default=None, help="split the emulator's writes into chunks of this many bytes")
+    parser.add_argument("--no-rate-limits", action="store_true")
+    args = parser.parse_args()
+
+    async def run():
+        async with OscarEmulator(latency=args.latency, fragment=args.fragment,
+                                 rate_class=UNLIMITED_RATE_CLASS if args.no_rate_limits else DEFAULT_RATE_CLASS) as emulator:
+            signon = await measure_signon(emulator, args.signons)
+            rtt = await measure_round_trips(emulator, args.round_trips)
+            throughput, delivered = await measure_throughput(emulator, args.messages)
+            return signon, rtt, throughput, delivered, emulator.stats
+
+    signon, rtt, throughput, delivered, stats = asyncio.run(run())
+    print(f"latency {args.latency * 1000:.1f} ms, fragment {args.fragment or 'off'}, "
+          f"rate limits {'off' if args.no_rate_limits else 'on'}")
+    for name, timing in (("sign-on", signon), ("IM round trip", rtt)):
+        snapshot = timing.snapshot()
+        print(f"{name + ':':15} mean {snapshot['mean'] * 1000:7.2f} ms  p50 {snapshot['p50'] * 1000:7.2f} ms  "
+              f"p99 {snapshot['p99'] * 1000:7.2f} ms  ({snapshot['count']} samples)")
+    print(f"{'throughput:':15} {throughput:,.0f} IMs/s sustained ({delivered}/{args.messages} acked, "
+          f"{stats['rate_limited']} rate limited)")
+
+
+if __name__ == "__main__":
+    main()
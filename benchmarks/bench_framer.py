@@ -0,0 +1,108 @@
+"""
+Inbound FLAP throughput: legacy read_exact/read_complete_flap loop vs FlapFramer.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_framer [--frames N] [--chunk BYTES]
+
+Both readers consume the same pre-built byte stream from an asyncio
+StreamReader fed in TCP-sized chunks.  The legacy reader is reproduced here
+as it was before the framer replaced it; it is measured without its 0.1 s
+per-packet poll (which alone capped it at ~10 FLAPs/s) and, separately, with
+the poll over a small sample.
+"""
+import argparse
+import asyncio
+import struct
+import time
+
+from aimpyfly.framer import FlapFramer
+from aimpyfly.oscar_protocol import OSCARProtocol
+
+oscar = OSCARProtocol()
+
+
+def build_stream(count):
+    """A mix of typing notifications, IMs and acks, as a busy bot sees them."""
+    typing = oscar.create_snac(0x0004, 0x0014, 0, 0, b'\x00' * 8 + b'\x00\x01\x05buddy\x00\x02')
+    im = oscar.create_snac(0x0004, 0x0007, 0, 0, b'\x01' * 8 + b'\x00\x01\x05buddy' + b'\x00' * 4 + b'<HTML>' + b'x' * 160 + b'</HTML>')
+    ack = oscar.create_snac(0x0004, 0x000C, 0, 0, b'\x02' * 8 + b'\x00\x01\x05buddy')
+    payloads = (typing, im, ack, typing)
+    return b''.join(oscar.create_flap(2, n & 0xFFFF, payloads[n % 4]) for n in range(count))
+
+
+def make_reader(data, chunk):
+    reader = asyncio.StreamReader(limit=2 ** 24)
+    for offset in range(0, len(data), chunk):
+        reader.feed_data(data[offset:offset + chunk])
+    reader.feed_eof()
+    return reader
+
+
+async def legacy_reader(reader, count, poll=0.0):
+    async def read_exact(n):
+        data = b""
+        while len(data) < n:
+            chunk = await reader.read(n - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    received = 0
+    while received < count:
+        flap_header = await asyncio.wait_for(read_exact(6), 60.0)
+        flap_id, channel, seq_num, data_length = struct.unpack('>BBHH', flap_header)
+        flap_data = await asyncio.wait_for(read_exact(data_length), 60.0)
+        full_flap = flap_header + flap_data
+        struct.unpack('>BBHH', full_flap[:6])
+        full_flap[6:]
+        received += 1
+        if poll:
+            await asyncio.sleep(poll)
+    return received
+
+
+async def framer_reader(reader, count, read_size=65536):
+    framer = FlapFramer()
+    received = 0
+    while received < count:
+        chunk = await asyncio.wait_for(reader.read(read_size), 60.0)
+        if not chunk:
+            break
+        received += len(framer.feed(chunk))
+    return received
+
+
+def measure(reader_factory, count):
+    async def run():
+        start = time.perf_counter()
+        received = await reader_factory()
+        return received, time.perf_counter() - start
+    received, elapsed = asyncio.run(run())
+    assert received == count, f"expected {count} frames, got {received}"
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=200_000)
+    parser.add_argument("--chunk", type=int, default=16384, help="bytes delivered per simulated TCP read")
+    parser.add_argument("--poll-sample", type=int, default=20, help="frames measured with the legacy 0.1 s poll (0 to skip)")
+    args = parser.parse_args()
+
+    data = build_stream(args.frames)
+    print(f"{args.frames} FLAPs, {len(data)} bytes, {args.chunk}-byte reads")
+
+    before = measure(lambda: legacy_reader(make_reader(data, args.chunk), args.frames), args.frames)
+    after = measure(lambda: framer_reader(make_reader(data, args.chunk), args.frames), args.frames)
+    if args.poll_sample:
+        sample = build_stream(args.poll_sample)
+        polled = measure(lambda: legacy_reader(make_reader(sample, args.chunk), args.poll_sample, poll=0.1), args.poll_sample)
+        print(f"before (read_complete_flap + 0.1 s poll): {polled:12,.0f} FLAPs/s")
+    print(f"before (read_complete_flap, no poll):      {before:12,.0f} FLAPs/s")
+    print(f"after  (FlapFramer):                       {after:12,.0f} FLAPs/s  ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
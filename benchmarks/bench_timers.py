@@ -0,0 +1,159 @@
+"""
+Scheduler overhead for per-user deadlines: one asyncio task per timer vs TimerWheel.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_timers [--users 10000] [--duration 5] [--rate 5000]
+
+Three measurements, each for both approaches:
+
+- reschedule: the cost of moving a pending debounce deadline, as every short
+  message does (cancel the old sleeping task and start a new one, vs
+  ``TimerWheel.schedule`` on an existing key);
+- debounce: ``--rate`` messages/s spread over ``--users`` users for
+  ``--duration`` seconds, each pushing its user's 1.5 s deadline back;
+- typing: every user with a reply in flight, refreshing its typing
+  indicator every ``--typing-interval`` seconds.
+
+The live runs report CPU seconds used, event-loop lag and timers fired.  The
+task-per-timer side reproduces the bot's old ``_buffer_message`` /
+``_send_periodic_typing`` pattern.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aimbot.bot.timers import TimerWheel
+from aimpyfly.metrics import TimingStats
+
+
+class TaskTimers:
+    """The old pattern: a sleeping task per pending deadline, cancelled to reschedule."""
+
+    def __init__(self):
+        self.tasks = {}
+        self.fired = 0
+
+    async def _sleep_then(self, delay, callback, interval):
+        try:
+            await asyncio.sleep(delay)
+            callback()
+            while interval is not None:
+                await asyncio.sleep(interval)
+                callback()
+        except asyncio.CancelledError:
+            pass
+
+    def schedule(self, key, delay, callback, interval=None):
+        task = self.tasks.get(key)
+        if task is not None and not task.done():
+            task.cancel()
+        self.tasks[key] = asyncio.create_task(self._sleep_then(delay, callback, interval))
+
+    async def close(self):
+        tasks = [task for task in self.tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def lag_monitor(stats, interval=0.01):
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        stats.add(max(0.0, time.perf_counter() - expected))
+
+
+async def measure_reschedule(make_timers, users, operations):
+    timers = make_timers()
+    keys = [f"user{n}" for n in range(users)]
+    callback = lambda: None  # noqa: E731
+    for key in keys:
+        timers.schedule(key, 60.0, callback)
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    for n in range(operations):
+        timers.schedule(keys[n % users], 60.0, callback)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0)
+    await timers.close()
+    return operations / elapsed
+
+
+async def measure_live(make_timers, workload, args):
+    timers = make_timers()
+    fired = [0]
+
+    def callback():
+        fired[0] += 1
+
+    lag = TimingStats(window=100_000)
+    monitor = asyncio.create_task(lag_monitor(lag))
+    cpu = time.process_time()
+    await workload(timers, callback, args)
+    cpu = time.process_time() - cpu
+    monitor.cancel()
+    await timers.close()
+    return cpu, lag.snapshot(), fired[0]
+
+
+async def debounce_workload(timers, callback, args):
+    """Messages at ``args.rate``/s from random users, each pushing that user's deadline back."""
+    rng = random.Random(1)
+    batch = max(1, int(args.rate * 0.01))
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        for _ in range(batch):
+            timers.schedule(f"user{rng.randrange(args.users)}", args.debounce, callback)
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(args.debounce + 0.2)
+
+
+async def typing_workload(timers, callback, args):
+    """Every user refreshing a typing indicator for ``args.duration`` seconds."""
+    rng = random.Random(2)
+    for n in range(args.users):
+        timers.schedule(("typing", n), rng.uniform(0, args.typing_interval), callback, interval=args.typing_interval)
+    await asyncio.sleep(args.duration)
+
+
+def report(name, tasks, wheel):
+    (task_cpu, task_lag, task_fired), (wheel_cpu, wheel_lag, wheel_fired) = tasks, wheel
+    print(f"{name}:")
+    for label, cpu, lag, fired in (("tasks", task_cpu, task_lag, task_fired),
+                                   ("wheel", wheel_cpu, wheel_lag, wheel_fired)):
+        print(f"  {label}  cpu {cpu:6.2f} s   loop lag p50 {lag['p50'] * 1000:6.2f} ms  "
+              f"p99 {lag['p99'] * 1000:6.2f} ms  max {lag['max'] * 1000:7.2f} ms   fired {fired:>8}")
+    if wheel_cpu:
+        print(f"  cpu ratio {task_cpu / wheel_cpu:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per live run")
+    parser.add_argument("--rate", type=int, default=5_000, help="messages per second in the debounce run")
+    parser.add_argument("--debounce", type=float, default=1.5)
+    parser.add_argument("--typing-interval", type=float, default=1.0)
+    parser.add_argument("--operations", type=int, default=200_000, help="reschedules timed")
+    parser.add_argument("--tick", type=float, default=0.05, help="TimerWheel tick")
+    args = parser.parse_args()
+
+    def wheel():
+        return TimerWheel(tick=args.tick)
+
+    print(f"{args.users} users, wheel tick {args.tick * 1000:.0f} ms")
+    tasks = asyncio.run(measure_reschedule(TaskTimers, args.users, args.operations))
+    wheeled = asyncio.run(measure_reschedule(wheel, args.users, args.operations))
+    print(f"reschedule:\n  tasks  {tasks:12,.0f} ops/s\n  wheel  {wheeled:12,.0f} ops/s  ({wheeled / tasks:.1f}x)")
+    report(f"debounce ({args.rate} msg/s for {args.duration:.0f} s)",
+           asyncio.run(measure_live(TaskTimers, debounce_workload, args)),
+           asyncio.run(measure_live(wheel, debounce_workload, args)))
+    report(f"typing refresh (every {args.typing_interval} s for {args.duration:.0f} s)",
+           asyncio.run(measure_live(TaskTimers, typing_workload, args)),
+           asyncio.run(measure_live(wheel, typing_workload, args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Stand-in for the Dify ``/chat-messages`` endpoint (blocking mode), for soak tests.
+
+Run standalone:
+
+    python -m benchmarks.mock_dify [--port 8081] [--latency lognormal:0.8,0.6] [--error-rate 0.01] [--rate-limit-rate 0.02]
+
+then point DIFY_API_URL at http://127.0.0.1:8081/v1.
+
+Latency is drawn per request from a distribution spec:
+
+    fixed:SECONDS
+    uniform:LOW,HIGH
+    exp:MEAN
+    lognormal:MEDIAN,SIGMA
+
+A share of requests (``error_rate``) fail with a 500 and another share
+(``rate_limit_rate``) with Dify's 429 "too many requests" body; both are
+answered after the drawn latency, as a loaded backend would.
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+WORDS = ("the", "weather", "tomorrow", "looks", "like", "rain", "in", "the", "morning", "and", "sun", "later",
+         "you", "could", "try", "asking", "again", "about", "that", "movie", "it", "was", "released", "in", "1999",
+         "sure", "here", "is", "a", "short", "answer", "to", "your", "question", "with", "some", "detail")
+
+
+def parse_latency(spec):
+    """Turn a distribution spec into a function of a ``random.Random`` returning seconds."""
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',')] if args else []
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(*values)
+    if kind == "exp" and len(values) == 1:
+        return lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+class MockDify:
+    """aiohttp app answering ``POST /v1/chat-messages`` like Dify's blocking mode."""
+
+    def __init__(self, latency="lognormal:0.8,0.6", error_rate=0.0, rate_limit_rate=0.0, answer_words=(8, 80),
+                 api_key=None, seed=None):
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.answer_words = answer_words
+        self.api_key = api_key
+        self.rng = random.Random(seed)
+        self.app = web.Application()
+        self.app.router.add_post('/v1/chat-messages', self.chat_messages)
+        self.runner = None
+        self.port = None
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.statuses = {}
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def _reply(self, status, body):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        return web.json_response(body, status=status)
+
+    async def chat_messages(self, request):
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.api_key is not None and request.headers.get("Authorization") != f"Bearer {self.api_key}":
+                return self._reply(401, {"code": "unauthorized", "message": "Access token is invalid", "status": 401})
+            payload = await request.json()
+            if not payload.get("query"):
+                return self._reply(400, {"code": "invalid_param", "message": "query is required", "status": 400})
+            await asyncio.sleep(max(0.0, self.latency(self.rng)))
+            draw = self.rng.random()
+            if draw < self.rate_limit_rate:
+                return self._reply(429, {"code": "too_many_requests",
+                                         "message": "Too many tokens in the last minute, please slow down.",
+                                         "status": 429})
+            if draw < self.rate_limit_rate + self.error_rate:
+                return self._reply(500, {"code": "internal_server_error",
+                                         "message": "The server encountered an internal error.", "status": 500})
+            words = self.rng.randint(*self.answer_words)
+            answer = " ".join(self.rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+            conversation_id = payload.get("conversation_id") or str(uuid.uuid4())
+            return self._reply(200, {
+                "event": "message",
+                "message_id": str(uuid.uuid4()),
+                "conversation_id": conversation_id,
+                "mode": "chat",
+                "answer": answer,
+                "metadata": {"usage": {"prompt_tokens": len(payload["query"].split()), "completion_tokens": words}},
+                "created_at": int(time.time()),
+            })
+        finally:
+            self.in_flight -= 1
+
+    def metrics(self):
+        return {
+            "requests": self.requests,
+            "max_in_flight": self.max_in_flight,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="lognormal:0.8,0.6")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    async def serve():
+        dify = MockDify(args.latency, args.error_rate, args.rate_limit_rate)
+        await dify.start(args.host, args.port)
+        print(f"mock Dify at http://{args.host}:{dify.port}/v1  (Ctrl-C to stop)")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await dify.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+End-to-end soak test: one AIMBot, a stand-in Dify server and N simulated AIM users.
+
+Run from the repository root:
+
+    python -m benchmarks.soak_bot [--users 50] [--duration 120] [--latency lognormal:0.8,0.6]
+                                  [--error-rate 0.01] [--rate-limit-rate 0.02]
+                                  [--budget end_to_end.p99=10] [--json results.json]
+
+Everything shares one event loop: the OSCAR emulator, the mock Dify server,
+the bot (unmodified, talking to both over TCP) and one AIMClient per
+simulated user.  Each user thinks for a while (exponentially distributed),
+then types a burst of one to four messages, sending typing notifications
+and pausing between them, and waits for the bot's replies.
+
+Each Dify request is one unit of work, and its stages are timed:
+
+    inbound     a user's send until the bot's message handler sees it
+    hold        handler until the Dify request starts (buffering, the
+                bot's own pause before answering, waiting on a busy user)
+    backend     the Dify request itself
+    outbound    the Dify response until the user's client receives the reply
+    end_to_end  the last message the request answered until the reply arrives
+
+Event-loop lag is sampled by a task that sleeps for a fixed interval and
+measures how late it wakes up.  Memory growth is the process's resident set
+size at the end, minus its size once every user had signed on.  Budgets
+are ``key=value`` limits on the flattened results, e.g. ``end_to_end.p99=10``,
+``loop_lag.max=0.25``, ``memory_growth_mb=64`` or ``error_rate=0.05``.  The
+exit status is 1 if any budget is exceeded.  Since the users share the
+bot's process, the lag and memory figures include them as well.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import time
+from collections import deque
+
+from aimpyfly.aim_client import AIMClient
+from aimpyfly.emulator import DEFAULT_RATE_CLASS, UNLIMITED_RATE_CLASS, OscarEmulator
+from aimpyfly.icbm import TYPING_BEGUN, TYPING_FINISHED
+from aimpyfly.metrics import TimingStats
+from benchmarks.mock_dify import MockDify
+
+BOT_NAME = "soakbot"
+STAGES = ("inbound", "hold", "backend", "outbound", "end_to_end")
+DEFAULT_BUDGETS = {"end_to_end.p99": 15.0, "loop_lag.p99": 0.1, "error_rate": 0.1, "memory_growth_mb": 128.0}
+
+OPENERS = ("hey", "hi there", "yo", "u there?", "ok", "quick question", "so", "hmm")
+QUESTIONS = ("what's the weather going to be like in chicago tomorrow",
+             "can you recommend a good sci fi movie from the 90s",
+             "how do I convert a string to an int in python",
+             "whats the capital of australia again",
+             "remind me what the difference between tcp and udp is",
+             "write me a two line poem about dialup modems",
+             "how long should I boil an egg for a runny yolk",
+             "what year did aim shut down")
+FOLLOW_UPS = ("thanks", "and also why?", "lol", "wait really", "can you explain that a bit more", "cool")
+
+
+def rss_bytes():
+    """Current resident set size, or the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class PendingMessage:
+    __slots__ = ('text', 'sent', 'arrived')
+
+    def __init__(self, text, sent):
+        self.text = text
+        self.sent = sent
+        self.arrived = None
+
+
+class SoakRecorder:
+    """Collects stage timings by matching Dify queries and replies to users' messages."""
+
+    def __init__(self):
+        self.stages = {stage: TimingStats(window=100_000) for stage in STAGES}
+        self.pending = {}      # user -> messages sent, not yet answered
+        self.completed = {}    # user -> deque of (Dify finished, messages answered)
+        self.messages_sent = 0
+        self.replies = 0
+        self.error_replies = 0
+        self.unmatched_replies = 0
+        self.dify_calls = 0
+
+    def sent(self, user, text):
+        self.messages_sent += 1
+        self.pending.setdefault(user, []).append(PendingMessage(text, time.perf_counter()))
+
+    def arrived(self, user, text):
+        now = time.perf_counter()
+        for message in self.pending.get(user, ()):
+            if message.arrived is None and message.text == text:
+                message.arrived = now
+                self.stages["inbound"].add(now - message.sent)
+                return
+
+    def take(self, user, query):
+        """Remove and return the pending messages a (possibly combined) query answers, in order."""
+        pending = self.pending.get(user, [])
+        taken = []
+        remaining = query
+        for message in pending:
+            if message.arrived is None:
+                continue
+            text = message.text
+            if remaining == text or remaining.startswith(text + " "):
+                taken.append(message)
+                remaining = remaining[len(text) + 1:]
+                if not remaining:
+                    break
+        for message in taken:
+            pending.remove(message)
+        return taken
+
+    def backend_done(self, user, messages, started, finished):
+        self.dify_calls += 1
+        if messages:
+            self.stages["hold"].add(started - max(message.arrived for message in messages))
+        self.stages["backend"].add(finished - started)
+        self.completed.setdefault(user, deque()).append((finished, messages))
+
+    def reply(self, user, text):
+        now = time.perf_counter()
+        self.replies += 1
+        if text.startswith("Error:") or text.startswith("Sorry,") or text.startswith("I'm receiving too many"):
+            self.error_replies += 1
+        completed = self.completed.get(user)
+        if not completed:
+            self.unmatched_replies += 1
+            return
+        finished, messages = completed.popleft()
+        self.stages["outbound"].add(now - finished)
+        if messages:
+            self.stages["end_to_end"].add(now - max(message.sent for message in messages))
+
+
+class LoopLagMonitor:
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.lag = TimingStats(window=100_000)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag.add(max(0.0, time.perf_counter() - expected))
+
+
+class SimulatedUser:
+    """One AIM user chatting with the bot in bursts."""
+
+    def __init__(self, index, emulator, recorder, args, rng):
+        self.name = f"soakuser{index}"
+        self.recorder = recorder
+        self.args = args
+        self.rng = rng
+        self.client = AIMClient('127.0.0.1', emulator.auth_port, self.name, 'secret', loglevel=logging.CRITICAL)
+        self.client.set_message_callback(self.on_message)
+        self.reply_received = asyncio.Event()
+
+    async def on_message(self, sender, text):
+        self.recorder.reply(self.name, text)
+        self.reply_received.set()
+
+    def compose_burst(self):
+        burst = []
+        if self.rng.random() < 0.4:
+            burst.append(self.rng.choice(OPENERS))
+        burst.append(self.rng.choice(QUESTIONS))
+        while len(burst) < 4 and self.rng.random() < 0.3:
+            burst.append(self.rng.choice(FOLLOW_UPS))
+        return burst
+
+    async def run(self, deadline):
+        args = self.args
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.rng.expovariate(1.0 / args.think))
+            if time.perf_counter() >= deadline:
+                break
+            self.reply_received.clear()
+            for text in self.compose_burst():
+                await self.client.send_typing(BOT_NAME, TYPING_BEGUN)
+                await asyncio.sleep(len(text) / args.typing_cps * self.rng.uniform(0.5, 1.5))
+                await self.client.send_typing(BOT_NAME, TYPING_FINISHED)
+                self.recorder.sent(self.name, text)
+                await self.client.send_message(BOT_NAME, text)
+                await asyncio.sleep(self.rng.uniform(0.2, 1.5))
+            try:
+                await asyncio.wait_for(self.reply_received.wait(), args.reply_timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+def instrument_bot(bot, recorder):
+    """Wrap the bot's message handler and Dify call to timestamp each stage."""
+    handle_message = bot.handle_message
+    send_to_dify = bot.dify_client.send_message
+
+    async def timed_handle_message(sender, message):
+        recorder.arrived(sender, message)
+        await handle_message(sender, message)
+
+    async def timed_send_to_dify(user_id, message):
+        messages = recorder.take(user_id, message)
+        started = time.perf_counter()
+        try:
+            return await send_to_dify(user_id, message)
+        finally:
+            recorder.backend_done(user_id, messages, started, time.perf_counter())
+
+    bot.aim_handler.message_callback = timed_handle_message
+    bot.dify_client.send_message = timed_send_to_dify
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def check_budgets(results, budgets):
+    """Return ``(key, limit, actual)`` for every budget exceeded or missing from the results."""
+    flat = flatten(results)
+    return [(key, limit, flat.get(key)) for key, limit in budgets.items()
+            if flat.get(key) is None or flat[key] > limit]
+
+
+async def soak(args):
+    from aimbot.api.dify_client import DifyClient
+    from aimbot.bot.bot import AIMBot
+
+    for name in ("aimbot.bot.bot", "aimbot.bot.aim_handler", "aimbot.api.dify_client", "OSCAR"):
+        logging.getLogger(name).setLevel(args.log_level)
+
+    rng = random.Random(args.seed)
+    recorder = SoakRecorder()
+    rate_class = UNLIMITED_RATE_CLASS if args.no_rate_limits else DEFAULT_RATE_CLASS
+    async with OscarEmulator(latency=args.aim_latency, rate_class=rate_class) as emulator, \
+            MockDify(args.latency, args.error_rate, args.rate_limit_rate, seed=args.seed) as dify:
+        credentials = {"username": BOT_NAME, "password": "secret", "server": "127.0.0.1", "port": emulator.auth_port}
+        bot = AIMBot(credentials, DifyClient("soak-key", dify.url))
+        bot.reply_pacing.enabled = not args.no_reply_pacing
+        instrument_bot(bot, recorder)
+        if not await bot.start():
+            raise RuntimeError("bot failed to sign on to the emulator")
+        bot_task = asyncio.create_task(bot.aim_handler.process_incoming_packets())
+
+        users = [SimulatedUser(n, emulator, recorder, args, random.Random(rng.random())) for n in range(args.users)]
+        for user in users:
+            await user.client.connect()
+        monitor = LoopLagMonitor()
+        monitor.start()
+        rss_start = rss_bytes()
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(user.run(deadline) for user in users))
+        # Let replies still in flight land before measuring
+        await asyncio.sleep(min(args.reply_timeout, 2.0))
+        elapsed = time.perf_counter() - start
+        rss_end = rss_bytes()
+        await monitor.stop()
+
+        for user in users:
+            await user.client.close()
+        await bot.stop()
+        bot_task.cancel()
+        await asyncio.gather(bot_task, return_exceptions=True)
+
+        return {
+            "users": args.users,
+            "duration": elapsed,
+            "messages_sent": recorder.messages_sent,
+            "dify_calls": recorder.dify_calls,
+            "replies": recorder.replies,
+            "replies_per_sec": recorder.replies / elapsed,
+            "messages_per_sec": recorder.messages_sent / elapsed,
+            "error_rate": recorder.error_replies / recorder.replies if recorder.replies else 0.0,
+            "unmatched_replies": recorder.unmatched_replies,
+            **{stage: stats.snapshot() for stage, stats in recorder.stages.items()},
+            "loop_lag": monitor.lag.snapshot(),
+            "memory_start_mb": rss_start / 2 ** 20,
+            "memory_growth_mb": (rss_end - rss_start) / 2 ** 20,
+            "dify": dify.metrics(),
+            "bot": bot.metrics(),
+            "emulator": dict(emulator.stats),
+        }
+
+
+def parse_budgets(items):
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in items:
+        key, separator, value = item.partition('=')
+        if not separator:
+            raise argparse.ArgumentTypeError(f"budget must be key=value: {item!r}")
+        budgets[key.strip()] = float(value)
+    return budgets
+
+
+def print_report(results, failures, budgets):
+    print(f"{results['users']} users for {results['duration']:.1f} s: {results['messages_sent']} messages, "
+          f"{results['dify_calls']} Dify calls, {results['replies']} replies "
+          f"({results['replies_per_sec']:.2f}/s, {results['error_rate']:.1%} errors)")
+    print(f"{'stage':12} {'count':>7} {'mean':>9} {'p50':>9} {'p99':>9} {'max':>9}")
+    for stage in STAGES + ("loop_lag",):
+        s = results[stage]
+        print(f"{stage:12} {s['count']:7} {s['mean']:9.3f} {s['p50']:9.3f} {s['p99']:9.3f} {s['max']:9.3f}")
+    print(f"memory: {results['memory_start_mb']:.1f} MB at start, {results['memory_growth_mb']:+.1f} MB growth")
+    print(f"dify: {results['dify']}")
+    for state, s in results["bot"]["time_to_reply"].items():
+        if s["count"]:
+            print(f"bot time to reply, pacing {state}: mean {s['mean']:.3f}  p50 {s['p50']:.3f}  p99 {s['p99']:.3f}")
+    flat = flatten(results)
+    failed = {key for key, _, _ in failures}
+    for key, limit in budgets.items():
+        print(f"budget {key} <= {limit}: {'FAIL' if key in failed else 'ok'} ({flat.get(key)})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=120.0, help="seconds of traffic after sign-on")
+    parser.add_argument("--think", type=float, default=8.0, help="mean seconds between a user's bursts")
+    parser.add_argument("--typing-cps", type=float, default=6.0, help="users' typing speed, characters per second")
+    parser.add_argument("--reply-timeout", type=float, default=30.0)
+    parser.add_argument("--latency", default="lognormal:0.8,0.6", help="Dify latency distribution (see mock_dify)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--aim-latency", type=float, default=0.0, help="seconds the emulator adds to every frame")
+    parser.add_argument("--no-rate-limits", action="store_true", help="advertise an AIM rate class that never limits")
+    parser.add_argument("--no-reply-pacing", action="store_true", help="turn off the bot's cosmetic reply delays")
+    parser.add_argument("--budget", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--json", help="also write the results here")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--log-level", default="CRITICAL")
+    args = parser.parse_args()
+    budgets = parse_budgets(args.budget)
+
+    results = asyncio.run(soak(args))
+    failures = check_budgets(results, budgets)
+    print_report(results, failures, budgets)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results, "budgets": budgets,
+                       "failures": [key for key, _, _ in failures]}, f, indent=2)
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# aimbot's logger writes LOG_FILE (aimbot.log in the working directory by
+# default) as soon as it is imported; keep test runs out of the repo.
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "aimbot-tests.log"))
@@ -8,6 +8,9 @@ setup(
 		"asyncio==3.4.3",
 		"colorama==0.4.6",
 	],
+	extras_require={
+		"analysis": ["numpy"],
+	},
 	author="Lucas J. Chumley",
 	author_email="Lucas@ukozi.com",
 	description="An AIM client library for python.",
@@ -0,0 +1,96 @@
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from aimpyfly.analysis import analyze, flap_dtype, load_capture_file, snac_dtype
+from aimpyfly.capture import INBOUND, OUTBOUND, CaptureWriter
+from aimpyfly.oscar_protocol import FLAP_HEADER, SNAC_HEADER, OSCARProtocol
+
+oscar = OSCARProtocol()
+RATE_INFO = (struct.pack('!H', 1) + struct.pack('!H8IB', 1, 80, 2500, 2000, 1500, 800, 6000, 6000, 0, 0) +
+             struct.pack('!HHH', 1, 1, 1) + struct.pack('!HH', 0x0004, 0x0006))
+
+
+def snac(family, subtype, body=b'', request_id=0):
+    return bytearray(oscar.create_flap(0x02, 1, oscar.create_snac(family, subtype, 0, request_id, body)))
+
+
+def im(name, text):
+    name = name.encode()
+    return bytes(8) + b'\x00\x01' + bytes([len(name)]) + name + b'\x00\x00\x00\x00' + text.encode()
+
+
+def write_session(path):
+    writer = CaptureWriter(path, max_bytes=600, backups=5)
+    writer.write(INBOUND, bytearray(oscar.create_flap(0x01, 1, b'\x00\x00\x00\x01')), timestamp=0.0)
+    writer.write(INBOUND, snac(0x0001, 0x0007, RATE_INFO), timestamp=0.1)
+    for n in range(12):
+        sender = "Alice" if n % 3 else "bob smith"
+        writer.write(INBOUND, snac(0x0004, 0x0007, im(sender, "x" * (20 + n))), timestamp=1.0 + n)
+    # two bursts of replies, 10 ms apart within a burst
+    for n, t in enumerate((2.0, 2.01, 2.02, 5.0, 5.01)):
+        writer.write(OUTBOUND, snac(0x0004, 0x0006, im("alice", "reply")), timestamp=t)
+    writer.write(INBOUND, snac(0x0001, 0x000A, struct.pack('!H', 2) + RATE_INFO[2:2 + 35]), timestamp=5.02)
+    writer.close()
+    return writer
+
+
+def test_dtypes_follow_the_struct_layouts():
+    assert flap_dtype().itemsize == FLAP_HEADER.size
+    assert snac_dtype().itemsize == SNAC_HEADER.size
+    raw = SNAC_HEADER.pack(4, 7, 0x8000, 0x01020304)
+    assert np.frombuffer(raw, dtype=snac_dtype())[0].tolist() == (4, 7, 0x8000, 0x01020304)
+
+
+def test_reports_over_a_rotated_capture(tmp_path):
+    path = str(tmp_path / "traffic.aimcap")
+    writer = write_session(path)
+    assert writer.rotations > 0
+
+    part = load_capture_file(path)
+    assert (part.flaps['start'] == 0x2A).all()
+
+    report = analyze(path, top=5, burst_gap=0.5)
+    assert report["packets"] == 20 and report["files"] == writer.rotations + 1
+    inbound = {row["snac"]: row["packets"] for row in report["snac_mix"]["inbound"]}
+    assert inbound == {"0x0004/0x0007": 12, "0x0001/0x0007": 1, "0x0001/0x000a": 1}
+    assert report["inter_arrival"]["0x0004/0x0007"]["p50"] == pytest.approx(1.0)
+
+    rate_class = report["rate_classes"][1]
+    assert rate_class["sends"] == 5 and rate_class["bursts"] == 2
+    assert rate_class["burst_size"]["max"] == 3
+    assert rate_class["rate_changes"] == {"warning": 1}
+
+    senders = {row["screen_name"]: row["ims"] for row in report["top_talkers"]["senders"]}
+    assert senders == {"alice": 8, "bobsmith": 4}
+    assert report["top_talkers"]["recipients"][0] == {"screen_name": "alice", "ims": 5, "bytes": 5 * 41}
+    assert report["message_sizes"]["received"]["count"] == 12
+
+
+def test_empty_and_just_rotated_captures(tmp_path):
+    path = str(tmp_path / "empty.aimcap")
+    CaptureWriter(path).close()
+    assert analyze(path)["packets"] == 0
+
+    path = str(tmp_path / "rotated.aimcap")
+    writer = CaptureWriter(path, max_bytes=200)
+    while not writer.rotations:
+        writer.write(INBOUND, snac(0x0004, 0x0007, im("Alice", "hello")), timestamp=1.0 + writer.records)
+    writer.close()
+    assert len(load_capture_file(path).records) == 0
+    report = analyze(path)
+    assert report["files"] == 2 and report["packets"] == writer.records
+
+
+def test_capture_ending_in_a_short_flap(tmp_path):
+    path = str(tmp_path / "keepalive.aimcap")
+    writer = CaptureWriter(path)
+    writer.write(INBOUND, snac(0x0004, 0x0007, im("Alice", "hello")), timestamp=1.0)
+    writer.write(OUTBOUND, bytearray(oscar.create_flap(0x05, 2)), timestamp=2.0)  # 6-byte keep-alive
+    writer.close()
+    part = load_capture_file(path)
+    assert part.is_snac.tolist() == [True, False]
+    assert part.snacs['family'].tolist() == [0x0004, 0]
+    assert analyze(path)["packets"] == 2
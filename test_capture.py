@@ -0,0 +1,61 @@
+import asyncio
+
+from aimpyfly.aim_client import AIMClient
+from aimpyfly.capture import INBOUND, OUTBOUND, RECORD_HEADER, CaptureWriter, capture_files, read_capture, replay
+from aimpyfly.emulator import OscarEmulator
+from aimpyfly.oscar_protocol import OSCARProtocol
+
+oscar = OSCARProtocol()
+
+
+def test_signon_and_im_are_captured_and_replay_through_dispatch(tmp_path):
+    path = str(tmp_path / "session.aimcap")
+
+    async def record():
+        async with OscarEmulator() as emulator:
+            client = AIMClient('127.0.0.1', emulator.auth_port, 'bot', 'secret', capture=path)
+            await client.connect()
+            await (await client.send_message('echo', 'captured'))
+            await asyncio.sleep(0.05)
+            await client.close()
+            client.capture.close()
+
+    async def play():
+        received = []
+
+        async def on_message(sender, text):
+            received.append((sender, text))
+
+        client = AIMClient('127.0.0.1', 0, 'bot', 'secret')
+        client.set_message_callback(on_message)
+        stats = await replay(client, path)
+        await asyncio.sleep(0)
+        return received, stats, client
+
+    asyncio.run(record())
+    records = list(read_capture(path))
+    assert {record.connection for record in records} == {1, 2}  # auth, then BOS
+    signon = next(r for r in records if r.direction == OUTBOUND and r.frame[1] == 0x01 and len(r.frame) > 10)
+    assert b'secret' not in signon.frame
+    assert any(r.direction == INBOUND and r.frame[6:10] == b'\x00\x04\x00\x07' for r in records)
+    with open(path + '.idx', 'rb') as f:
+        index = list(RECORD_HEADER.iter_unpack(f.read()))
+    assert [entry[3] for entry in index] == [len(r.frame) for r in records]
+
+    received, stats, client = asyncio.run(play())
+    assert received == [('echo', 'captured')]
+    assert stats["replayed"] == sum(r.direction == INBOUND for r in records)
+    assert client.rate_limiter.class_for(0x0004, 0x0006) is not None
+
+
+def test_capture_rotates_into_a_bounded_ring(tmp_path):
+    path = str(tmp_path / "ring.aimcap")
+    writer = CaptureWriter(path, max_bytes=1000, backups=2)
+    frame = bytearray(oscar.create_flap(0x02, 1, b'\x00' * 200))
+    for _ in range(30):
+        writer.write(INBOUND, frame)
+    writer.close()
+    files = capture_files(path)
+    assert files == [path + '.2', path + '.1', path]
+    assert writer.rotations > 2
+    assert all(len(list(read_capture(file))) <= 5 for file in files)
@@ -0,0 +1,31 @@
+from aimpyfly.dedup import RecentCookies
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_duplicates_within_window_are_detected():
+    clock = FakeClock()
+    recent = RecentCookies(window=60.0, clock=clock)
+    assert not recent.seen('Some Buddy', b'cookie01')
+    assert recent.seen('somebuddy', b'cookie01')
+    assert not recent.seen('somebuddy', b'cookie02')
+    assert not recent.seen('other', b'cookie01')
+    clock.now += 61.0
+    assert not recent.seen('somebuddy', b'cookie01')
+    assert recent.metrics()["duplicates"] == 1
+    assert len(recent) == 1
+
+
+def test_size_is_capped():
+    recent = RecentCookies(maxsize=3, clock=FakeClock())
+    for n in range(5):
+        recent.seen('buddy', bytes([n]) * 8)
+    assert len(recent) == 3
+    assert not recent.seen('buddy', bytes([0]) * 8)
+    assert recent.seen('buddy', bytes([4]) * 8)
@@ -0,0 +1,94 @@
+import asyncio
+
+from aimpyfly.delivery import DeliveryTracker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_tracker(**kwargs):
+    sent = []
+    clock = FakeClock()
+    request_ids = iter(range(1, 100))
+
+    async def resend(entry):
+        tracker.sent(entry, next(request_ids))
+        sent.append(entry.cookie)
+
+    tracker = DeliveryTracker(resend, retry_delay=0.001, clock=clock, **kwargs)
+
+    def send(cookie):
+        entry = tracker.track(cookie, 'buddy', b'hi')
+        tracker.sent(entry, next(request_ids))
+        return entry
+
+    return tracker, clock, sent, send
+
+
+def test_ack_completes_entry_and_records_latency():
+    async def scenario():
+        tracker, clock, _, send = make_tracker()
+        entry = send(b'cookie01')
+        clock.now += 0.25
+        tracker.ack(b'cookie01')
+        return tracker, await entry.future
+
+    tracker, delivered = asyncio.run(scenario())
+    assert delivered is True
+    metrics = tracker.metrics()
+    assert metrics["in_flight"] == 0 and metrics["delivered"] == 1
+    assert metrics["latency"]["max"] == 0.25
+
+
+def test_rate_errors_are_retried_with_the_same_cookie():
+    async def scenario():
+        tracker, _, sent, send = make_tracker()
+        entry = send(b'cookie01')
+        tracker.error(entry.request_id, 0x0003)
+        await asyncio.sleep(0.01)
+        assert sent == [b'cookie01'] and entry.attempts == 2
+        # Errors are matched by the latest attempt's request id
+        assert tracker.error(1, 0x0003) is None
+        tracker.ack(b'cookie01')
+        return tracker, await entry.future
+
+    tracker, delivered = asyncio.run(scenario())
+    assert delivered is True
+    assert tracker.metrics()["retried"] == 1
+
+
+def test_permanent_errors_and_exhausted_retries_fail():
+    async def scenario():
+        tracker, _, sent, send = make_tracker(max_attempts=2)
+        offline = send(b'cookie01')
+        tracker.error(offline.request_id, 0x0004)  # recipient not logged in
+        limited = send(b'cookie02')
+        tracker.error(limited.request_id, 0x0002)
+        await asyncio.sleep(0.01)
+        tracker.error(limited.request_id, 0x0002)
+        return tracker, sent, await offline.future, await limited.future
+
+    tracker, sent, offline, limited = asyncio.run(scenario())
+    assert (offline, limited) == (False, False)
+    assert sent == [b'cookie02']
+    assert tracker.metrics()["failures"] == {"0x0002": 1, "0x0004": 1}
+
+
+def test_unacknowledged_entries_expire_on_their_own():
+    async def scenario():
+        tracker, _, _, send = make_tracker(ack_timeout=0.05)
+        entry = send(b'cookie01')
+        acked = send(b'cookie02')
+        tracker.ack(b'cookie02')
+        # Nothing else is sent; the deadline alone resolves the entry
+        delivered = await asyncio.wait_for(entry.future, 1)
+        return tracker, delivered, acked
+
+    tracker, delivered, acked = asyncio.run(scenario())
+    assert delivered is False and acked.future.result() is True
+    assert tracker.metrics()["expired"] == 1 and len(tracker) == 0
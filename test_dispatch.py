@@ -0,0 +1,197 @@
+import asyncio
+
+import pytest
+
+from aimpyfly.dispatch import BLOCK, DROP_OLDEST, SHED, EventDispatcher, EventQueue, SnacEvent
+
+
+def snac(n):
+    return SnacEvent(0x0004, 0x0007, 0, n, b'')
+
+
+def test_shed_discards_new_droppable_events():
+    async def scenario():
+        queue = EventQueue(maxsize=2, policy=SHED)
+        assert await queue.put(snac(1), droppable=True)
+        assert await queue.put(snac(2), droppable=True)
+        assert not await queue.put(snac(3), droppable=True)
+        assert [(await queue.get()).request_id for _ in range(2)] == [1, 2]
+        assert queue.metrics()["shed"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_drop_oldest_keeps_control_events():
+    async def scenario():
+        queue = EventQueue(maxsize=2, policy=DROP_OLDEST)
+        await queue.put(snac(1))
+        await queue.put(snac(2), droppable=True)
+        await queue.put(snac(3), droppable=True)
+        assert [(await queue.get()).request_id for _ in range(2)] == [1, 3]
+        assert queue.metrics()["dropped"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_control_events_bypass_the_bound():
+    async def scenario():
+        queue = EventQueue(maxsize=1, policy=BLOCK)
+        await queue.put(snac(1), droppable=True)
+        await asyncio.wait_for(queue.put(snac(2)), 1)
+        assert queue.metrics()["high_water"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_block_waits_for_room():
+    async def scenario():
+        queue = EventQueue(maxsize=1, policy=BLOCK)
+        await queue.put(snac(1), droppable=True)
+        pending = asyncio.create_task(queue.put(snac(2), droppable=True))
+        await asyncio.sleep(0)
+        assert not pending.done()
+        await queue.get()
+        await asyncio.wait_for(pending, 1)
+        assert queue.metrics()["blocked"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        EventQueue(policy="nope")
+
+
+def test_slow_spawned_handler_does_not_stall_dispatch():
+    async def scenario():
+        release = asyncio.Event()
+        handled = []
+
+        async def slow_reply():
+            await release.wait()
+
+        async def handler(event):
+            handled.append(event.request_id)
+            if event.request_id == 1:
+                dispatcher.spawn(slow_reply())
+
+        dispatcher = EventDispatcher(handler, maxsize=8)
+        dispatcher.start()
+        for n in range(1, 4):
+            await dispatcher.put(snac(n), droppable=True)
+        await dispatcher.stop()
+        assert handled == [1, 2, 3]
+        assert dispatcher.metrics()["active_tasks"] == 1
+        release.set()
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+
+
+def test_busy_handler_slots_do_not_stall_control_events():
+    async def scenario():
+        release = asyncio.Event()
+        handled = []
+        finished = []
+
+        async def slow_reply(n):
+            await release.wait()
+            finished.append(n)
+
+        async def handler(event):
+            handled.append(event.request_id)
+            if event.family == 0x0004:
+                dispatcher.spawn(slow_reply(event.request_id))
+
+        dispatcher = EventDispatcher(handler, maxsize=2, policy=SHED, max_tasks=1)
+        dispatcher.start()
+        for n in range(1, 5):
+            await dispatcher.put(snac(n), droppable=True)
+            await asyncio.sleep(0)
+        # A control SNAC behind the busy callbacks is still handled
+        await dispatcher.put(SnacEvent(0x0001, 0x000A, 0, 99, b''))
+        await asyncio.wait_for(dispatcher.stop(), 1)
+        assert handled == [1, 2, 3, 4, 99]
+        metrics = dispatcher.metrics()
+        assert metrics["active_tasks"] == 1 and metrics["backlog"] == 2 and metrics["callbacks_shed"] == 1
+        release.set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert finished == [1, 2, 3]
+
+    asyncio.run(scenario())
+
+
+def test_registry_copies_are_isolated_and_fall_back():
+    from aimpyfly.snac_registry import SnacRegistry
+
+    async def known(client, snac):
+        pass
+
+    async def unknown(client, snac):
+        pass
+
+    base = SnacRegistry()
+    base.register(0x0001, 0x0003, known)
+    base.fallback(unknown)
+    mine = base.copy()
+
+    @mine.handler(0x0013, 0x0006)
+    async def ssi(client, snac):
+        pass
+
+    assert mine.lookup(0x0013, 0x0006) is ssi
+    assert base.lookup(0x0013, 0x0006) is unknown
+    assert mine.get(0x0099, 0x0001) is None
+
+
+def test_client_dispatch_counts_and_times_snacs():
+    from aimpyfly.aim_client import AIMClient
+
+    async def scenario():
+        client = AIMClient("localhost", 5190, "me", "secret")
+        seen = []
+
+        @client.snac_handlers.handler(0x0002, 0x0006)
+        async def user_info(client, snac):
+            seen.append(snac.request_id)
+
+        for n in range(3):
+            await client.dispatch_snac(SnacEvent(0x0002, 0x0006, 0, n, b''))
+        assert seen == [0, 1, 2]
+        assert client.snac_metrics()["0x0002/0x0006"]["count"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_requests_are_matched_by_request_id():
+    from aimpyfly.aim_client import AIMClient, SnacError
+
+    async def scenario():
+        client = AIMClient("localhost", 5190, "me", "secret")
+        sent = []
+
+        async def send_snac(family, subtype, body=b'', flags=0, request_id=None, lane=0, key=None):
+            sent.append(request_id)
+
+        client.send_snac = send_snac
+        lookup = asyncio.create_task(client.request(0x0002, 0x0005, b'buddy'))
+        rates = asyncio.create_task(client.request(0x0001, 0x0006))
+        denied = asyncio.create_task(client.request(0x0013, 0x0008))
+        slow = asyncio.create_task(client.request(0x0002, 0x000B, timeout=0.01))
+        await asyncio.sleep(0)
+        # Replies arrive out of order; an unrelated SNAC reusing an id is ignored
+        await client.dispatch_snac(SnacEvent(0x0001, 0x0007, 0, sent[1], b'rates'))
+        await client.dispatch_snac(SnacEvent(0x0004, 0x0007, 0, sent[0], b''))
+        await client.dispatch_snac(SnacEvent(0x0013, 0x0001, 0, sent[2], b'\x00\x0d'))
+        await client.dispatch_snac(SnacEvent(0x0002, 0x0006, 0, sent[0], b'info'))
+        assert (await rates).data == b'rates'
+        assert (await lookup).data == b'info'
+        with pytest.raises(SnacError) as error:
+            await denied
+        assert error.value.code == 0x000D and error.value.subtype == 0x0008
+        with pytest.raises(asyncio.TimeoutError):
+            await slow
+        assert len(set(sent[:4])) == 4 and client._requests == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,99 @@
+import asyncio
+
+from aimpyfly.aim_client import AIMClient
+from aimpyfly.emulator import OscarEmulator
+from aimpyfly.icbm import TYPING_BEGUN, TypingFrameCache
+
+
+def test_client_signs_on_and_round_trips_through_echo():
+    async def scenario():
+        async with OscarEmulator(latency=0.005, fragment=7) as emulator:
+            client = AIMClient('127.0.0.1', emulator.auth_port, 'bot', 'secret')
+            received = asyncio.Queue()
+
+            async def on_message(sender, text):
+                await received.put((sender, text))
+
+            client.set_message_callback(on_message)
+            await client.connect()
+            delivered = await (await client.send_message('Echo', 'hello &amp; goodbye'))
+            echoed = await asyncio.wait_for(received.get(), 2)
+            await client.close()
+            return client, emulator, delivered, echoed
+
+    client, emulator, delivered, echoed = asyncio.run(scenario())
+    assert delivered is True
+    assert echoed == ('Echo', 'hello & goodbye')
+    assert client.rate_limiter.class_for(0x0004, 0x0006) is not None
+    assert emulator.stats["signons"] == 1 and emulator.stats["acks"] == 1
+
+
+def test_offline_recipient_errors_and_disconnect_notice_ends_session():
+    async def scenario():
+        async with OscarEmulator() as emulator:
+            client = AIMClient('127.0.0.1', emulator.auth_port, 'bot', 'secret')
+            await client.connect()
+            delivered = await (await client.send_message('nobody', 'hi'))
+            emulator.disconnect('bot')
+            await asyncio.wait_for(client.process_incoming_packets(), 2)
+            return client, delivered
+
+    client, delivered = asyncio.run(scenario())
+    assert delivered is False
+    assert client.state == "offline"
+
+
+def test_rate_limit_enforcement_rejects_an_unpaced_burst():
+    async def scenario():
+        async with OscarEmulator(rate_class=(5, 500, 400, 300, 10, 600)) as emulator:
+            client = AIMClient('127.0.0.1', emulator.auth_port, 'bot', 'secret')
+            await client.connect()
+            # Written without family/subtype, so the client's own pacing is bypassed
+            for _ in range(6):
+                await client.send_frame(bytearray(TypingFrameCache.encode('echo', TYPING_BEGUN)))
+            await asyncio.sleep(0.1)
+            await client.close()
+            return emulator
+
+    emulator = asyncio.run(scenario())
+    assert emulator.stats["rate_limited"] > 0
+    assert emulator.stats["typing"] < 6
+
+
+def test_typing_notifications_reach_the_typing_callback():
+    async def scenario():
+        async with OscarEmulator() as emulator:
+            alice = AIMClient('127.0.0.1', emulator.auth_port, 'alice', 'secret')
+            bot = AIMClient('127.0.0.1', emulator.auth_port, 'bot', 'secret')
+            received = asyncio.Queue()
+
+            async def on_typing(sender, state):
+                await received.put((sender, state))
+
+            bot.set_typing_callback(on_typing)
+            await bot.connect()
+            await alice.connect()
+            await alice.send_typing('bot', TYPING_BEGUN)
+            typing = await asyncio.wait_for(received.get(), 2)
+            await alice.close()
+            await bot.close()
+            return typing
+
+    assert asyncio.run(scenario()) == ('alice', TYPING_BEGUN)
+
+
+def test_malformed_snac_ends_the_session_cleanly():
+    async def scenario():
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        async with OscarEmulator() as emulator:
+            client = AIMClient('127.0.0.1', emulator.auth_port, 'bot', 'secret')
+            await client.connect()
+            await client.send_snac(0x0004, 0x0006, b'\x00\x01')  # ICBM body cut short
+            await asyncio.wait_for(client.process_incoming_packets(), 2)
+            sessions = dict(emulator.sessions)
+        return client, sessions, errors
+
+    client, sessions, errors = asyncio.run(scenario())
+    assert client.state == "offline" and sessions == {}
+    assert errors == []
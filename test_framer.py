@@ -0,0 +1,35 @@
+import pytest
+
+from aimpyfly.framer import FlapFramer
+from aimpyfly.oscar_protocol import OSCARProtocol
+
+oscar = OSCARProtocol()
+
+
+def stream(count):
+    return b''.join(oscar.create_flap(2, n, bytes([n]) * (n % 7)) for n in range(count))
+
+
+def test_splits_many_frames_from_one_read_without_copying():
+    chunk = stream(5)
+    frames = FlapFramer().feed(chunk)
+    assert [(channel, seq) for channel, seq, _ in frames] == [(2, n) for n in range(5)]
+    assert all(payload.obj is chunk for _, _, payload in frames)
+    assert bytes(frames[3][2]) == b'\x03\x03\x03'
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 6, 7, 13])
+def test_reassembles_frames_split_across_reads(size):
+    data = stream(20)
+    framer = FlapFramer()
+    frames = []
+    for offset in range(0, len(data), size):
+        frames.extend(framer.feed(data[offset:offset + size]))
+    assert [seq for _, seq, _ in frames] == list(range(20))
+    assert [bytes(p) for _, _, p in frames] == [bytes([n]) * (n % 7) for n in range(20)]
+    assert framer.pending == 0
+
+
+def test_rejects_desynchronised_stream():
+    with pytest.raises(ValueError):
+        FlapFramer().feed(b'\x00\x02\x00\x01\x00\x00')
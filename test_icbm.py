@@ -0,0 +1,113 @@
+import struct
+
+import pytest
+
+from aimpyfly.icbm import (CHARSET_LATIN1, CHARSET_UNICODE, HTML_PREFIX, HTML_SUFFIX, decode_incoming_im,
+                           html_to_text, message_html, split_message)
+from aimpyfly.oscar_protocol import OSCARProtocol
+
+oscar = OSCARProtocol()
+COOKIE = b'\x01\x02\x03\x04\x05\x06\x07\x08'
+
+
+def incoming_im(sender, texts, charset=0, channel=1, extra_tlvs=b''):
+    user_info = bytes([len(sender)]) + sender.encode() + struct.pack('!HH', 5, 1) + oscar.create_tlv(0x0001, b'\x00\x10')
+    fragments = struct.pack('!BBH', 0x05, 0x01, 1) + b'\x01'
+    for text in texts:
+        fragments += struct.pack('!BBHHH', 0x01, 0x01, len(text) + 4, charset, 0) + text
+    return memoryview(COOKIE + struct.pack('!H', channel) + user_info + oscar.create_tlv(0x0002, fragments) + extra_tlvs)
+
+
+def test_lowercase_markup_and_entities_are_decoded():
+    im = decode_incoming_im(incoming_im('Buddy', [b'<html><body><font color="#000">fish &amp; chips&#33;<br>ok &lt;3</font></body></html>']))
+    assert (im.cookie, im.sender, im.warning_level) == (COOKIE, 'Buddy', 5)
+    assert im.text == 'fish & chips!\nok <3'
+    assert im.capabilities == b'\x01'
+
+
+def test_plain_text_without_html_is_delivered():
+    im = decode_incoming_im(incoming_im('buddy', [b'  just text  '], extra_tlvs=oscar.create_tlv(0x0003, b'')))
+    assert im.text == 'just text'
+    assert im.ack_requested and not im.auto_response
+
+
+def test_charsets_and_fragments():
+    im = decode_incoming_im(incoming_im('buddy', ['<b>café</b>'.encode('utf-16-be')], charset=CHARSET_UNICODE))
+    assert im.text == 'café'
+    im = decode_incoming_im(incoming_im('buddy', [b'na\xefve ', b'text'], charset=CHARSET_LATIN1))
+    assert im.text == 'naïve text'
+    assert decode_incoming_im(incoming_im('buddy', ['über'.encode()])).text == 'über'
+
+
+def test_other_channels_are_not_decoded_past_the_sender():
+    im = decode_incoming_im(incoming_im('buddy', [b'hi'], channel=2))
+    assert im.channel == 2 and im.sender == 'buddy' and im.text is None
+
+
+def test_html_to_text_leaves_unknown_entities_and_stray_ampersands():
+    assert html_to_text('A&B &bogus; &nbsp;x') == 'A&B &bogus; \xa0x'
+    assert html_to_text('<HTML><BODY BGCOLOR="#ffffff">Hi<BR/>there</BODY></HTML>') == 'Hi\nthere'
+
+
+def test_html_to_text_keeps_plain_angle_brackets():
+    assert html_to_text('is 3 < 5 and 7 > 4?') == 'is 3 < 5 and 7 > 4?'
+    assert html_to_text('<3 <b>you</b> <!-- x -->') == '<3 you'
+
+
+def test_invalid_numeric_references_become_replacement_characters():
+    text = html_to_text('a&#xD800;b&#0;c&#x110000;d&#128512;')
+    assert text == 'a\ufffdb\ufffdc\ufffdd\U0001f600'
+    text.encode('utf-8')
+
+
+def test_typing_frames_are_cached_per_recipient_and_state():
+    from aimpyfly.icbm import TYPING_BEGUN, TYPING_FINISHED, TypingFrameCache
+
+    cache = TypingFrameCache(maxsize=2)
+    first = cache.frame('buddy', TYPING_BEGUN)
+    second = cache.frame('buddy', TYPING_BEGUN)
+    legacy_body = bytes(8) + struct.pack('!HB', 1, 5) + b'buddy' + struct.pack('!H', 2)
+    assert first == oscar.create_flap(0x02, 0, oscar.create_snac(0x0004, 0x0014, 0, 0, legacy_body))
+    assert first == second and first is not second
+    assert cache.frame('buddy', TYPING_FINISHED)[-2:] == b'\x00\x00'
+    cache.frame('other', TYPING_BEGUN)
+    assert len(cache) == 2 and (cache.hits, cache.misses) == (1, 3)
+
+
+def test_typing_notifications_are_decoded():
+    from aimpyfly.icbm import TYPING_TYPED, TypingFrameCache, decode_typing
+
+    frame = TypingFrameCache.encode('Buddy Name', TYPING_TYPED)
+    typing = decode_typing(memoryview(frame)[16:])
+    assert (typing.sender, typing.state, typing.channel) == ('Buddy Name', TYPING_TYPED, 1)
+    try:
+        decode_typing(frame[16:-1])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("truncated notification decoded")
+
+
+def test_split_message_fits_the_encoded_size():
+    text = "Fish & chips <3. " * 40 + "Ünïcödé — " * 60 + "x" * 300
+    parts = split_message(text, max_bytes=200)
+    assert len(parts) > 1
+    assert all(len(message_html(part, True).encode('utf-8')) <= 200 for part in parts)
+    assert "".join(parts).replace(" ", "") == text.replace(" ", "")
+    # breaks at sentence ends when it can
+    assert parts[0].endswith("<3.")
+
+
+def test_split_message_budget_fits_the_widest_escaped_character():
+    wrapper = len(HTML_PREFIX) + len(HTML_SUFFIX)
+    with pytest.raises(ValueError):
+        split_message("&", max_bytes=wrapper + 4)
+    assert split_message("&&", max_bytes=wrapper + 5) == ["&", "&"]
+    assert split_message("\U0001f600", max_bytes=wrapper + 4, escape=False) == ["\U0001f600"]
+
+
+def test_split_message_short_text_and_escaping():
+    assert split_message("hi there") == ["hi there"]
+    assert split_message("   ") == []
+    assert message_html("a < b & c\nd", escape=True).endswith("a &lt; b &amp; c<br>d</FONT></BODY></HTML>")
+    assert message_html("<b>hi</b>").endswith("<b>hi</b></FONT></BODY></HTML>")
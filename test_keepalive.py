@@ -0,0 +1,84 @@
+import asyncio
+import socket
+
+from aimpyfly.keepalive import PROBE_REQUEST, KeepAlive, apply_socket_options
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeClient:
+    def __init__(self):
+        self.last_received = 0.0
+        self.sent = []
+        self.replies = []
+        self.dropped = None
+
+    async def request(self, family, subtype, timeout):
+        self.sent.append((family, subtype))
+        reply = asyncio.get_running_loop().create_future()
+        self.replies.append(reply)
+        return await reply
+
+    def drop_connection(self, reason):
+        self.dropped = reason
+
+
+def test_probe_reply_records_round_trip():
+    async def scenario():
+        clock, client = FakeClock(), FakeClient()
+        keepalive = KeepAlive(client, interval=30.0, clock=clock)
+        assert await keepalive.tick()
+        await asyncio.sleep(0)
+        clock.now += 0.040
+        client.last_received = clock.now
+        client.replies[-1].set_result(None)
+        for _ in range(3):  # reply -> request task done -> done callback
+            await asyncio.sleep(0)
+        clock.now += 30.0
+        assert await keepalive.tick()
+        await asyncio.sleep(0)
+        await keepalive.stop()
+        return keepalive, client
+
+    keepalive, client = asyncio.run(scenario())
+    assert client.sent == [PROBE_REQUEST, PROBE_REQUEST]
+    assert abs(keepalive.last_rtt - 0.040) < 1e-9
+    assert keepalive.metrics()["missed"] == 0
+
+
+def test_silent_peer_is_declared_dead_after_max_missed():
+    async def scenario():
+        clock, client = FakeClock(), FakeClient()
+        keepalive = KeepAlive(client, interval=10.0, max_missed=3, clock=clock)
+        results = []
+        for _ in range(4):
+            results.append(await keepalive.tick())
+            await asyncio.sleep(0)
+            clock.now += 10.0
+        await keepalive.stop()
+        return keepalive, client, results
+
+    keepalive, client, results = asyncio.run(scenario())
+    assert results == [True, True, True, False]
+    assert client.dropped is not None
+    assert keepalive.metrics()["dead_peers"] == 1
+    assert len(client.sent) == 3
+    assert keepalive.rtt.count == 0
+
+
+def test_socket_options_are_applied():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        apply_socket_options(sock, {"keepidle": 45})
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE) == 45
+    finally:
+        sock.close()
@@ -0,0 +1,113 @@
+import asyncio
+
+from aimbot.bot.mailbox import MailboxPool, Pacing
+from aimpyfly.icbm import TYPING_BEGUN, TYPING_FINISHED
+
+
+class Recorder:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.turns = []
+        self.clears = []
+        self.running = 0
+        self.max_running = 0
+
+    async def turn(self, sender, message):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.turns.append((sender, message))
+        self.running -= 1
+
+    async def clear(self, sender):
+        self.clears.append(sender)
+
+
+def test_input_during_a_turn_is_merged_into_the_next_one():
+    async def scenario():
+        recorder = Recorder()
+        pool = MailboxPool(recorder.turn, recorder.clear, idle_timeout=0.05, pacing=Pacing(debounce=0.02))
+        pool.post("alice", "what is the capital of france")
+        await asyncio.sleep(0.01)
+        for text in ("and of spain", "and of italy", "ok"):
+            pool.post("alice", text)
+        await asyncio.sleep(0.2)
+        return recorder, pool
+
+    recorder, pool = asyncio.run(scenario())
+    assert recorder.turns == [("alice", "what is the capital of france"), ("alice", "and of spain and of italy ok")]
+    assert recorder.max_running == 1
+    assert pool.merged == 2
+    # the worker shut itself down once alice went quiet
+    assert pool.mailboxes == {}
+
+
+def test_short_messages_wait_for_more_input():
+    async def scenario():
+        recorder = Recorder(delay=0)
+        pool = MailboxPool(recorder.turn, recorder.clear, pacing=Pacing(debounce=0.05))
+        for text in ("hey", "u there"):
+            pool.post("bob", text)
+            await asyncio.sleep(0.02)
+        assert recorder.turns == []
+        await asyncio.sleep(0.1)
+        await pool.close()
+        return recorder
+
+    assert asyncio.run(scenario()).turns == [("bob", "hey u there")]
+
+
+def test_global_cap_and_clear_ordering():
+    async def scenario():
+        recorder = Recorder()
+        pool = MailboxPool(recorder.turn, recorder.clear, max_concurrent_turns=2)
+        for n in range(6):
+            pool.post(f"user{n}", "a question long enough")
+        await asyncio.sleep(0.01)
+        pool.post("user0", "never answered")
+        pool.request_clear("user0")
+        await asyncio.sleep(0.3)
+        await pool.close()
+        return recorder, pool
+
+    recorder, pool = asyncio.run(scenario())
+    assert recorder.max_running == 2 and pool.max_active_turns == 2
+    assert len(recorder.turns) == 6
+    assert all(message != "never answered" for _, message in recorder.turns)
+    assert recorder.clears == ["user0"]
+
+
+def test_typing_holds_input_until_the_user_stops():
+    async def scenario():
+        recorder = Recorder(delay=0)
+        pool = MailboxPool(recorder.turn, recorder.clear, pacing=Pacing(typing_timeout=5.0, finish_grace=0.02))
+        pool.post("carol", "so I was thinking about")
+        pool.typing("carol", TYPING_BEGUN)
+        await asyncio.sleep(0.15)
+        held = list(recorder.turns)
+        pool.post("carol", "the trip")
+        pool.typing("carol", TYPING_BEGUN)
+        pool.typing("carol", TYPING_FINISHED)
+        await asyncio.sleep(0.15)
+        await pool.close()
+        return held, recorder, pool
+
+    held, recorder, pool = asyncio.run(scenario())
+    assert held == []
+    assert recorder.turns == [("carol", "so I was thinking about the trip")]
+    assert pool.pacing.paces["carol"].samples == 2
+
+
+def test_pacing_learns_each_users_gaps():
+    pacing = Pacing(debounce=1.5, gap_factor=2.0, max_debounce=4.0, min_samples=2)
+    assert pacing.hold("dave", "hi") == 1.5 and pacing.hold("dave", "a complete question?") == 0.0
+    for gap in (0.4, 0.6, 0.5):
+        pacing.observe("dave", gap)
+    assert 0.8 < pacing.hold("dave", "a complete question?") < 1.2
+    # a user who never follows up is not held, however short the message
+    for _ in range(3):
+        pacing.observe("erin", None)
+    assert pacing.hold("erin", "ok?") == 0.0
+    pacing.observe("slow", 9.0)
+    pacing.observe("slow", 9.0)
+    assert pacing.hold("slow", "hm") == 4.0
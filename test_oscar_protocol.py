@@ -0,0 +1,77 @@
+import struct
+
+from aimpyfly.oscar_protocol import OSCARProtocol, TLVView, patch_seq
+
+oscar = OSCARProtocol()
+
+
+def legacy_im_snac_data(cookie, recipient, html_content):
+    return (
+        cookie + struct.pack('!H', 0x0001) + struct.pack('!B', len(recipient)) + recipient.encode('utf-8') +
+        struct.pack('!H', 0x0002) + struct.pack('!H', len(html_content) + 0x0D) + struct.pack('!B', 0x05) +
+        struct.pack('!H', 0x0100) + struct.pack('!H', 0x0101) + struct.pack('!H', 0x0101) +
+        struct.pack('!H', len(html_content) + 0x04) + struct.pack('!H', 0x0000) + struct.pack('!H', 0x0000) +
+        html_content.encode('utf-8')
+    )
+
+
+def test_im_frame_matches_legacy_encoding():
+    cookie = bytes(range(8))
+    html = '<HTML><BODY>hello there</BODY></HTML>'
+    expected = oscar.create_flap(0x02, 7, oscar.create_snac(0x0004, 0x0006, 0, 7, legacy_im_snac_data(cookie, 'buddy', html)))
+    assert oscar.encode_im_frame(7, 7, cookie, b'buddy', html.encode()) == expected
+
+
+def test_im_frame_counts_encoded_bytes():
+    text = 'héllo ☃'.encode('utf-8')
+    frame = oscar.encode_im_frame(1, 1, b'\x00' * 8, b'bob', text)
+    tlv_type, tlv_length = struct.unpack_from('!HH', frame, 6 + 10 + 8 + 2 + 1 + 3)
+    assert (tlv_type, tlv_length) == (0x0002, len(text) + 13)
+    assert frame.endswith(text)
+
+
+def test_snac_frame_matches_create_helpers():
+    tlvs = [(0x0001, b'abc'), (0x0003, b'')]
+    frame = oscar.encode_snac_frame(0x0001, 0x0002, 0x8000, 99, b'\x00\x01', tlvs, seq_num=5)
+    body = b'\x00\x01' + b''.join(oscar.create_tlv(t, v) for t, v in tlvs)
+    assert frame == oscar.create_flap(0x02, 5, oscar.create_snac(0x0001, 0x0002, 0x8000, 99, body))
+
+
+def test_batch_encoding_numbers_frames_consecutively():
+    buffer, next_seq = oscar.encode_snac_frames([(0x0001, 0x0008, 0, 1, b''), (0x0004, 0x0014, 0, 2, b'xy')], seq_num=0xFFFF)
+    assert next_seq == 1
+    assert buffer == (oscar.encode_snac_frame(0x0001, 0x0008, 0, 1, seq_num=0xFFFF) +
+                      oscar.encode_snac_frame(0x0004, 0x0014, 0, 2, b'xy', seq_num=0))
+
+
+def test_patch_seq_rewrites_only_the_sequence():
+    frame = oscar.encode_snac_frame(0x0004, 0x0014, 0, 3, b'body', seq_num=1)
+    patch_seq(frame, 0x1234)
+    assert frame == oscar.encode_snac_frame(0x0004, 0x0014, 0, 3, b'body', seq_num=0x1234)
+
+
+def test_tlv_view_indexes_without_copying():
+    data = b''.join(oscar.create_tlv(t, v) for t, v in [(0x0001, b'abc'), (0x0004, b'\x00\x10'), (0x0001, b'de')])
+    tlvs = TLVView(data)
+    assert len(tlvs) == 3 and 0x0004 in tlvs and 0x0009 not in tlvs
+    assert tlvs.view(0x0001).obj is data
+    assert tlvs[0x0001] == b'abc'
+    assert tlvs.get_all(0x0001) == [b'abc', b'de']
+    assert tlvs.get_u16(0x0004) == 0x0010
+    assert tlvs.get(0x0009, b'-') == b'-'
+    assert [(t, bytes(v)) for t, v in tlvs] == [(0x0001, b'abc'), (0x0004, b'\x00\x10'), (0x0001, b'de')]
+    assert tlvs.end == len(data) and not tlvs.truncated
+
+
+def test_tlv_view_stops_at_count_and_flags_truncation():
+    data = oscar.create_tlv(0x0001, b'a') + oscar.create_tlv(0x0002, b'b') + b'tail'
+    counted = TLVView(data, count=1)
+    assert counted.types() == [0x0001] and counted.end == 5
+    truncated = TLVView(oscar.create_tlv(0x0001, b'abc')[:-1])
+    assert len(truncated) == 0 and truncated.truncated
+
+
+def test_read_user_info_returns_offset_past_block():
+    block = b'\x05buddy' + struct.pack('!HH', 0, 2) + oscar.create_tlv(0x0001, b'\x00\x10') + oscar.create_tlv(0x0006, b'\x00\x00\x00\x00')
+    screen_name, warning, tlvs, end = oscar.read_user_info(block + b'rest')
+    assert (screen_name, warning, tlvs.types(), end) == ('buddy', 0, [0x0001, 0x0006], len(block))
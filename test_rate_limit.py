@@ -0,0 +1,69 @@
+import struct
+
+from aimpyfly.rate_limit import RATE_CLASS, RateLimiter
+
+
+def rate_info(classes, groups):
+    data = struct.pack('!H', len(classes)) + b''.join(RATE_CLASS.pack(*c) for c in classes)
+    data += struct.pack('!H', len(groups))
+    for class_id, pairs in groups:
+        data += struct.pack('!HH', class_id, len(pairs)) + b''.join(struct.pack('!HH', *p) for p in pairs)
+    return data
+
+
+# id, window, clear, alert, limit, disconnect, current, max, last time, state
+ICBM_CLASS = (2, 20, 3000, 2000, 1500, 800, 3000, 6000, 0, 0)
+INFO = rate_info([(1, 80, 2500, 2000, 1500, 800, 6000, 6000, 0, 0), ICBM_CLASS],
+                 [(1, [(0x0001, 0x0008)]), (2, [(0x0004, 0x0006), (0x0004, 0x0014)])])
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_info_maps_snacs_to_classes():
+    limiter = RateLimiter()
+    limiter.load_rate_info(INFO)
+    assert limiter.class_for(0x0004, 0x0014) is limiter.classes[2]
+    assert limiter.class_for(0x0001, 0x0008) is limiter.classes[1]
+    assert limiter.class_for(0x0002, 0x0005) is None
+    assert limiter.delay(0x0002, 0x0005) == 0.0
+
+
+def test_sends_never_push_level_below_alert():
+    clock = FakeClock()
+    limiter = RateLimiter(headroom=0.0, clock=clock)
+    limiter.load_rate_info(INFO)
+    icbm = limiter.classes[2]
+    for _ in range(200):
+        clock.now += limiter.delay(0x0004, 0x0006)
+        limiter.record(0x0004, 0x0006)
+        assert icbm.current >= icbm.alert - 1e-6
+    # Steady state is one message per `alert` milliseconds.
+    assert abs(limiter.delay(0x0004, 0x0006) - icbm.alert / 1000.0) < 0.05
+
+
+def test_rate_change_updates_live_class():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock)
+    limiter.load_rate_info(INFO)
+    code, rate_class = limiter.apply_change(struct.pack('!H', 0x0002) + RATE_CLASS.pack(2, 20, 3000, 2000, 1500, 800, 1900, 6000, 0, 1))
+    assert code == 0x0002 and rate_class is limiter.classes[2]
+    assert rate_class.current == 1900 and limiter.warnings == 1
+    assert limiter.delay(0x0004, 0x0006) > 0
+
+
+def test_delay_spaces_sends_on_a_small_class():
+    clock = FakeClock()
+    limiter = RateLimiter(headroom=0.0, clock=clock)
+    limiter.load_rate_info(rate_info([(2, 2, 100, 60, 50, 10, 60, 200, 0, 0)], [(2, [(0x0004, 0x0006)])]))
+    wait = limiter.delay(0x0004, 0x0006)
+    assert 0.04 <= wait < 0.5
+    clock.now += wait
+    assert limiter.delay(0x0004, 0x0006) == 0.0
+    limiter.record(0x0004, 0x0006)
+    assert limiter.classes[2].current >= 60 - 1e-6 and limiter.classes[2].sends == 1
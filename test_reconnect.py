@@ -0,0 +1,155 @@
+import asyncio
+
+from aimbot.bot.aim_handler import AIMHandler
+
+
+class FakeClient:
+    """Stands in for AIMClient: each connection lasts until `drop` is set."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.connects = 0
+        self.state = "offline"
+        self.disconnect_reason = None
+        self.sent = []
+        self.drop = asyncio.Event()
+
+    async def connect(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("server unavailable")
+        self.connects += 1
+        self.state = "online"
+        self.drop = asyncio.Event()
+
+    async def process_incoming_packets(self):
+        await self.drop.wait()
+        self.state = "offline"
+        self.disconnect_reason = "disconnect notification"
+
+    async def close(self):
+        self.drop.set()
+
+    async def send_message(self, recipient, message, escape=False):
+        self.sent.append((recipient, message))
+
+
+def make_handler(client, **kwargs):
+    handler = AIMHandler({"username": "bot", "password": "x", "server": "localhost", "port": 5190},
+                         lambda sender, message: None, **kwargs)
+    handler._create_client = lambda: client
+    handler.reconnect_delay = 0.01
+    return handler
+
+
+def test_reconnects_with_same_client_and_flushes_held_messages():
+    async def scenario():
+        client = FakeClient()
+        handler = make_handler(client, outbound_buffer_size=2)
+        assert await handler.connect()
+        supervisor = asyncio.create_task(handler.process_incoming_packets())
+        await asyncio.sleep(0)
+
+        client.failures = 2
+        client.drop.set()
+        await asyncio.sleep(0)
+        for n in range(3):
+            assert await handler.send_message("buddy", f"msg {n}")
+        assert handler.metrics()["outbound_held"] == 2
+
+        while client.connects < 2:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0)
+        await handler.disconnect()
+        await asyncio.wait_for(supervisor, 1)
+        return handler, client
+
+    handler, client = asyncio.run(scenario())
+    assert handler.client is client
+    assert client.sent == [("buddy", "msg 1"), ("buddy", "msg 2")]
+    metrics = handler.metrics()
+    assert metrics["disconnects"] == 1
+    assert metrics["outbound_dropped"] == 1
+    assert metrics["time_to_recover"]["count"] == 1
+
+
+def test_backoff_is_capped_and_jittered():
+    handler = make_handler(FakeClient())
+    handler.reconnect_delay = 1.0
+    handler.max_reconnect_delay = 8.0
+    delays = [handler.backoff_delay(attempt) for attempt in range(10)]
+    assert 0.5 <= delays[0] <= 1.0
+    assert 2.0 <= delays[2] <= 4.0
+    assert all(4.0 <= delay <= 8.0 for delay in delays[4:])
+
+
+class AckClient(FakeClient):
+    """Returns a delivery future per IM; `acks` decides how each one settles."""
+
+    def __init__(self, acks):
+        super().__init__()
+        self.acks = acks
+
+    async def send_message(self, recipient, message, escape=False):
+        self.sent.append((recipient, message))
+        future = asyncio.get_running_loop().create_future()
+        ack = self.acks(self, message)
+        if ack is not None:
+            future.set_result(ack)
+        return future
+
+
+def send_reply(client, parts):
+    from aimbot.bot.bot import AIMBot
+
+    async def scenario():
+        handler = make_handler(client)
+        handler.delivery_timeout = 0.05
+        assert await handler.connect()
+        bot = AIMBot({"username": "bot", "password": "x", "server": "localhost", "port": 5190}, None)
+        bot.aim_handler = handler
+        bot.max_message_bytes = 150
+        started = asyncio.get_running_loop().time()
+        await asyncio.wait_for(bot.send_response("buddy", "Sentence number one. " * 6 * parts), 2)
+        elapsed = asyncio.get_running_loop().time() - started
+        await bot.timers.close()
+        return handler, elapsed
+
+    return asyncio.run(scenario())
+
+
+def test_reply_parts_do_not_wait_forever_for_a_missing_ack():
+    client = AckClient(lambda client, message: None)  # never acknowledged
+    handler, elapsed = send_reply(client, 3)
+    assert len(client.sent) >= 3 and elapsed < 1.0
+    assert handler.metrics()["outbound_held"] == 0
+
+
+def test_parts_lost_to_a_dropped_connection_are_held():
+    def drop_on_second(client, message):
+        if len(client.sent) == 2:
+            client.state = "offline"  # the connection drops before the ack
+            return False
+        return True
+
+    client = AckClient(drop_on_second)
+    handler, _ = send_reply(client, 3)
+    sent = [message for _, message in client.sent]
+    held = [message for _, message in handler.outbound]
+    assert len(sent) == 2 and held[0] == sent[1]
+    assert all(message.startswith(f"[{n}/") for n, message in enumerate(sent[:1] + held, 1))
+
+
+def test_send_failing_on_a_dead_connection_is_held():
+    class DeadSocketClient(FakeClient):
+        async def send_message(self, recipient, message, escape=False):
+            raise ConnectionError("Send queue stopped")
+
+    async def scenario():
+        handler = make_handler(DeadSocketClient())
+        assert await handler.connect()
+        assert await handler.send_message("buddy", "hi")
+        return handler
+
+    handler = asyncio.run(scenario())
+    assert list(handler.outbound) == [("buddy", "hi")]
@@ -0,0 +1,85 @@
+import asyncio
+
+from aimbot.bot.bot import AIMBot
+from aimbot.bot.reply_pacing import ReplyPacing
+from aimpyfly.icbm import message_html
+
+CREDENTIALS = {"username": "bot", "password": "secret", "server": "127.0.0.1", "port": 5190}
+
+
+class FakeDify:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def send_message(self, user, message):
+        await asyncio.sleep(self.latency)
+        return f"re: {message}", {}
+
+    async def close(self):
+        pass
+
+
+class FakeAIM:
+    def __init__(self):
+        self.events = []
+
+    async def send_typing_notification(self, recipient, typing_status=True):
+        self.events.append(("typing", typing_status, asyncio.get_running_loop().time()))
+
+    async def send_message(self, recipient, message, wait_for_delivery=False):
+        self.events.append(("message", message, asyncio.get_running_loop().time()))
+        return True
+
+
+def run_turn(latency, pacing):
+    async def scenario():
+        bot = AIMBot(CREDENTIALS, FakeDify(latency), reply_pacing=pacing)
+        bot.aim_handler = FakeAIM()
+        started = asyncio.get_running_loop().time()
+        await bot._process_message("alice", "hello")
+        await bot.timers.close()
+        return bot, [(kind, value, at - started) for kind, value, at in bot.aim_handler.events]
+    return asyncio.run(scenario())
+
+
+def test_pacing_overlaps_the_backend_call():
+    pacing = ReplyPacing(typing_delay=(0.05, 0.05), min_reply_delay=0.2, seconds_per_char=0.0, max_reply_delay=1.0)
+    # a slow backend is not delayed further
+    bot, events = run_turn(0.3, pacing)
+    assert events[0][:2] == ("typing", True) and events[0][2] < 0.1
+    assert events[-1][:2] == ("message", "re: hello") and 0.3 <= events[-1][2] < 0.4
+    assert bot.pacing_holds.count == 0
+    # a fast one is held until the policy's reply time
+    bot, events = run_turn(0.01, pacing)
+    assert 0.2 <= events[-1][2] < 0.3
+    assert bot.pacing_holds.count == 1
+    assert bot.metrics()["time_to_reply"]["on"]["count"] == 1
+
+
+def test_disabled_pacing_replies_as_soon_as_ready():
+    bot, events = run_turn(0.05, ReplyPacing(enabled=False))
+    assert events[-1][2] < 0.1
+    metrics = bot.metrics()["time_to_reply"]
+    assert metrics["off"]["count"] == 1 and metrics["on"]["count"] == 0
+
+
+def test_reply_delay_scales_with_length_up_to_the_cap():
+    pacing = ReplyPacing(min_reply_delay=1.0, seconds_per_char=0.02, max_reply_delay=3.0)
+    assert pacing.reply_after("ok") == 1.0
+    assert pacing.reply_after("x" * 100) == 2.0
+    assert pacing.reply_after("x" * 1000) == 3.0
+    assert ReplyPacing(enabled=False).reply_after("x" * 1000) == 0.0
+
+
+def test_long_reply_is_sent_in_numbered_parts():
+    async def scenario():
+        bot = AIMBot(CREDENTIALS, FakeDify(0), reply_pacing=ReplyPacing(enabled=False))
+        bot.aim_handler = FakeAIM()
+        bot.max_message_bytes = 150
+        await bot.send_response("alice", "Sentence number one. " * 20)
+        await bot.timers.close()
+        return [value for kind, value, _ in bot.aim_handler.events if kind == "message"]
+    parts = asyncio.run(scenario())
+    assert len(parts) > 1
+    assert all(part.startswith(f"[{n}/{len(parts)}] ") for n, part in enumerate(parts, 1))
+    assert all(len(message_html(part, True).encode("utf-8")) <= 150 for part in parts)
@@ -0,0 +1,125 @@
+import asyncio
+import itertools
+
+import pytest
+
+from aimpyfly.oscar_protocol import OSCARProtocol
+from aimpyfly.send_queue import CONTROL, IM, TYPING, SendQueue
+
+oscar = OSCARProtocol()
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.calls = []
+
+    def writelines(self, frames):
+        self.calls.append([bytes(frame) for frame in frames])
+
+    async def drain(self):
+        pass
+
+
+def frame(subtype, body=b''):
+    return oscar.encode_snac_frame(0x0004, subtype, 0, 0, body)
+
+
+def subtypes(call):
+    return [int.from_bytes(f[8:10], 'big') for f in call]
+
+
+def test_ready_frames_are_coalesced_by_priority():
+    async def scenario():
+        writer = RecordingWriter()
+        counter = itertools.count(1)
+        queue = SendQueue(writer, lambda: next(counter))
+        queue.enqueue(frame(0x0014), TYPING)
+        queue.enqueue(frame(0x0006), IM)
+        queue.enqueue(frame(0x0008), CONTROL)
+        queue.start()
+        await asyncio.sleep(0)
+        await queue.stop()
+        assert len(writer.calls) == 1
+        assert subtypes(writer.calls[0]) == [0x0008, 0x0006, 0x0014]
+        assert [int.from_bytes(f[2:4], 'big') for f in writer.calls[0]] == [1, 2, 3]
+
+    asyncio.run(scenario())
+
+
+def test_keyed_frame_supersedes_pending_one():
+    async def scenario():
+        writer = RecordingWriter()
+        queue = SendQueue(writer, lambda: 1)
+        first = queue.enqueue(frame(0x0014, b'on'), TYPING, key='buddy')
+        second = queue.enqueue(frame(0x0014, b'off'), TYPING, key='buddy')
+        queue.start()
+        assert await second and first is second
+        await queue.stop()
+        assert [f[16:] for f in writer.calls[0]] == [b'off']
+        assert queue.metrics()["superseded"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_stale_typing_is_dropped():
+    async def scenario():
+        now = [0.0]
+        writer = RecordingWriter()
+        queue = SendQueue(writer, lambda: 1, clock=lambda: now[0])
+        typing = queue.enqueue(frame(0x0014), TYPING)
+        now[0] = 10.0
+        queue.start()
+        assert await typing is False
+        await queue.stop()
+        assert writer.calls == [] and queue.metrics()["stale"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_rate_limited_lane_does_not_hold_control_traffic():
+    class Limiter:
+        def delay(self, family, subtype):
+            return 60.0 if subtype == 0x0006 else 0.0
+
+        def record(self, family, subtype):
+            pass
+
+    async def scenario():
+        writer = RecordingWriter()
+        queue = SendQueue(writer, lambda: 1, rate_limiter=Limiter())
+        im = queue.enqueue(frame(0x0006), IM, 0x0004, 0x0006)
+        ack = queue.enqueue(frame(0x0008), CONTROL, 0x0001, 0x0008)
+        queue.start()
+        assert await asyncio.wait_for(ack, 1)
+        assert not im.done()
+        await queue.stop()
+        assert subtypes(writer.calls[0]) == [0x0008]
+
+    asyncio.run(scenario())
+
+
+def test_client_refuses_to_write_past_a_failed_queue():
+    from aimpyfly.aim_client import AIMClient
+
+    class BrokenWriter(RecordingWriter):
+        def writelines(self, frames):
+            raise ConnectionResetError("peer reset")
+
+        def write(self, data):
+            raise AssertionError("wrote to the socket directly")
+
+    async def scenario():
+        client = AIMClient("localhost", 5190, "me", "secret")
+        client.writer = BrokenWriter()
+        await client.start_send_queue()
+        with pytest.raises(ConnectionError):
+            await client.send_frame(frame(0x0006), IM)
+        assert not client.send_queue.running
+        with pytest.raises(ConnectionError, match="peer reset"):
+            await client.send_frame(frame(0x0006), IM)
+        # The IM is not left in flight; callers get the error and can hold it
+        with pytest.raises(ConnectionError):
+            await client.send_message("buddy", "hi")
+        assert len(client.delivery) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,97 @@
+import asyncio
+import struct
+import time
+
+import pytest
+
+from aimpyfly.aim_client import AIMClient, SignOnError
+from aimpyfly.framer import FlapFramer
+from aimpyfly.oscar_protocol import OSCARProtocol
+
+oscar = OSCARProtocol()
+HELLO = oscar.create_flap(0x01, 0, b'\x00\x00\x00\x01')
+RATE_INFO = struct.pack('!H', 1) + struct.pack('!H8IB', 1, 80, 2500, 2000, 1500, 800, 6000, 6000, 0, 0) + \
+    struct.pack('!HHH', 1, 1, 1) + struct.pack('!HH', 0x0004, 0x0006)
+
+
+async def read_frames(reader, framer, count):
+    frames = []
+    while len(frames) < count:
+        chunk = await reader.read(4096)
+        if not chunk:
+            break
+        frames += [(channel, bytes(data)) for channel, _, data in framer.feed(chunk)]
+    return frames
+
+
+async def start_servers(answer_server_ready=True):
+    received = []
+
+    async def bos(reader, writer):
+        framer = FlapFramer()
+        writer.write(HELLO)
+        received.extend(await read_frames(reader, framer, 1))  # sign-on cookie
+        if answer_server_ready:
+            writer.write(oscar.create_flap(0x02, 1, oscar.create_snac(0x0001, 0x0003, 0, 0, b'\x00\x01')))
+        while True:
+            frames = await read_frames(reader, framer, 1)
+            if not frames:
+                break
+            received.extend(frames)
+            if frames[0][1][:4] == b'\x00\x01\x00\x06':
+                request_id, = struct.unpack_from('!I', frames[0][1], 6)
+                writer.write(oscar.create_flap(0x02, 2, oscar.create_snac(0x0001, 0x0007, 0, request_id, RATE_INFO)))
+        writer.close()
+
+    bos_server = await asyncio.start_server(bos, '127.0.0.1', 0)
+    bos_port = bos_server.sockets[0].getsockname()[1]
+
+    async def auth(reader, writer):
+        writer.write(HELLO)
+        await read_frames(reader, FlapFramer(), 1)
+        reply = oscar.create_tlv(0x0005, f'127.0.0.1:{bos_port}'.encode()) + oscar.create_tlv(0x0006, b'cookie')
+        writer.write(oscar.create_flap(0x04, 1, reply))
+        writer.close()
+
+    auth_server = await asyncio.start_server(auth, '127.0.0.1', 0)
+    return auth_server, bos_server, received
+
+
+def test_signon_waits_for_responses_not_timers():
+    async def scenario():
+        auth_server, bos_server, received = await start_servers()
+        client = AIMClient('127.0.0.1', auth_server.sockets[0].getsockname()[1], 'bot', 'secret')
+        start = time.perf_counter()
+        await client.connect()
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(0.05)
+        await client.close()
+        auth_server.close()
+        bos_server.close()
+        return client, received, elapsed
+
+    client, received, elapsed = asyncio.run(scenario())
+    assert elapsed < 1.0
+    assert client.state == "offline"
+    assert list(client.signon_timings) == ["auth_connect", "auth_hello", "auth_reply", "bos_connect",
+                                           "bos_hello", "server_ready", "rate_info", "total"]
+    assert client.rate_limiter.class_for(0x0004, 0x0006) is not None
+    snacs = [data[:4] for channel, data in received if channel == 0x02]
+    # rate request, rate ack, client ready
+    assert snacs == [b'\x00\x01\x00\x06', b'\x00\x01\x00\x08', b'\x00\x01\x00\x02']
+
+
+def test_signon_step_timeout_names_the_phase():
+    async def scenario():
+        auth_server, bos_server, _ = await start_servers(answer_server_ready=False)
+        client = AIMClient('127.0.0.1', auth_server.sockets[0].getsockname()[1], 'bot', 'secret',
+                           signon_timeouts={"server_ready": 0.1})
+        with pytest.raises(SignOnError) as raised:
+            await client.connect()
+        auth_server.close()
+        bos_server.close()
+        return client, raised.value
+
+    client, error = asyncio.run(scenario())
+    assert error.phase == "server_ready"
+    assert client.state == "offline" and client.writer is None
@@ -0,0 +1,51 @@
+import asyncio
+import random
+
+import aiohttp
+import pytest
+
+from benchmarks.mock_dify import MockDify, parse_latency
+from benchmarks.soak_bot import SoakRecorder, check_budgets
+
+
+def test_latency_specs():
+    rng = random.Random(1)
+    assert parse_latency("fixed:0.25")(rng) == 0.25
+    assert all(0.1 <= parse_latency("uniform:0.1,0.2")(rng) <= 0.2 for _ in range(100))
+    assert parse_latency("lognormal:0.5,0.0")(rng) == pytest.approx(0.5)
+    with pytest.raises(ValueError):
+        parse_latency("normal:1")
+
+
+def test_mock_dify_answers_and_fails_on_request():
+    async def scenario():
+        statuses = []
+        for rate_limit_rate, error_rate in ((0.0, 0.0), (1.0, 0.0), (0.0, 1.0)):
+            async with MockDify("fixed:0", error_rate, rate_limit_rate) as dify, aiohttp.ClientSession() as session:
+                async with session.post(f"{dify.url}/chat-messages", json={"query": "hi", "user": "u"}) as response:
+                    statuses.append((response.status, await response.json()))
+        return statuses
+
+    (ok, ok_body), (limited, limited_body), (failed, _) = asyncio.run(scenario())
+    assert ok == 200 and ok_body["answer"] and ok_body["conversation_id"]
+    assert limited == 429 and limited_body["code"] == "too_many_requests"
+    assert failed == 500
+
+
+def test_recorder_matches_combined_queries_and_replies():
+    recorder = SoakRecorder()
+    for text in ("hey", "what year did aim shut down", "thanks"):
+        recorder.sent("u1", text)
+        recorder.arrived("u1", text)
+    first = recorder.take("u1", "what year did aim shut down")
+    recorder.backend_done("u1", first, 1.0, 2.0)
+    rest = recorder.take("u1", "hey thanks")
+    assert [m.text for m in first] == ["what year did aim shut down"]
+    assert [m.text for m in rest] == ["hey", "thanks"]
+    assert recorder.pending["u1"] == []
+    recorder.reply("u1", "Error: 429")
+    recorder.reply("u1", "unexpected")
+    assert recorder.error_replies == 1 and recorder.unmatched_replies == 1
+    assert check_budgets({"error_rate": 0.5, "end_to_end": {"p99": 1.0}},
+                         {"error_rate": 0.1, "end_to_end.p99": 2.0, "missing": 1.0}) == [
+        ("error_rate", 0.1, 0.5), ("missing", 1.0, None)]
@@ -0,0 +1,49 @@
+import asyncio
+
+from aimbot.bot.timers import TimerWheel
+
+
+def test_wheel_fires_on_time_and_reschedules_in_place():
+    async def scenario():
+        now = [100.0]
+        wheel = TimerWheel(tick=0.1, slots=8, clock=lambda: now[0])
+        fired = []
+        wheel.schedule("a", 0.25, lambda: fired.append(("a", now[0])))
+        wheel.schedule("b", 2.0, lambda: fired.append(("b", now[0])))  # wraps the 0.8 s wheel
+        wheel.schedule("c", 0.5, lambda: fired.append(("c", now[0])))
+        wheel.schedule("a", 0.45, lambda: fired.append(("a", now[0])))  # moved, not duplicated
+        assert wheel.cancel("c") and not wheel.cancel("c")
+        for step in range(30):
+            now[0] = 100.0 + step * 0.1
+            wheel.advance(now[0])
+        await wheel.close()
+        return fired, wheel
+
+    fired, wheel = asyncio.run(scenario())
+    assert [key for key, _ in fired] == ["a", "b"]
+    assert 100.45 <= fired[0][1] < 100.6
+    assert 102.0 <= fired[1][1] < 102.15
+    assert len(wheel) == 0 and wheel.fired == 2
+
+
+def test_repeating_timers_and_coroutine_callbacks_run_on_the_driver():
+    async def scenario():
+        wheel = TimerWheel(tick=0.01)
+        sent = []
+
+        async def refresh():
+            sent.append(asyncio.get_running_loop().time())
+
+        wheel.schedule(("typing", "alice"), 0.03, refresh, interval=0.03)
+        await asyncio.sleep(0.2)
+        wheel.cancel(("typing", "alice"))
+        # a refresh that fired just before the cancel may still be running
+        await asyncio.sleep(0.02)
+        count = len(sent)
+        await asyncio.sleep(0.1)
+        assert len(sent) == count
+        await wheel.close()
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert 3 <= len(sent) <= 7